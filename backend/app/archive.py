@@ -0,0 +1,94 @@
+from datetime import datetime
+from urllib.parse import quote
+import base64
+import gzip
+import json
+import os
+
+from .config import settings
+
+def month_key(created_at: datetime):
+    return f'{created_at:%Y-%m}' if created_at else '0001-01'
+
+def encode_row(row):
+    values = row._asdict()
+    values['created_at'] = row.created_at.isoformat() if row.created_at else None
+    if values.get('keystrokes') is not None:
+        values['keystrokes'] = base64.b64encode(values['keystrokes']).decode()
+    return json.dumps(values, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+def decode_row(line: str):
+    values = json.loads(line)
+    if values['created_at']:
+        values['created_at'] = datetime.fromisoformat(values['created_at'])
+    return values
+
+# Позиция строки в истории; строки без даты — самые старые
+def position(row):
+    return row['created_at'] or datetime.min, row['id']
+
+# Архив строк test_results, вытесненных компакцией: файл на пользователя и
+# месяц, {каталог}/@{username}/{ГГГГ-ММ}.ndjson.gz. Каждый проход
+# компакции дописывает в файл отдельный gzip-член и делает fsync до commit,
+# поэтому после сбоя строка может оказаться в архиве дважды — при чтении
+# повторы отбрасываются по id.
+class ResultArchive:
+    def __init__(self, directory: str):
+        self.directory = os.path.abspath(directory)
+
+    def user_directory(self, username: str):
+        return os.path.join(self.directory, '@' + quote(username, safe=''))
+
+    def write(self, rows):
+        groups = {}
+        for row in rows:
+            groups.setdefault((row.username, month_key(row.created_at)), []).append(row)
+        for (username, month), group in groups.items():
+            directory = self.user_directory(username)
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, f'{month}.ndjson.gz'), 'ab') as file:
+                file.write(gzip.compress(''.join(encode_row(row) for row in group).encode()))
+                file.flush()
+                os.fsync(file.fileno())
+        return len(groups)
+
+    # Месяцы пользователя от новых к старым
+    def months(self, username: str):
+        directory = self.user_directory(username)
+        if not os.path.isdir(directory):
+            return []
+        return sorted((name[:7] for name in os.listdir(directory) if name.endswith('.ndjson.gz')), reverse=True)
+
+    # Строки месяца от старых к новым
+    def read(self, username: str, month: str):
+        rows = {}
+        with gzip.open(os.path.join(self.user_directory(username), f'{month}.ndjson.gz'), 'rt', encoding='utf-8') as file:
+            for line in file:
+                row = decode_row(line)
+                rows[row['id']] = row
+        return sorted(rows.values(), key=position)
+
+    # Страница истории от новых к старым, как crud.user_results_page_query
+    def page(self, username: str, limit: int, after: tuple = None, time_mode: int = None,
+             since: datetime = None, until: datetime = None):
+        rows = []
+        for month in self.months(username):
+            if len(rows) >= limit or (since is not None and month < month_key(since)):
+                break
+            if (after is not None and month > month_key(after[0])) or (until is not None and month > month_key(until)):
+                continue
+            for row in reversed(self.read(username, month)):
+                if after is not None and position(row) >= (after[0] or datetime.min, after[1]):
+                    continue
+                if time_mode is not None and row['time_mode'] != time_mode:
+                    continue
+                if since is not None and (row['created_at'] is None or row['created_at'] < since):
+                    continue
+                if until is not None and (row['created_at'] is None or row['created_at'] >= until):
+                    continue
+                rows.append(row)
+                if len(rows) >= limit:
+                    break
+        return rows
+
+result_archive = ResultArchive(settings.RESULTS_ARCHIVE_DIR) if settings.RESULTS_ARCHIVE_DIR else None
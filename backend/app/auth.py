@@ -1,13 +1,26 @@
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
-from fastapi import HTTPException, status, Depends
+from fastapi import HTTPException, status, Depends, Header
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+import hashlib
+import secrets
+import time
 
 from .config import settings
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__time_cost=settings.ARGON2_TIME_COST,
+    argon2__memory_cost=settings.ARGON2_MEMORY_COST,
+    argon2__parallelism=settings.ARGON2_PARALLELISM
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login", auto_error=False)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -15,6 +28,14 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def verify_and_rehash(plain_password, hashed_password):
+    # Хэш со старыми параметрами argon2 пересчитывается, пока пароль под рукой
+    if not pwd_context.verify(plain_password, hashed_password):
+        return False, None
+    if pwd_context.needs_update(hashed_password):
+        return True, pwd_context.hash(plain_password)
+    return True, None
+
 def create_access_token(username: str):
     return jwt.encode(
         {'sub': username, 'exp': datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)},
@@ -22,7 +43,50 @@ def create_access_token(username: str):
         algorithm=settings.ALGORITHM
     )
 
-def get_current_username(token: str = Depends(oauth2_scheme)):
+# LRU уже проверенных токенов: ключ — sha256 токена, значение — (username, exp).
+# Запись живет не дольше самого токена, так что повторные запросы
+# пропускают проверку подписи, но просроченный токен не пройдет.
+class TokenCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def key(token: str):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str):
+        key = self.key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, token: str, username: str, expires_at: float):
+        if self.max_size <= 0:
+            return
+        key = self.key(token)
+        with self._lock:
+            self._entries[key] = (username, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE)
+
+async def get_current_username(token: str = Depends(oauth2_scheme)):
+    username = token_cache.get(token)
+    if username is not None:
+        return username
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail='Could not validate credentials',
@@ -33,6 +97,24 @@ def get_current_username(token: str = Depends(oauth2_scheme)):
         username = payload.get('sub')
         if username is None:
             raise credentials_exception
+        token_cache.put(token, username, payload.get('exp', 0))
         return username
     except JWTError:
         raise credentials_exception
+
+# Для открытых эндпоинтов, которые подстраиваются под вошедшего пользователя:
+# без токена или с просроченным токеном запрос считается анонимным
+async def get_optional_username(token: Optional[str] = Depends(optional_oauth2_scheme)):
+    if token is None:
+        return None
+    try:
+        return await get_current_username(token)
+    except HTTPException:
+        return None
+
+def is_admin_token(token: Optional[str]):
+    return bool(settings.ADMIN_TOKEN and token and secrets.compare_digest(token, settings.ADMIN_TOKEN))
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Admin token required')
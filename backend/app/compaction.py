@@ -0,0 +1,360 @@
+from array import array
+from datetime import date, datetime, timedelta
+import argparse
+import asyncio
+import logging
+
+from sqlalchemy import bindparam, case, delete, func, or_, select, tuple_, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .archive import result_archive
+from .config import settings
+from .database import AsyncSessionLocal
+from .response_cache import response_cache
+from .rollups import dialect_insert
+
+logger = logging.getLogger(__name__)
+
+# Гистограмма WPM: корзины по 10, последняя — 250 и выше
+HISTOGRAM_WIDTH = 10
+HISTOGRAM_BUCKETS = 26
+
+def month_of(created_at: datetime):
+    # Строки без даты (из очень старых баз) считаются самыми старыми
+    return date(created_at.year, created_at.month, 1) if created_at else date(1, 1, 1)
+
+# Граница горячего окна — начало месяца, в который попадает now - hot_days:
+# сжимаются только целые месяцы
+def cutoff_for(now: datetime, hot_days: int):
+    moment = now - timedelta(days=hot_days)
+    return datetime(moment.year, moment.month, 1)
+
+def histogram_bucket(wpm: float):
+    return min(HISTOGRAM_BUCKETS - 1, max(0, int(wpm // HISTOGRAM_WIDTH)))
+
+def load_histogram(data: bytes):
+    histogram = array('I', data or b'')
+    return histogram if len(histogram) == HISTOGRAM_BUCKETS else array('I', [0] * HISTOGRAM_BUCKETS)
+
+def merge_rows(totals, rows):
+    for row in rows:
+        key = (row.username, month_of(row.created_at), row.time_mode)
+        total = totals.get(key)
+        if total is None:
+            total = totals[key] = [0, 0, 0.0, 0.0, 0.0, 0.0, 0.0, array('I', [0] * HISTOGRAM_BUCKETS)]
+        total[0] += 1
+        total[1] += row.test_duration or 0
+        total[2] += row.wpm
+        total[3] += row.accuracy
+        total[4] += row.consistency or 0.0
+        total[5] = max(total[5], row.wpm)
+        total[6] = max(total[6], row.accuracy)
+        total[7][histogram_bucket(row.wpm)] += 1
+
+# Дописывает пачку строк в сводки одним INSERT ... ON CONFLICT, как
+# rollups.record_results. Суммы и максимумы считает база; гистограмму
+# (массив в BLOB) приходится складывать здесь. Поэтому строки сводок
+# сначала создаются пустыми и их гистограммы читаются под блокировкой
+# (как в stats.record_results): параллельная компакция тех же месяцев ждет
+# commit и не теряет счетчики
+async def record_summaries(db: AsyncSession, rows):
+    totals = {}
+    merge_rows(totals, rows)
+    table = models.ResultSummary.__table__
+    await db.execute(dialect_insert(db)(table).on_conflict_do_nothing(), [
+        {
+            'username': username, 'month': month, 'time_mode': time_mode, 'tests': 0, 'total_seconds': 0,
+            'sum_wpm': 0.0, 'sum_accuracy': 0.0, 'sum_consistency': 0.0, 'best_wpm': 0.0, 'best_accuracy': 0.0,
+            'wpm_histogram': b''
+        }
+        for username, month, time_mode in totals
+    ])
+    existing = await db.execute(
+        select(table.c.username, table.c.month, table.c.time_mode, table.c.wpm_histogram)
+        .where(tuple_(table.c.username, table.c.month, table.c.time_mode).in_(list(totals)))
+        .with_for_update()
+    )
+    for username, month, time_mode, data in existing:
+        total = totals.get((username, month, time_mode))
+        if total is not None:
+            for bucket, count in enumerate(load_histogram(data)):
+                total[7][bucket] += count
+    statement = dialect_insert(db)(table)
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.username, table.c.month, table.c.time_mode],
+        set_={
+            'tests': table.c.tests + statement.excluded.tests,
+            'total_seconds': table.c.total_seconds + statement.excluded.total_seconds,
+            'sum_wpm': table.c.sum_wpm + statement.excluded.sum_wpm,
+            'sum_accuracy': table.c.sum_accuracy + statement.excluded.sum_accuracy,
+            'sum_consistency': table.c.sum_consistency + statement.excluded.sum_consistency,
+            'best_wpm': case((table.c.best_wpm < statement.excluded.best_wpm, statement.excluded.best_wpm), else_=table.c.best_wpm),
+            'best_accuracy': case((table.c.best_accuracy < statement.excluded.best_accuracy, statement.excluded.best_accuracy), else_=table.c.best_accuracy),
+            'wpm_histogram': statement.excluded.wpm_histogram,
+        }
+    ), [
+        {
+            'username': username,
+            'month': month,
+            'time_mode': time_mode,
+            'tests': tests,
+            'total_seconds': total_seconds,
+            'sum_wpm': sum_wpm,
+            'sum_accuracy': sum_accuracy,
+            'sum_consistency': sum_consistency,
+            'best_wpm': best_wpm,
+            'best_accuracy': best_accuracy,
+            'wpm_histogram': histogram.tobytes(),
+        }
+        for (username, month, time_mode), (tests, total_seconds, sum_wpm, sum_accuracy, sum_consistency, best_wpm, best_accuracy, histogram) in totals.items()
+    ])
+
+def merge_hot(totals, rows):
+    for row in rows:
+        # Результаты без даты в помесячный ряд не попадали и не попадают
+        if row.created_at is None:
+            continue
+        key = (row.username, month_of(row.created_at), histogram_bucket(row.wpm))
+        total = totals.get(key)
+        if total is None:
+            totals[key] = [1, row.wpm, row.accuracy, row.wpm]
+        else:
+            total[0] += 1
+            total[1] += row.wpm
+            total[2] += row.accuracy
+            total[3] = max(total[3], row.wpm)
+
+def hot_mappings(totals):
+    return [
+        {
+            'username': username, 'month': month, 'wpm_bucket': wpm_bucket,
+            'tests': tests, 'sum_wpm': sum_wpm, 'sum_accuracy': sum_accuracy, 'best_wpm': best_wpm
+        }
+        for (username, month, wpm_bucket), (tests, sum_wpm, sum_accuracy, best_wpm) in totals.items()
+    ]
+
+# Горячие помесячные счетчики для новых результатов, в транзакции
+# crud.add_test_results. Гистограмма разложена по строкам (корзина — часть
+# ключа), поэтому хватает одного INSERT ... ON CONFLICT без чтения под
+# блокировкой
+async def record_results(db: AsyncSession, results_by_user):
+    totals = {}
+    for results in results_by_user.values():
+        merge_hot(totals, results)
+    if not totals:
+        return
+    table = models.UserMonthStats.__table__
+    statement = dialect_insert(db)(table)
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.username, table.c.month, table.c.wpm_bucket],
+        set_={
+            'tests': table.c.tests + statement.excluded.tests,
+            'sum_wpm': table.c.sum_wpm + statement.excluded.sum_wpm,
+            'sum_accuracy': table.c.sum_accuracy + statement.excluded.sum_accuracy,
+            'best_wpm': case((table.c.best_wpm < statement.excluded.best_wpm, statement.excluded.best_wpm), else_=table.c.best_wpm),
+        }
+    ), hot_mappings(totals))
+
+# Вычитает сжатые строки из горячих счетчиков, в транзакции пачки
+# компакции. best_wpm не уменьшается: лучший результат месяца в любом
+# случае есть и в сводке, а get_months берет максимум из обеих частей
+async def release_results(db: AsyncSession, rows):
+    totals = {}
+    merge_hot(totals, rows)
+    if not totals:
+        return
+    table = models.UserMonthStats.__table__
+    await db.execute(
+        update(table)
+        .where(
+            table.c.username == bindparam('key_username'),
+            table.c.month == bindparam('key_month'),
+            table.c.wpm_bucket == bindparam('key_bucket')
+        )
+        .values(
+            tests=table.c.tests - bindparam('released_tests'),
+            sum_wpm=table.c.sum_wpm - bindparam('released_wpm'),
+            sum_accuracy=table.c.sum_accuracy - bindparam('released_accuracy')
+        ),
+        [
+            {
+                'key_username': username, 'key_month': month, 'key_bucket': wpm_bucket,
+                'released_tests': tests, 'released_wpm': sum_wpm, 'released_accuracy': sum_accuracy
+            }
+            for (username, month, wpm_bucket), (tests, sum_wpm, sum_accuracy, _) in totals.items()
+        ]
+    )
+    await db.execute(delete(table).where(
+        table.c.username.in_({username for username, _, _ in totals}),
+        table.c.tests <= 0
+    ))
+
+# Разовый подсчет горячих счетчиков по накопленным результатам (для миграции)
+def backfill(connection: Connection):
+    table = models.TestResult.__table__
+    results = connection.execute(
+        select(table.c.username, table.c.wpm, table.c.accuracy, table.c.created_at)
+        .order_by(table.c.username)
+        .execution_options(yield_per=10000)
+    )
+    username, totals = None, {}
+    for result in results:
+        if result.username != username:
+            if totals:
+                connection.execute(models.UserMonthStats.__table__.insert(), hot_mappings(totals))
+            username, totals = result.username, {}
+        merge_hot(totals, [result])
+    if totals:
+        connection.execute(models.UserMonthStats.__table__.insert(), hot_mappings(totals))
+
+# Помесячный ряд пользователя: сводки сжатых месяцев плюс горячие счетчики.
+# Месяц, сжатый наполовину, складывается из обеих частей; test_results не
+# читается
+async def get_months(db: AsyncSession, username: str):
+    months = {}
+
+    def month(key):
+        if key not in months:
+            months[key] = [0, 0.0, 0.0, 0.0, array('I', [0] * HISTOGRAM_BUCKETS)]
+        return months[key]
+
+    for summary in await db.scalars(select(models.ResultSummary).where(models.ResultSummary.username == username)):
+        point = month(summary.month)
+        point[0] += summary.tests
+        point[1] += summary.sum_wpm
+        point[2] += summary.sum_accuracy
+        point[3] = max(point[3], summary.best_wpm)
+        for bucket, count in enumerate(load_histogram(summary.wpm_histogram)):
+            point[4][bucket] += count
+
+    for hot in await db.scalars(select(models.UserMonthStats).where(models.UserMonthStats.username == username)):
+        point = month(hot.month)
+        point[0] += hot.tests
+        point[1] += hot.sum_wpm
+        point[2] += hot.sum_accuracy
+        point[3] = max(point[3], hot.best_wpm)
+        point[4][hot.wpm_bucket] += hot.tests
+
+    return [
+        {
+            'month': key,
+            'tests': tests,
+            'avg_wpm': sum_wpm / tests,
+            'best_wpm': best_wpm,
+            'avg_accuracy': sum_accuracy / tests,
+            'wpm_histogram': histogram.tolist(),
+        }
+        for key, (tests, sum_wpm, sum_accuracy, best_wpm, histogram) in sorted(months.items())
+    ]
+
+# Компакция test_results. Один проход за запуск: пачки по batch_size строк
+# старше границы горячего окна в порядке id, каждая следующая — после
+# последнего id предыдущей. Каждая пачка — своя короткая транзакция:
+# удаление строк и перенос их из горячих счетчиков в сводки, блокировка записи держится только на
+# это время. Архив пишется до транзакции. Если часть пачки параллельно
+# сжал другой процесс, удалится меньше строк, чем прочитано, и транзакция
+# откатывается: эти строки достанутся ему.
+class Compactor:
+    def __init__(self, hot_days: int, batch_size: int, interval: float, pause_ms: float,
+                 archive=None, session_factory=AsyncSessionLocal):
+        self.hot_days = hot_days
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        self.pause = pause_ms / 1000
+        self.archive = archive
+        self.session_factory = session_factory
+        self.stats = {'runs': 0, 'compacted': 0, 'conflicts': 0}
+        self._task = None
+
+    def start(self):
+        if self.hot_days > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run()
+            except Exception:
+                logger.exception('Result compaction failed')
+            await asyncio.sleep(self.interval)
+
+    async def run(self, now: datetime = None):
+        cutoff = cutoff_for(now or datetime.utcnow(), self.hot_days)
+        table = models.TestResult.__table__
+        async with self.session_factory() as db:
+            # Строка с наибольшим id остается: без AUTOINCREMENT SQLite выдал
+            # бы ее id следующему результату, а он уже есть в архиве
+            newest = await db.scalar(select(func.max(table.c.id)))
+        compacted = 0
+        last_id = 0
+        while newest is not None:
+            done, last_id = await self.compact_batch(cutoff, last_id, newest)
+            if last_id is None:
+                break
+            compacted += done
+            # Пауза отдает блокировку записи запросам между пачками
+            await asyncio.sleep(self.pause)
+        self.stats['runs'] += 1
+        self.stats['compacted'] += compacted
+        if compacted:
+            logger.info('Compacted %d results older than %s', compacted, cutoff.date())
+        return {'cutoff': cutoff, 'compacted': compacted}
+
+    async def compact_batch(self, cutoff: datetime, after_id: int, newest: int):
+        table = models.TestResult.__table__
+        async with self.session_factory() as db:
+            rows = (await db.execute(
+                select(table)
+                .where(
+                    table.c.id > after_id,
+                    table.c.id < newest,
+                    or_(table.c.created_at.is_(None), table.c.created_at < cutoff)
+                )
+                .order_by(table.c.id)
+                .limit(self.batch_size)
+            )).all()
+            if not rows:
+                return 0, None
+            if self.archive is not None:
+                await asyncio.to_thread(self.archive.write, rows)
+            deleted = await db.execute(delete(table).where(table.c.id.in_([row.id for row in rows])))
+            if deleted.rowcount != len(rows):
+                await db.rollback()
+                self.stats['conflicts'] += 1
+                return 0, rows[-1].id
+            await record_summaries(db, rows)
+            await release_results(db, rows)
+            await db.commit()
+        # Без архива сжатые строки пропадают из истории
+        for username in {row.username for row in rows}:
+            await response_cache.invalidate_user(username, leaderboard=False)
+        return len(rows), rows[-1].id
+
+compactor = Compactor(
+    settings.RESULTS_HOT_DAYS, settings.COMPACTION_BATCH, settings.COMPACTION_INTERVAL_SECONDS,
+    settings.COMPACTION_PAUSE_MS, result_archive
+)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compact results older than the hot window into monthly summaries')
+    parser.add_argument('--hot-days', type=int, default=settings.RESULTS_HOT_DAYS)
+    args = parser.parse_args(argv)
+    if args.hot_days <= 0:
+        parser.error('set --hot-days or RESULTS_HOT_DAYS')
+    job = Compactor(args.hot_days, settings.COMPACTION_BATCH, settings.COMPACTION_INTERVAL_SECONDS, 0, result_archive)
+    report = asyncio.run(job.run())
+    print(f'Compacted {report["compacted"]} results older than {report["cutoff"]:%Y-%m-%d}')
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,84 @@
 from pydantic_settings import BaseSettings
+from typing import Optional
 import secrets
+import os
 
 class Settings(BaseSettings):
     DATABASE_URL: str = 'sqlite:///./sakhatype.db'
+    ASYNC_DATABASE_URL: Optional[str] = None
+    # Пул соединений (для SQLite pre-ping не нужен и не включается)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = 1800
+    # PRAGMA для каждого нового соединения SQLite
+    SQLITE_JOURNAL_MODE: str = 'WAL'
+    SQLITE_SYNCHRONOUS: str = 'NORMAL'
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
     SECRET_KEY: str = secrets.token_urlsafe(32)
     ALGORITHM: str = 'HS256'
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    TOKEN_CACHE_SIZE: int = 20000
+    ADMIN_TOKEN: Optional[str] = None
+    RESULTS_BATCH_LIMIT: int = 100
+    # Результаты из офлайн-очереди клиента приходят со своим created_at; время
+    # из будущего или старше стольких дней прижимается к границе окна
+    RESULTS_BACKDATE_DAYS: int = 7
+    # Адаптивный подбор слов: во сколько раз слабая буква повышает вес слова
+    # и сколько попыток буквы нужно, чтобы судить о ней
+    ADAPTIVE_WORDS_BOOST: float = 4.0
+    ADAPTIVE_MIN_ATTEMPTS: int = 20
+    # Кэш публичных ответов: redis://... для общего кэша нескольких процессов,
+    # иначе LRU в памяти процесса
+    RESPONSE_CACHE_URL: Optional[str] = None
+    RESPONSE_CACHE_SIZE: int = 4096
+    RESPONSE_CACHE_TTL: int = 60
+    RESPONSE_CACHE_MAX_AGE: int = 0
+    # Параметры argon2. При их изменении старые хэши пересчитываются при входе
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536
+    ARGON2_PARALLELISM: int = 4
+    # Argon2 считается в пуле процессов по числу ядер. Сверх лимита очереди
+    # запросы на вход и регистрацию сразу получают 503
+    PASSWORD_HASH_WORKERS: int = os.cpu_count() or 1
+    PASSWORD_HASH_QUEUE_LIMIT: int = 32
+    # Метрики Prometheus на /metrics (задержки по маршрутам, запросы к базе)
+    METRICS_ENABLED: bool = True
+    # Профиль запроса по заголовку X-Profile (нужен и X-Admin-Token).
+    # Только для отладки: семплер замедляет весь процесс, пока идет запрос
+    PROFILING_ENABLED: bool = False
+    PROFILING_INTERVAL_MS: float = 1.0
+    # Гонки по WebSocket: частота рассылки снимков прогресса, отсчет перед
+    # стартом, размер комнаты и сколько ждать результаты после конца гонки
+    RACE_TICK_MS: float = 100
+    RACE_COUNTDOWN_SECONDS: float = 3
+    RACE_ROOM_SIZE: int = 50
+    RACE_MIN_PLAYERS: int = 2
+    RACE_RESULT_GRACE_SECONDS: float = 5
+    RACE_WORDS: int = 200
+    # Отложенная запись результатов: ответ после записи в локальный журнал,
+    # в базу — пачками раз в WRITE_BEHIND_FLUSH_MS или по WRITE_BEHIND_BATCH.
+    # Журнал у каждого процесса свой. Без fsync переживает падение процесса,
+    # но не отключение питания
+    WRITE_BEHIND_ENABLED: bool = False
+    WRITE_BEHIND_LOG: str = './results.wbl'
+    WRITE_BEHIND_FLUSH_MS: float = 50
+    WRITE_BEHIND_BATCH: int = 500
+    WRITE_BEHIND_FSYNC: bool = True
+    # Журнал медленных запросов к базе с планом выполнения — отладочный,
+    # включается порогом в мс; 0 — выключен
+    SLOW_QUERY_MS: float = 0
+    SLOW_QUERY_LOG_SIZE: int = 100
+    # Хранение результатов: строки старше RESULTS_HOT_DAYS (с начала того
+    # месяца) сжимаются в помесячные сводки, сами строки при заданном
+    # RESULTS_ARCHIVE_DIR уходят в gzip-архив. 0 — хранить все строки.
+    # Компакция идет пачками по COMPACTION_BATCH строк с паузой между ними
+    RESULTS_HOT_DAYS: int = 0
+    RESULTS_ARCHIVE_DIR: Optional[str] = None
+    COMPACTION_INTERVAL_SECONDS: float = 3600
+    COMPACTION_BATCH: int = 2000
+    COMPACTION_PAUSE_MS: float = 50
 
 settings = Settings()
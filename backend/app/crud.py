@@ -1,94 +1,249 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
-from datetime import datetime
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, desc, insert, update, case, tuple_, bindparam, Integer
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+import asyncio
+import base64
+import json
 
-from . import models, schemas
-from .auth import get_password_hash, verify_password
+from . import models, schemas, rollups, stats, keystrokes, heatmap, texts, archive, compaction
+from .config import settings
+from .passwords import password_hasher
+from .response_cache import response_cache
+from .leaderboard import leaderboards, TIME_MODES
 
-def get_user_by_username(db: Session, username: str):
-    return db.query(models.User).filter(models.User.username == username).first()
+async def get_user_by_username(db: AsyncSession, username: str):
+    return await db.scalar(select(models.User).where(models.User.username == username))
 
-def create_user(db: Session, user: schemas.User):
+async def create_user(db: AsyncSession, user: schemas.User):
     db_user = models.User(
-        username=user.username, 
-        password=get_password_hash(user.password),
+        username=user.username,
+        password=await password_hasher.hash(user.password),
         created_at=datetime.utcnow()
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    # Новый пользователь еще не попал на доски
+    await response_cache.invalidate_user(db_user.username, leaderboard=False)
     return db_user
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = get_user_by_username(db, username)
-    if not user or not verify_password(password, user.password):
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await get_user_by_username(db, username)
+    if not user:
         return False
+    verified, new_hash = await password_hasher.verify(password, user.password)
+    if not verified:
+        return False
+    if new_hash is not None:
+        user.password = new_hash
+        await db.commit()
     return user
 
-def get_words(db: Session, limit: int = 30):
-    return db.query(models.Word.word).order_by(func.random()).limit(limit).all()
+async def get_all_words(db: AsyncSession):
+    return await db.stream(
+        select(models.Word.word, models.Word.language)
+        .order_by(models.Word.language, models.Word.frequency_rank.nulls_last(), models.Word.id)
+        .execution_options(yield_per=10000)
+    )
 
 # Новые CRUD функции для результатов и статистики
 
-def create_test_result(db: Session, username: str, result: schemas.TestResultCreate):
-    # Создаем запись о результате теста
-    db_result = models.TestResult(
-        username=username,
-        wpm=result.wpm,
-        raw_wpm=result.raw_wpm,
-        accuracy=result.accuracy,
-        burst_wpm=result.burst_wpm,
-        total_errors=result.total_errors,
-        time_mode=result.time_mode,
-        test_duration=result.test_duration,
-        consistency=result.consistency,
-        created_at=datetime.utcnow()
-    )
-    db.add(db_result)
-    
-    # Обновляем статистику пользователя
-    user = get_user_by_username(db, username)
+# Время результата: для результатов из офлайн-очереди — присланное клиентом,
+# но не из будущего и не старше RESULTS_BACKDATE_DAYS; для остальных — now
+def result_time(result: schemas.TestResultCreate, now: datetime):
+    created_at = result.created_at if isinstance(result, schemas.QueuedTestResult) else None
+    if created_at is None:
+        return now
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return min(now, max(now - timedelta(days=settings.RESULTS_BACKDATE_DAYS), created_at))
+
+def result_columns(result: schemas.TestResultCreate):
+    values = result.model_dump(exclude={'keystrokes', 'created_at'})
+    values['keystrokes'] = None
+    if result.keystrokes is not None:
+        deltas, codes = keystrokes.decode(result.keystrokes.data)
+        values['keystrokes'] = keystrokes.pack(deltas, codes, result.keystrokes.text)
+    return values
+
+def experience_for(result):
+    # Опыт за тест: WPM + точность
+    return int(result.wpm + result.accuracy)
+
+# Счетчики пользователя меняются в SQL (add_test_results), а не через
+# объект, загруженный при авторизации: параллельные результаты одного
+# пользователя не затирают друг друга
+async def create_test_result(db: AsyncSession, username: str, result: schemas.TestResultCreate):
+    user, (db_result,) = (await add_test_results(db, {username: [(result, datetime.utcnow())]}))[username]
+    await db.commit()
     if user:
-        user.total_tests += 1
-        user.total_time_seconds += result.test_duration
-        
-        # Обновляем лучшие результаты
-        if result.wpm > user.best_wpm:
-            user.best_wpm = result.wpm
-        if result.accuracy > user.best_accuracy:
-            user.best_accuracy = result.accuracy
-            
-        # Добавляем опыт (WPM + точность)
-        experience_gained = int(result.wpm + result.accuracy)
-        user.total_experience += experience_gained
-        
-        # Расчет уровня (каждые 1000 опыта = 1 уровень)
-        user.level = 1 + (user.total_experience // 1000)
-    
-    db.commit()
-    db.refresh(db_result)
+        leaderboards.record_result(user, db_result)
+    await response_cache.invalidate_user(username)
     return db_result
 
-def get_user_results(db: Session, username: str, limit: int = 50):
-    return db.query(models.TestResult)\
-        .filter(models.TestResult.username == username)\
+# Результаты нескольких пользователей без commit: results_by_user —
+# {username: [(результат, created_at)]}. Каждая таблица обновляется одним
+# запросом на всю пачку, поэтому write_behind сбрасывает сотни результатов
+# за несколько запросов. Возвращает {username: (строка пользователя, строки результатов)}
+async def add_test_results(db: AsyncSession, results_by_user):
+    values = [
+        {'username': username, 'created_at': created_at, **result_columns(result)}
+        for username, entries in results_by_user.items()
+        for result, created_at in entries
+    ]
+    # Одна пакетная вставка вместо INSERT на каждый результат
+    ids = (await db.scalars(
+        insert(models.TestResult).returning(models.TestResult.id, sort_by_parameter_order=True),
+        values
+    )).all()
+    rows = {}
+    for row_id, value in zip(ids, values):
+        rows.setdefault(value['username'], []).append(models.TestResult(id=row_id, **value))
+    await rollups.record_results(db, rows)
+    await stats.record_results(db, rows)
+    await heatmap.record_results(db, rows)
+    await texts.record_results(db, rows)
+    await compaction.record_results(db, rows)
+
+    # Изменения статистики пользователей одним UPDATE (executemany)
+    table = models.User.__table__
+    experience = bindparam('experience', type_=Integer)
+    await db.execute(
+        update(table)
+        .where(table.c.username == bindparam('name'))
+        .values(
+            total_tests=table.c.total_tests + bindparam('tests'),
+            total_time_seconds=table.c.total_time_seconds + bindparam('seconds'),
+            best_wpm=case((table.c.best_wpm < bindparam('wpm'), bindparam('wpm')), else_=table.c.best_wpm),
+            best_accuracy=case((table.c.best_accuracy < bindparam('accuracy'), bindparam('accuracy')), else_=table.c.best_accuracy),
+            total_experience=table.c.total_experience + experience,
+            level=1 + (table.c.total_experience + experience) // 1000
+        ),
+        [
+            {
+                'name': username,
+                'tests': len(user_rows),
+                'seconds': sum(row.test_duration for row in user_rows),
+                'wpm': max(row.wpm for row in user_rows),
+                'accuracy': max(row.accuracy for row in user_rows),
+                'experience': sum(experience_for(row) for row in user_rows),
+            }
+            for username, user_rows in rows.items()
+        ]
+    )
+    users = {
+        user.username: user
+        for user in await db.scalars(
+            select(models.User)
+            .where(models.User.username.in_(list(rows)))
+            .execution_options(populate_existing=True)
+        )
+    }
+    return {username: (users.get(username), user_rows) for username, user_rows in rows.items()}
+
+async def create_test_results(db: AsyncSession, username: str, results):
+    now = datetime.utcnow()
+    user, rows = (await add_test_results(db, {username: [(result, result_time(result, now)) for result in results]}))[username]
+    await db.commit()
+
+    if user:
+        for row in rows:
+            leaderboards.record_result(user, row)
+    await response_cache.invalidate_user(username)
+    return rows
+
+# Поля schemas.TestResultResponse по порядку: списки результатов читаются
+# кортежами, без ORM-объектов (см. serialization)
+RESULT_COLUMNS = (
+    'id', 'username', 'wpm', 'raw_wpm', 'accuracy', 'burst_wpm', 'total_errors',
+    'time_mode', 'test_duration', 'consistency', 'created_at', 'text_id'
+)
+
+ArchivedResult = namedtuple('ArchivedResult', RESULT_COLUMNS)
+
+def result_columns_query():
+    table = models.TestResult.__table__
+    return select(*(table.c[column] for column in RESULT_COLUMNS))
+
+# Когда горячие строки кончились, история продолжается строками из архива
+# компакции (если он включен): они всегда старше горячих
+async def with_archived(rows, username: str, limit: int, after: tuple = None, **filters):
+    if archive.result_archive is None or len(rows) >= limit:
+        return rows
+    if rows:
+        after = (rows[-1].created_at, rows[-1].id)
+    archived = await asyncio.to_thread(archive.result_archive.page, username, limit - len(rows), after, **filters)
+    return rows + [ArchivedResult(*(row[column] for column in RESULT_COLUMNS)) for row in archived]
+
+def user_results_query(username: str, limit: int = 50):
+    return result_columns_query()\
+        .where(models.TestResult.username == username)\
         .order_by(desc(models.TestResult.created_at))\
-        .limit(limit)\
-        .all()
-
-def get_user_profile(db: Session, username: str):
-    return db.query(models.User).filter(models.User.username == username).first()
-
-def get_leaderboard_wpm(db: Session, limit: int = 100):
-    return db.query(models.User)\
-        .filter(models.User.total_tests > 0)\
-        .order_by(desc(models.User.best_wpm))\
-        .limit(limit)\
-        .all()
-
-def get_leaderboard_accuracy(db: Session, limit: int = 100):
-    return db.query(models.User)\
-        .filter(models.User.total_tests > 0)\
-        .order_by(desc(models.User.best_accuracy))\
-        .limit(limit)\
-        .all()
\ No newline at end of file
+        .limit(limit)
+
+async def get_user_results(db: AsyncSession, username: str, limit: int = 50):
+    rows = (await db.execute(user_results_query(username, limit))).all()
+    return await with_archived(rows, username, limit)
+
+# Курсор истории — позиция последней отданной строки (created_at, id)
+def encode_cursor(result):
+    raw = json.dumps([result.created_at.isoformat(), result.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, result_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(result_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def user_results_page_query(
+    username: str,
+    limit: int = 50,
+    after: tuple = None,
+    time_mode: int = None,
+    since: datetime = None,
+    until: datetime = None
+):
+    query = result_columns_query().where(models.TestResult.username == username)
+    if time_mode is not None:
+        query = query.where(models.TestResult.time_mode == time_mode)
+    if since is not None:
+        query = query.where(models.TestResult.created_at >= since)
+    if until is not None:
+        query = query.where(models.TestResult.created_at < until)
+    if after is not None:
+        query = query.where(tuple_(models.TestResult.created_at, models.TestResult.id) < tuple_(*after))
+    return query\
+        .order_by(desc(models.TestResult.created_at), desc(models.TestResult.id))\
+        .limit(limit)
+
+async def get_user_results_page(db: AsyncSession, username: str, limit: int = 50, cursor: str = None, **filters):
+    after = decode_cursor(cursor) if cursor else None
+    # Берем на одну строку больше, чтобы понять, есть ли следующая страница
+    rows = (await db.execute(user_results_page_query(username, limit + 1, after, **filters))).all()
+    rows = await with_archived(rows, username, limit + 1, after, **filters)
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+async def get_user_profile(db: AsyncSession, username: str):
+    return await db.scalar(select(models.User).where(models.User.username == username))
+
+async def get_ranked_users(db: AsyncSession):
+    return (await db.scalars(select(models.User).where(models.User.total_tests > 0))).all()
+
+async def get_time_mode_bests(db: AsyncSession):
+    return (await db.execute(
+        select(
+            models.LeaderboardRollup.username,
+            models.LeaderboardRollup.time_mode,
+            models.LeaderboardRollup.best_wpm,
+            models.LeaderboardRollup.best_accuracy
+        )
+        .where(
+            models.LeaderboardRollup.period == 'all',
+            models.LeaderboardRollup.time_mode.in_(TIME_MODES)
+        )
+    )).all()
@@ -1,14 +1,152 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool, StaticPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from bisect import bisect_left
+from threading import Lock
+import time
 
 from .config import settings
 
-engine = create_engine(settings.DATABASE_URL, connect_args={'check_same_thread': False})
+# Асинхронные драйверы для того же DATABASE_URL
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgres': 'postgresql+asyncpg',
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+}
+
+def async_database_url(url: str):
+    scheme, sep, rest = url.partition('://')
+    return f'{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}'
+
+def is_sqlite(url: str):
+    return url.startswith('sqlite')
+
+def is_memory_sqlite(url: str):
+    return is_sqlite(url) and (url.endswith(':memory:') or url.split('://', 1)[1] in ('', '/'))
+
+# Сколько ждали свободное соединение из пула и насколько пул загружен
+class PoolStats:
+    WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool = None
+        self._lock = Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.wait_buckets = [0] * (len(self.WAIT_BUCKETS) + 1)
+
+    def observe_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            self.wait_buckets[bisect_left(self.WAIT_BUCKETS, seconds)] += 1
+
+    def snapshot(self):
+        pool = self.pool
+        capacity = checked_out = None
+        if isinstance(pool, QueuePool):
+            capacity = pool.size() + max(settings.DB_MAX_OVERFLOW, 0)
+            checked_out = pool.checkedout()
+        with self._lock:
+            return {
+                'pool': self.name,
+                'size': pool.size() if isinstance(pool, QueuePool) else None,
+                'capacity': capacity,
+                'checked_out': checked_out,
+                'utilisation': checked_out / capacity if capacity else None,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_seconds_total': self.wait_seconds_total,
+                'wait_seconds_avg': self.wait_seconds_total / self.checkouts if self.checkouts else 0.0,
+                'wait_seconds_max': self.wait_seconds_max,
+                'wait_buckets': dict(zip([*map(str, self.WAIT_BUCKETS), '+Inf'], self.wait_buckets)),
+            }
+
+def timed_pool(base):
+    class TimedPool(base):
+        stats = None
+
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except Exception:
+                self.stats.observe_wait(time.perf_counter() - started, timed_out=True)
+                raise
+            self.stats.observe_wait(time.perf_counter() - started)
+            return connection
+
+        def recreate(self):
+            pool = super().recreate()
+            pool.stats = self.stats
+            self.stats.pool = pool
+            return pool
+
+    TimedPool.__name__ = f'Timed{base.__name__}'
+    return TimedPool
+
+TimedQueuePool = timed_pool(QueuePool)
+TimedAsyncQueuePool = timed_pool(AsyncAdaptedQueuePool)
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f'PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}')
+    cursor.execute(f'PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}')
+    cursor.execute(f'PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}')
+    cursor.execute(f'PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}')
+    cursor.close()
+
+def engine_options(url: str, pool_class):
+    if is_memory_sqlite(url):
+        # Одна общая база в памяти — только одно соединение
+        return {'poolclass': StaticPool, 'connect_args': {'check_same_thread': False}}
+    options = {
+        'poolclass': pool_class,
+        'pool_size': settings.DB_POOL_SIZE,
+        'max_overflow': settings.DB_MAX_OVERFLOW,
+        'pool_timeout': settings.DB_POOL_TIMEOUT,
+        'pool_recycle': settings.DB_POOL_RECYCLE,
+        'pool_pre_ping': settings.DB_POOL_PRE_PING and not is_sqlite(url),
+    }
+    if is_sqlite(url):
+        options['connect_args'] = {'check_same_thread': False}
+    return options
+
+def configure(engine, url: str, stats: PoolStats):
+    pool = engine.pool
+    pool.stats = stats
+    stats.pool = pool
+    if is_sqlite(url):
+        event.listen(engine, 'connect', set_sqlite_pragmas)
+    return engine
+
+# Синхронный движок — для скриптов (сидинг, пересчеты) и бенчмарков
+sync_pool_stats = PoolStats('sync')
+engine = configure(
+    create_engine(settings.DATABASE_URL, **engine_options(settings.DATABASE_URL, TimedQueuePool)),
+    settings.DATABASE_URL,
+    sync_pool_stats
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def get_db():
-    db = SessionLocal()
-    try:
+ASYNC_DATABASE_URL = settings.ASYNC_DATABASE_URL or async_database_url(settings.DATABASE_URL)
+async_pool_stats = PoolStats('async')
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL, TimedAsyncQueuePool))
+configure(async_engine.sync_engine, ASYNC_DATABASE_URL, async_pool_stats)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+def pool_stats():
+    return [async_pool_stats.snapshot(), sync_pool_stats.snapshot()]
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
@@ -0,0 +1,133 @@
+from functools import lru_cache
+import argparse
+import re
+import sys
+import time
+import unicodedata
+
+from sqlalchemy import select, update, func
+from sqlalchemy.engine import Connection
+
+from . import models
+from .rollups import dialect_insert
+
+DEFAULT_LANGUAGE = 'sah'
+MAX_WORD_LENGTH = 40
+# Уникальных слов в одной порции; повторы внутри порции сливаются в памяти
+CHUNK_SIZE = 100000
+
+# Замены, которыми набирают якутские буквы без якутской раскладки, и похожие
+# буквы из казахского и латиницы. Применяются только к кириллическим словам,
+# чтобы не испортить латиницу и числа.
+VARIANTS = str.maketrans({
+    '5': 'ҕ', 'ғ': 'ҕ',
+    'ң': 'ҥ', 'ŋ': 'ҥ',
+    'ɵ': 'ө', 'θ': 'ө',
+    'h': 'һ',
+    'ұ': 'ү',
+})
+CYRILLIC = re.compile('[Ѐ-ӿ]')
+TOKEN = re.compile(r'\w+')
+
+# В корпусах одни и те же формы повторяются, кэш снимает повторную нормализацию
+@lru_cache(maxsize=65536)
+def normalize_word(word: str):
+    word = unicodedata.normalize('NFC', word.strip()).lower()
+    if CYRILLIC.search(word):
+        word = word.translate(VARIANTS)
+    if not word or len(word) > MAX_WORD_LENGTH or not word.isalpha():
+        return None
+    return word
+
+def read_text(lines):
+    for line in lines:
+        for token in TOKEN.findall(line):
+            yield token, 1
+
+def read_tsv(lines):
+    for line in lines:
+        word, _, frequency = line.rstrip('\n').partition('\t')
+        try:
+            yield word, int(frequency) if frequency.strip() else 1
+        except ValueError:
+            # Заголовок или битая строка
+            continue
+
+READERS = {'text': read_text, 'tsv': read_tsv}
+
+def upsert_chunk(connection: Connection, language: str, counts):
+    table = models.Word.__table__
+    statement = dialect_insert(connection)(table)
+    compiled = statement.on_conflict_do_update(
+        index_elements=[table.c.language, table.c.word],
+        set_={'frequency': table.c.frequency + statement.excluded.frequency}
+    ).compile(dialect=connection.dialect, column_keys=['word', 'language', 'length', 'frequency'])
+    rows = (
+        {'word': word, 'language': language, 'length': len(word), 'frequency': frequency}
+        # По порядку индекса (language, word) вставка идет по соседним страницам
+        for word, frequency in sorted(counts.items())
+    )
+    # Скомпилированный запрос уходит прямо в executemany драйвера: сборка
+    # параметров SQLAlchemy на каждую строку заметна на миллионах слов
+    if compiled.positional:
+        rows = [tuple(row[name] for name in compiled.positiontup) for row in rows]
+    connection.exec_driver_sql(str(compiled), list(rows))
+
+def rank_words(connection: Connection, language: str):
+    ranked = select(
+            models.Word.id,
+            func.row_number().over(order_by=(models.Word.frequency.desc(), models.Word.id)).label('rank')
+        )\
+        .where(models.Word.language == language)\
+        .subquery()
+    connection.execute(
+        update(models.Word)
+        .where(models.Word.id == ranked.c.id)
+        .values(frequency_rank=ranked.c.rank)
+    )
+
+# Потоковый импорт: в памяти только текущая порция уникальных слов, повторы
+# между порциями сливаются в базе через ON CONFLICT по (language, word)
+def import_words(connection: Connection, pairs, language: str = DEFAULT_LANGUAGE, chunk_size: int = CHUNK_SIZE):
+    counts = {}
+    seen = skipped = 0
+    for raw, frequency in pairs:
+        seen += 1
+        word = normalize_word(raw)
+        if word is None or frequency <= 0:
+            skipped += 1
+            continue
+        counts[word] = counts.get(word, 0) + frequency
+        if len(counts) >= chunk_size:
+            upsert_chunk(connection, language, counts)
+            counts = {}
+    if counts:
+        upsert_chunk(connection, language, counts)
+    rank_words(connection, language)
+    return {'read': seen, 'skipped': skipped}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import a word list or corpus into the words table')
+    parser.add_argument('path', help="file to import, '-' for stdin")
+    parser.add_argument('--format', choices=sorted(READERS), default='tsv',
+                        help='tsv: word<TAB>frequency per line; text: running text, frequencies are counted')
+    parser.add_argument('--language', default=DEFAULT_LANGUAGE)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    from .database import engine
+
+    started = time.perf_counter()
+    source = sys.stdin if args.path == '-' else open(args.path, encoding='utf-8')
+    try:
+        with engine.begin() as connection:
+            report = import_words(connection, READERS[args.format](source), args.language, args.chunk_size)
+            total = connection.scalar(select(func.count(models.Word.id)).where(models.Word.language == args.language))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    print(f"Read {report['read']} entries, skipped {report['skipped']}, "
+          f"{total} '{args.language}' words in the dictionary ({time.perf_counter() - started:.1f} s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import asyncio
+import csv
+import io
+import json
+
+from sqlalchemy import select
+
+from . import archive, models
+
+EXPORT_COLUMNS = (
+    'id', 'wpm', 'raw_wpm', 'accuracy', 'burst_wpm', 'total_errors',
+    'time_mode', 'test_duration', 'consistency', 'created_at', 'text_id'
+)
+MEDIA_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+def export_query(username: str):
+    table = models.TestResult.__table__
+    return select(*(table.c[column] for column in EXPORT_COLUMNS))\
+        .where(table.c.username == username)\
+        .order_by(table.c.created_at, table.c.id)
+
+# Читает историю серверным курсором порциями по chunk_size строк:
+# в памяти одновременно только одна порция. Строки из архива компакции
+# старше горячих и идут первыми, порция — месяц
+async def stream_rows(session_factory, username: str, chunk_size: int = 1000):
+    if archive.result_archive is not None:
+        for month in reversed(archive.result_archive.months(username)):
+            rows = await asyncio.to_thread(archive.result_archive.read, username, month)
+            yield [tuple(row[column] for column in EXPORT_COLUMNS) for row in rows]
+    async with session_factory() as db:
+        result = await db.stream(export_query(username).execution_options(yield_per=chunk_size))
+        async for partition in result.partitions():
+            yield partition
+
+def format_row(row):
+    return [value.isoformat() if hasattr(value, 'isoformat') else value for value in row]
+
+async def ndjson_chunks(rows):
+    async for partition in rows:
+        yield ''.join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, format_row(row))), ensure_ascii=False) + '\n'
+            for row in partition
+        )
+
+async def csv_chunks(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    async for partition in rows:
+        writer.writerows(format_row(row) for row in partition)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+FORMATTERS = {'ndjson': ndjson_chunks, 'csv': csv_chunks}
+
+def export_results(session_factory, username: str, fmt: str, chunk_size: int = 1000):
+    return FORMATTERS[fmt](stream_rows(session_factory, username, chunk_size))
@@ -0,0 +1,239 @@
+import base64
+import logging
+import zlib
+
+import numpy as np
+from sqlalchemy import inspect, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, keystrokes, archive
+from .rollups import dialect_insert
+
+logger = logging.getLogger(__name__)
+
+# Алфавит фиксированный: 33 русские буквы, 5 якутских и корзина «прочее».
+# Агрегаты пользователя — массивы uint32 фиксированной формы вместо строки
+# на каждую букву или пару букв.
+SAKHA_LETTERS = 'ҕҥөһү'
+ALPHABET = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя' + SAKHA_LETTERS
+OTHER = len(ALPHABET)
+SIZE = len(ALPHABET) + 1
+# Паузы длиннее этого не считаются задержкой перед буквой
+LATENCY_CAP_MS = 2000
+
+# Индексы: символы — [ATTEMPTS|ERRORS|LATENCY_COUNT|LATENCY_SUM, SIZE],
+# пары — то же для [SIZE, SIZE]
+ATTEMPTS, ERRORS, LATENCY_COUNT, LATENCY_SUM = range(4)
+FIELDS = 4
+
+LOOKUP = np.full(0x500, OTHER, dtype=np.int64)
+for index, letter in enumerate(ALPHABET):
+    LOOKUP[ord(letter)] = index
+    LOOKUP[ord(letter.upper())] = index
+
+def empty():
+    return np.zeros((FIELDS, SIZE), np.uint32), np.zeros((FIELDS, SIZE * SIZE), np.uint32)
+
+def letter_index(codes):
+    return LOOKUP[np.minimum(codes, len(LOOKUP) - 1).astype(np.int64)] if len(codes) else np.empty(0, np.int64)
+
+def keystroke_features(deltas, codes, text: str):
+    # Для каждого нажатия внутри слова: буква, пара с предыдущей буквой
+    # слова (-1 для первой), ошибка и задержка
+    events = keystrokes.replay(deltas, codes, text)
+    inside = events['inside']
+    target_index = events['target_index'][inside]
+    target = events['target']
+    letters = letter_index(target[target_index])
+    has_previous = (target_index > 0) & (target[np.maximum(target_index - 1, 0)] != keystrokes.SPACE)
+    previous = letter_index(target[np.maximum(target_index - 1, 0)])
+    pairs = np.where(has_previous, previous * SIZE + letters, -1)
+    errors = ~events['correct'][inside]
+    latency = deltas[inside].astype(np.int64)
+    return letters, pairs, errors, latency
+
+def aggregate(letters, pairs, errors, latency):
+    timed = ~errors & (latency <= LATENCY_CAP_MS)
+    chars, bigrams = empty()
+    for counts, keys, size in ((chars, letters, SIZE), (bigrams, pairs, SIZE * SIZE)):
+        valid = keys >= 0
+        keys, valid_errors, valid_timed, valid_latency = keys[valid], errors[valid], timed[valid], latency[valid]
+        counts[ATTEMPTS] = np.bincount(keys, minlength=size)
+        counts[ERRORS] = np.bincount(keys, weights=valid_errors, minlength=size)
+        counts[LATENCY_COUNT] = np.bincount(keys, weights=valid_timed, minlength=size)
+        counts[LATENCY_SUM] = np.bincount(keys[valid_timed], weights=valid_latency[valid_timed], minlength=size)
+    return chars, bigrams
+
+# Пакетный пересчет: признаки всех журналов склеиваются и сворачиваются
+# одним bincount на массив
+def aggregate_logs(blobs):
+    parts = [keystroke_features(*keystrokes.unpack(blob)) for blob in blobs]
+    if not parts:
+        return empty()
+    return aggregate(*(np.concatenate(column) for column in zip(*parts)))
+
+def dump(chars, bigrams):
+    return zlib.compress(chars.tobytes() + bigrams.tobytes())
+
+def load(data: bytes):
+    if not data:
+        return empty()
+    values = np.frombuffer(zlib.decompress(data), dtype=np.uint32)
+    return (
+        values[:FIELDS * SIZE].reshape(FIELDS, SIZE).copy(),
+        values[FIELDS * SIZE:].reshape(FIELDS, SIZE * SIZE).copy()
+    )
+
+# Массивы складываются здесь, поэтому строки сначала создаются пустыми и
+# читаются под блокировкой, как в stats.record_results
+async def record_results(db: AsyncSession, results_by_user):
+    logs = {}
+    for username, results in results_by_user.items():
+        blobs = [result.keystrokes for result in results if result.keystrokes]
+        if blobs:
+            logs[username] = blobs
+    if not logs:
+        return
+    await db.execute(
+        dialect_insert(db)(models.UserHeatmap).on_conflict_do_nothing(),
+        [{'username': username, 'tests': 0, 'data': b''} for username in logs]
+    )
+    rows = {
+        row.username: row
+        for row in await db.scalars(
+            select(models.UserHeatmap)
+            .where(models.UserHeatmap.username.in_(list(logs)))
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
+    }
+    for username, blobs in logs.items():
+        row = rows[username]
+        chars, bigrams = load(row.data)
+        new_chars, new_bigrams = aggregate_logs(blobs)
+        row.data = dump(chars + new_chars, bigrams + new_bigrams)
+        row.tests += len(blobs)
+
+def cells(counts, keys, min_attempts: int = 0):
+    attempts = counts[ATTEMPTS]
+    return [
+        {
+            'key': key,
+            'attempts': int(attempts[i]),
+            'errors': int(counts[ERRORS][i]),
+            'error_rate': float(counts[ERRORS][i] / attempts[i]) if attempts[i] else 0.0,
+            'avg_latency_ms': float(counts[LATENCY_SUM][i] / counts[LATENCY_COUNT][i]) if counts[LATENCY_COUNT][i] else None,
+        }
+        for i, key in keys
+        if attempts[i] >= min_attempts
+    ]
+
+# Слабость буквы: доля ошибок и средняя задержка относительно средних по
+# буквам пользователя; 0 — буква не хуже средней или по ней мало данных
+def letter_weakness(chars, min_attempts: int = 20):
+    attempts = chars[ATTEMPTS].astype(np.float64)
+    seen = attempts >= max(min_attempts, 1)
+    seen[OTHER] = False
+    timed = seen & (chars[LATENCY_COUNT] > 0)
+    if not timed.any():
+        return np.zeros(SIZE)
+    error_rate = (chars[ERRORS] + 1.0) / (attempts + 2.0)
+    latency = chars[LATENCY_SUM] / np.maximum(chars[LATENCY_COUNT], 1)
+    score = error_rate / error_rate[seen].mean() + latency / latency[timed].mean()
+    return np.where(timed, np.maximum(score - 2.0, 0.0), 0.0)
+
+async def get_letter_weakness(db: AsyncSession, username: str, min_attempts: int = 20):
+    row = await db.get(models.UserHeatmap, username)
+    return letter_weakness(load(row.data if row else b'')[0], min_attempts)
+
+def bigram_key(index: int):
+    return ALPHABET[index // SIZE] + ALPHABET[index % SIZE]
+
+async def get_heatmap(db: AsyncSession, username: str, bigrams: int = 20, min_attempts: int = 5):
+    row = await db.get(models.UserHeatmap, username)
+    chars, pairs = load(row.data if row else b'')
+    # Самые медленные пары, затем по доле ошибок; «прочее» не показываем
+    known = np.arange(SIZE * SIZE)
+    known = known[(known // SIZE != OTHER) & (known % SIZE != OTHER) & (pairs[ATTEMPTS] >= max(min_attempts, 1))]
+    latency = pairs[LATENCY_SUM][known] / np.maximum(pairs[LATENCY_COUNT][known], 1)
+    error_rate = pairs[ERRORS][known] / pairs[ATTEMPTS][known]
+    slowest = known[np.lexsort((error_rate, latency))[::-1][:bigrams]]
+    return {
+        'username': username,
+        'tests': row.tests if row else 0,
+        'sakha_letters': SAKHA_LETTERS,
+        'characters': cells(chars, enumerate(ALPHABET)),
+        'bigrams': cells(pairs, ((int(i), bigram_key(int(i))) for i in slowest)),
+    }
+
+# Журналы нажатий пользователя из архива компакции: (id результата, журнал)
+def archived_logs(results, username: str):
+    for month in results.months(username):
+        for row in results.read(username, month):
+            if row.get('keystrokes'):
+                yield row['id'], base64.b64decode(row['keystrokes'])
+
+# Пересчет с нуля. Журналы результатов, сжатых компакцией, читаются из
+# архива (results, по умолчанию archive.result_archive). Без архива их
+# взять негде, поэтому агрегаты пользователей со сжатыми месяцами остаются
+# как есть, а не пересчитываются по одним горячим строкам
+def rebuild(connection: Connection, username: str = None, results=None):
+    results = results or archive.result_archive
+    table = models.TestResult.__table__
+    heatmaps = models.UserHeatmap.__table__
+    query = select(table.c.id, table.c.username, table.c.keystrokes)\
+        .where(table.c.keystrokes.is_not(None))\
+        .order_by(table.c.username)
+    stale = heatmaps.delete()
+    compacted = set()
+    # Миграция 7 идет раньше, чем появляется result_summaries
+    if models.ResultSummary.__tablename__ in inspect(connection).get_table_names():
+        summaries = select(models.ResultSummary.username).distinct()
+        if username is not None:
+            summaries = summaries.where(models.ResultSummary.username == username)
+        compacted = set(connection.scalars(summaries))
+    skipped = compacted if results is None else set()
+    if skipped:
+        logger.warning('No result archive, keeping heatmaps of %d users with compacted results', len(skipped))
+        stale = stale.where(heatmaps.c.username.not_in(skipped))
+    if username is not None:
+        query = query.where(table.c.username == username)
+        stale = stale.where(heatmaps.c.username == username)
+    connection.execute(stale)
+
+    def store(name, rows):
+        if name in skipped:
+            return 0
+        blobs = dict(rows)
+        if name in compacted:
+            # Строка может быть и в архиве, и в test_results, если пачка
+            # компакции откатилась после записи архива
+            blobs.update(archived_logs(results, name))
+        if not blobs:
+            return 0
+        connection.execute(heatmaps.insert().values(
+            username=name, tests=len(blobs), data=dump(*aggregate_logs(list(blobs.values())))
+        ))
+        return 1
+
+    current, rows, seen, rebuilt = None, [], set(), 0
+    for row_id, name, blob in connection.execute(query.execution_options(yield_per=1000)):
+        if name != current:
+            rebuilt += store(current, rows)
+            current, rows = name, []
+            seen.add(name)
+        rows.append((row_id, blob))
+    rebuilt += store(current, rows)
+    # Пользователи, у которых все журналы уже в архиве
+    for name in sorted(compacted - seen):
+        rebuilt += store(name, [])
+    return rebuilt
+
+if __name__ == '__main__':
+    import sys
+
+    from .database import engine
+
+    with engine.begin() as connection:
+        print(f'Rebuilt heatmaps: {rebuild(connection, sys.argv[1] if len(sys.argv) > 1 else None)}')
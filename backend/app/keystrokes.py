@@ -0,0 +1,184 @@
+import base64
+import struct
+import zlib
+
+import numpy as np
+
+from .leaderboard import TIME_MODES
+
+# Журнал нажатий: версия (u8), затем N интервалов в мс от предыдущего нажатия
+# (первый — от начала теста) и N кодов символов, все uint16 little-endian.
+# Коды — Unicode (все буквы якутского и русского алфавитов в BMP),
+# 8 — Backspace, 32 — пробел, завершающий слово.
+FORMAT_VERSION = 1
+BACKSPACE = 8
+SPACE = 32
+MAX_KEYSTROKES = 65535
+MAX_KEYS_PER_SECOND = 40
+# Последнее нажатие может прийти чуть позже конца таймера
+DURATION_TOLERANCE_MS = 1000
+# Длительность задает размер массивов в compute_stats, поэтому она
+# ограничена самым длинным режимом
+MAX_TEST_SECONDS = max(TIME_MODES) + DURATION_TOLERANCE_MS // 1000
+BURST_MIN_WORD_MS = 50
+
+def decode(data: str):
+    try:
+        raw = base64.b64decode(data, validate=True)
+    except ValueError:
+        raise ValueError('Keystroke log is not valid base64')
+    if not raw or raw[0] != FORMAT_VERSION:
+        raise ValueError('Unsupported keystroke log version')
+    if (len(raw) - 1) % 4:
+        raise ValueError('Keystroke log is truncated')
+    size = (len(raw) - 1) // 4
+    if size > MAX_KEYSTROKES:
+        raise ValueError('Keystroke log is too long')
+    values = np.frombuffer(raw, dtype='<u2', offset=1)
+    return values[:size], values[size:]
+
+def encode(deltas, codes):
+    return base64.b64encode(
+        bytes([FORMAT_VERSION]) + np.asarray(deltas, '<u2').tobytes() + np.asarray(codes, '<u2').tobytes()
+    ).decode()
+
+def text_codes(text: str):
+    codes = np.frombuffer(text.encode('utf-16-le'), dtype='<u2')
+    if len(codes) != len(text):
+        raise ValueError('Text contains characters outside the BMP')
+    return codes
+
+# В базе журнал хранится сжатым вместе с текстом, который набирал пользователь
+def pack(deltas, codes, text: str):
+    deltas = np.asarray(deltas, '<u2')
+    return zlib.compress(
+        struct.pack('<BI', FORMAT_VERSION, len(deltas)) + deltas.tobytes()
+        + np.asarray(codes, '<u2').tobytes() + text.encode()
+    )
+
+def unpack(blob: bytes):
+    raw = zlib.decompress(blob)
+    version, size = struct.unpack_from('<BI', raw)
+    if version != FORMAT_VERSION:
+        raise ValueError('Unsupported keystroke log version')
+    values = np.frombuffer(raw, dtype='<u2', count=2 * size, offset=5)
+    return values[:size], values[size:], raw[5 + 4 * size:].decode()
+
+def segment_min(values, segments, span):
+    # Накопленный минимум внутри каждого слова одним проходом: сдвигаем слова
+    # так, чтобы каждое следующее лежало целиком ниже предыдущих
+    return np.minimum.accumulate(values - segments * span) + segments * span
+
+def segment_suffix_min(values, segments, span):
+    shifted = (values + segments * span)[::-1]
+    return np.minimum.accumulate(shifted)[::-1] - segments * span
+
+# Воспроизводит ввод без цикла по нажатиям. Позиция курсора в слове — это
+# сумма шагов (+1 символ, -1 Backspace) с отражением от нуля:
+# pos = s - min(0, min s), где минимум берется с начала слова.
+def replay(deltas, codes, text: str):
+    times = np.cumsum(deltas, dtype=np.int64)
+    is_back = codes == BACKSPACE
+    is_space = codes == SPACE
+    is_char = ~(is_back | is_space)
+    steps = is_char.astype(np.int64) - is_back
+    words = np.cumsum(is_space) - is_space
+    size = len(codes)
+    span = 2 * size + 1
+
+    walk = np.cumsum(steps)
+    before = walk - steps
+    starts = np.flatnonzero(np.r_[True, words[1:] != words[:-1]]) if size else np.empty(0, np.int64)
+    relative = walk - before[starts][words]
+    position = relative - np.minimum(segment_min(relative, words, span), 0)
+
+    target = text_codes(text)
+    bounds = np.flatnonzero(target == SPACE)
+    word_start = np.r_[0, bounds + 1]
+    word_length = np.r_[bounds, len(target)] - word_start
+
+    # Символ, набранный на позиции position - 1 текущего слова
+    index = np.minimum(words, len(word_start) - 1)
+    column = position - 1
+    inside = is_char & (words < len(word_start)) & (column >= 0) & (column < word_length[index])
+    target_index = np.where(inside, word_start[index] + column, -1)
+    expected = target[np.maximum(target_index, 0)] if len(target) else np.zeros(size, np.uint16)
+    correct = inside & (expected == codes)
+    # Символ остался в слове, если его не стерли до пробела
+    kept = is_char & (segment_suffix_min(position, words, span) >= position)
+
+    last = np.r_[starts[1:] - 1, size - 1] if size else starts
+    committed = is_space[last]
+    kept_correct = np.bincount(words, weights=kept & correct, minlength=len(starts))[:len(starts)]
+    final_length = position[last]
+    word_ok = (words[last] < len(word_start)) & (final_length == word_length[np.minimum(words[last], len(word_start) - 1)]) \
+        & (kept_correct == final_length)
+    space_correct = np.zeros(size, bool)
+    space_correct[last[committed]] = word_ok[committed]
+
+    return {
+        'times': times,
+        'codes': codes,
+        'is_char': is_char,
+        'is_space': is_space,
+        'words': words,
+        'position': position,
+        'correct': correct | space_correct,
+        'inside': inside,
+        'target': target,
+        'target_index': target_index,
+        'expected': expected,
+        'kept_correct': kept_correct,
+        'word_ok': word_ok & committed,
+        'typed_length': final_length,
+        'word_end': times[last],
+        'word_begin': times[starts],
+        'committed': committed,
+    }
+
+def compute_stats(events, duration: int):
+    times = events['times']
+    typed = events['is_char'] | events['is_space']
+    correct = events['correct'] & typed
+    keystrokes = int(typed.sum())
+    correct_keystrokes = int(correct.sum())
+    minutes = duration / 60
+    correct_chars = events['kept_correct'].sum() + events['word_ok'].sum()
+
+    # Скорость по секундам в скользящем окне 3 с, как в typingStore
+    seconds = np.minimum(times // 1000, duration - 1)
+    per_second = np.bincount(seconds[correct], minlength=duration)[:duration]
+    activity = np.bincount(seconds[typed], minlength=duration)[:duration]
+    window = np.minimum(np.arange(1, duration + 1), 3)
+    correct_window = np.convolve(per_second, np.ones(3, np.int64))[:duration]
+    active_window = np.convolve(activity, np.ones(3, np.int64))[:duration]
+    wpm_series = (correct_window / window / 5 * 60)[active_window > 0]
+    consistency = 0.0
+    if len(wpm_series) > 1 and wpm_series.mean() > 0:
+        consistency = max(0.0, 100.0 - wpm_series.std() / wpm_series.mean() * 100.0)
+
+    # Всплеск — лучшая скорость на отдельном слове
+    committed = events['committed']
+    word_ms = (events['word_end'] - events['word_begin'])[committed]
+    word_chars = events['typed_length'][committed]
+    fast = word_ms >= BURST_MIN_WORD_MS
+    burst = float((word_chars[fast] / 5 / (word_ms[fast] / 60000)).max()) if fast.any() else 0.0
+
+    return {
+        'wpm': round(float(correct_chars / 5 / minutes), 2) if minutes else 0.0,
+        'raw_wpm': round(keystrokes / 5 / minutes, 2) if minutes else 0.0,
+        'accuracy': round(100.0 * correct_keystrokes / keystrokes, 2) if keystrokes else 100.0,
+        'burst_wpm': round(burst, 2),
+        'total_errors': keystrokes - correct_keystrokes,
+        'consistency': round(consistency, 2),
+    }
+
+def validate(data: str, text: str, duration: int):
+    if not 0 < duration <= MAX_TEST_SECONDS:
+        raise ValueError(f'Test duration must be between 1 and {MAX_TEST_SECONDS} seconds')
+    deltas, codes = decode(data)
+    if len(codes) > MAX_KEYS_PER_SECOND * duration:
+        raise ValueError('Too many keystrokes for the test duration')
+    if int(deltas.sum(dtype=np.int64)) > duration * 1000 + DURATION_TOLERANCE_MS:
+        raise ValueError('Keystroke log is longer than the test')
+    return compute_stats(replay(deltas, codes, text), duration)
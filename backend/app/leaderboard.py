@@ -0,0 +1,135 @@
+from bisect import bisect_left, insort
+from threading import Lock
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+METRICS = ('wpm', 'accuracy')
+TIME_MODES = (15, 30, 60)
+# Поля записи доски в порядке schemas.LeaderboardEntry
+LEADERBOARD_COLUMNS = ('username', 'wpm', 'accuracy', 'total_tests', 'best_wpm', 'best_accuracy', 'level')
+
+def entry(metric: str, score: float, username: str, total_tests: int, best_wpm: float, best_accuracy: float, level: int):
+    return {
+        'username': username,
+        'wpm': score if metric == 'wpm' else None,
+        'accuracy': score if metric == 'accuracy' else None,
+        'total_tests': total_tests,
+        'best_wpm': best_wpm,
+        'best_accuracy': best_accuracy,
+        'level': level,
+    }
+
+# Одна таблица рекордов: username -> очки и список (-очки, username),
+# отсортированный по месту. Топ читается срезом, место ищется бинарным поиском.
+class Board:
+    def __init__(self):
+        self.scores = {}
+        self.ranking = []
+
+    def submit(self, username: str, score: float):
+        old = self.scores.get(username)
+        if old is not None:
+            if score <= old:
+                return False
+            del self.ranking[bisect_left(self.ranking, (-old, username))]
+        self.scores[username] = score
+        insort(self.ranking, (-score, username))
+        return True
+
+    def top(self, limit: int):
+        return self.ranking[:max(limit, 0)]
+
+    def rank(self, username: str):
+        score = self.scores.get(username)
+        if score is None:
+            return None
+        return bisect_left(self.ranking, (-score, username)) + 1, score
+
+# Таблицы рекордов в памяти по каждой метрике и режиму времени
+# (None — общий рекорд пользователя) и по каждому тексту режима цитат.
+# Заполняются из базы при старте и обновляются в crud.create_test_result.
+class LeaderboardEngine:
+    def __init__(self):
+        self._lock = Lock()
+        self._reset()
+
+    def _reset(self):
+        self.boards = {(metric, mode): Board() for metric in METRICS for mode in (None, *TIME_MODES)}
+        self.text_boards = {}
+        self.users = {}
+
+    async def load(self, db: AsyncSession):
+        from . import crud, texts
+
+        users = await crud.get_ranked_users(db)
+        bests = await crud.get_time_mode_bests(db)
+        text_bests = await texts.get_text_bests(db)
+        with self._lock:
+            self._reset()
+            for user in users:
+                self._update_user(user)
+            for username, time_mode, wpm, accuracy in bests:
+                if username not in self.users:
+                    continue
+                self.boards[('wpm', time_mode)].submit(username, wpm)
+                self.boards[('accuracy', time_mode)].submit(username, accuracy)
+            for text_id, username, wpm, accuracy in text_bests:
+                if username in self.users:
+                    self._submit_text(text_id, username, wpm, accuracy)
+
+    def _submit_text(self, text_id: int, username: str, wpm: float, accuracy: float):
+        for metric, score in (('wpm', wpm), ('accuracy', accuracy)):
+            board = self.text_boards.get((metric, text_id))
+            if board is None:
+                board = self.text_boards[(metric, text_id)] = Board()
+            board.submit(username, score)
+
+    def _update_user(self, user):
+        self.users[user.username] = {
+            'username': user.username,
+            'total_tests': user.total_tests,
+            'best_wpm': user.best_wpm,
+            'best_accuracy': user.best_accuracy,
+            'level': user.level,
+        }
+        self.boards[('wpm', None)].submit(user.username, user.best_wpm)
+        self.boards[('accuracy', None)].submit(user.username, user.best_accuracy)
+
+    def record_result(self, user, result):
+        with self._lock:
+            self._update_user(user)
+            if result.time_mode in TIME_MODES:
+                self.boards[('wpm', result.time_mode)].submit(user.username, result.wpm)
+                self.boards[('accuracy', result.time_mode)].submit(user.username, result.accuracy)
+            if result.text_id is not None:
+                self._submit_text(result.text_id, user.username, result.wpm, result.accuracy)
+
+    def top(self, metric: str, time_mode: int = None, limit: int = 100):
+        with self._lock:
+            board = self.boards[(metric, time_mode)]
+            return [entry(metric, -score, **self.users[username]) for score, username in board.top(limit)]
+
+    def top_text(self, metric: str, text_id: int, limit: int = 100):
+        with self._lock:
+            board = self.text_boards.get((metric, text_id))
+            if board is None:
+                return []
+            return [entry(metric, -score, **self.users[username]) for score, username in board.top(limit)]
+
+    def rank(self, metric: str, username: str, time_mode: int = None):
+        with self._lock:
+            board = self.boards[(metric, time_mode)]
+            found = board.rank(username)
+            if found is None:
+                return None
+            position, score = found
+            return {
+                'username': username,
+                'metric': metric,
+                'time_mode': time_mode,
+                'rank': position,
+                'score': score,
+                'total': len(board.scores),
+            }
+
+leaderboards = LeaderboardEngine()
@@ -1,23 +1,62 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, WebSocket, status
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.responses import StreamingResponse, JSONResponse, ORJSONResponse, Response
 from fastapi.security import OAuth2PasswordRequestForm
-from typing import List
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from datetime import datetime
+from pydantic import ValidationError
 
-from . import models, schemas, crud
+from . import models, schemas, crud, rollups, migrations, export, stats, heatmap, texts, races
+from .compaction import compactor
 from .crud import authenticate_user
-from .database import engine, get_db
-from .auth import create_access_token, get_current_username
+from .config import settings
+from .database import async_engine, get_db, AsyncSessionLocal, pool_stats
+from .auth import create_access_token, get_current_username, get_optional_username, require_admin
+from .word_pool import word_pool, TOP_LISTS
+from .texts import text_pool
+from .passwords import password_hasher, PasswordHashSaturated
+from .response_cache import response_cache
+from .metrics import metrics, MetricsMiddleware, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .profiling import ProfilingMiddleware, slow_queries
+from .write_behind import write_behind, accepted
+from .leaderboard import leaderboards, entry, LEADERBOARD_COLUMNS, METRICS, TIME_MODES
+from .serialization import FORMAT_PATTERN, entries_response, rows_body, rows_response
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with async_engine.begin() as connection:
+        await connection.run_sync(migrations.upgrade)
+    # Журнал проигрывается до загрузки досок и агрегатов, чтобы они учли его результаты
+    if settings.WRITE_BEHIND_ENABLED:
+        await write_behind.start()
+    async with AsyncSessionLocal() as db:
+        await word_pool.load(db)
+        await text_pool.load(db)
+        await db.run_sync(rollups.backfill_if_empty)
+        await leaderboards.load(db)
+    password_hasher.start()
+    races.manager.start()
+    compactor.start()
+    yield
+    await compactor.stop()
+    await races.manager.stop()
+    await write_behind.stop()
+    password_hasher.shutdown()
 
-models.Base.metadata.create_all(bind=engine)
 app = FastAPI(
     title='Sakhatype API',
     version='1.0',
+    lifespan=lifespan,
     swagger_ui_parameters={
         "persistAuthorization": True
     }
 )
 
+# Кэш публичных ответов стоит внутри CORS, чтобы попадания тоже получали CORS-заголовки
+app.middleware('http')(response_cache.middleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -27,6 +66,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+# Метрики снаружи всех остальных middleware: время запроса целиком
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+@app.exception_handler(PasswordHashSaturated)
+async def password_hash_saturated(request: Request, exc: PasswordHashSaturated):
+    return JSONResponse(
+        status_code=503,
+        content={'detail': 'Too many login attempts in progress, try again later'},
+        headers={'Retry-After': '1'}
+    )
+
+@app.get('/metrics', include_in_schema=False)
+async def get_metrics():
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail='Metrics are disabled')
+    return Response(metrics.render(), media_type=METRICS_CONTENT_TYPE)
 
 @app.get("/")
 async def hello():
@@ -34,18 +93,18 @@ async def hello():
 
 # Auth endpoints
 @app.post('/api/auth/register')
-def register(user: schemas.User, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_username(db, user.username)
+async def register(user: schemas.User, db: AsyncSession = Depends(get_db)):
+    db_user = await crud.get_user_by_username(db, user.username)
     if db_user:
         raise HTTPException(
             status_code=400,
             detail=f'User with username {user.username} already exists'
         )
-    return crud.create_user(db, user)
+    return await crud.create_user(db, user)
 
 @app.post('/api/auth/login')
-def login(user: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    db_user = authenticate_user(db, user.username, user.password)
+async def login(user: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    db_user = await authenticate_user(db, user.username, user.password)
     if not db_user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -55,46 +114,303 @@ def login(user: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get
     access_token = create_access_token(user.username)
     return {'access_token': access_token, 'token_type': 'bearer', 'username': user.username}
 
-@app.get('/api/users/me')
-def get_current_user_info(username: str = Depends(get_current_username), db: Session = Depends(get_db)):
-    user = crud.get_user_profile(db, username)
+# Строка пользователя; FastAPI сам кэширует зависимость в пределах запроса
+async def get_current_user(
+    username: str = Depends(get_current_username),
+    db: AsyncSession = Depends(get_db)
+):
+    user = await crud.get_user_by_username(db, username)
     if not user:
         raise HTTPException(status_code=404, detail='User not found')
     return user
 
+@app.get('/api/users/me', response_model=schemas.UserProfile)
+async def get_current_user_info(user: models.User = Depends(get_current_user)):
+    return user
+
 # Words endpoint
 @app.get('/api/words')
-def get_words(limit: int = 100, db: Session = Depends(get_db)):
-    return [word[0] for word in crud.get_words(db, limit)]
+async def get_words(
+    limit: int = 100,
+    seed: Optional[int] = None,
+    mode: str = Query('uniform', pattern='^(uniform|adaptive)$'),
+    language: Optional[str] = None,
+    top: Optional[int] = None,
+    username: Optional[str] = Depends(get_optional_username),
+    db: AsyncSession = Depends(get_db)
+):
+    if language is not None and language not in word_pool.languages:
+        raise HTTPException(status_code=400, detail=f'language must be one of {word_pool.languages}')
+    if top is not None and top not in TOP_LISTS:
+        raise HTTPException(status_code=400, detail=f'top must be one of {list(TOP_LISTS)}')
+    if mode == 'uniform':
+        return word_pool.sample(limit, seed, language, top)
+    if username is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Adaptive mode requires authentication',
+            headers={'WWW-Authenticate': 'Bearer'}
+        )
+    weakness = await heatmap.get_letter_weakness(db, username, settings.ADAPTIVE_MIN_ATTEMPTS)
+    return word_pool.sample_adaptive(weakness, limit, seed, settings.ADAPTIVE_WORDS_BOOST, language, top)
+
+@app.post('/api/admin/words/reload', dependencies=[Depends(require_admin)])
+async def reload_words(db: AsyncSession = Depends(get_db)):
+    await word_pool.load(db)
+    return {'words': len(word_pool), 'languages': word_pool.languages}
+
+# Texts endpoints
+@app.get('/api/texts/random', response_model=schemas.TextResponse)
+async def get_random_text(
+    length: str = Query('medium', pattern='^(short|medium|long)$'),
+    language: Optional[str] = None,
+    seed: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    text_id = text_pool.pick(length, language, seed)
+    if text_id is None:
+        raise HTTPException(status_code=404, detail=f'No {length} texts available')
+    return await texts.get_text(db, text_id)
+
+@app.get('/api/texts/{text_id}', response_model=schemas.TextResponse)
+async def get_text(text_id: int, db: AsyncSession = Depends(get_db)):
+    text = await texts.get_text(db, text_id)
+    if not text:
+        raise HTTPException(status_code=404, detail='Text not found')
+    return text
+
+@app.post('/api/admin/texts/reload', dependencies=[Depends(require_admin)])
+async def reload_texts(db: AsyncSession = Depends(get_db)):
+    await text_pool.load(db)
+    return {'texts': len(text_pool)}
+
+@app.get('/api/admin/db/pool', dependencies=[Depends(require_admin)])
+async def get_pool_stats():
+    return pool_stats()
+
+@app.get('/api/admin/passwords', dependencies=[Depends(require_admin)])
+async def get_password_hash_stats():
+    return password_hasher.snapshot()
+
+@app.get('/api/admin/slow-queries', dependencies=[Depends(require_admin)])
+async def get_slow_queries():
+    return {'threshold_ms': settings.SLOW_QUERY_MS, 'queries': slow_queries.snapshot()}
+
+@app.delete('/api/admin/slow-queries', dependencies=[Depends(require_admin)])
+async def clear_slow_queries():
+    slow_queries.clear()
+    return {'cleared': True}
+
+@app.get('/api/admin/write-behind', dependencies=[Depends(require_admin)])
+async def get_write_behind_stats():
+    return write_behind.snapshot()
+
+@app.post('/api/admin/compaction', dependencies=[Depends(require_admin)])
+async def run_compaction():
+    if compactor.hot_days <= 0:
+        raise HTTPException(status_code=409, detail='Compaction is disabled, set RESULTS_HOT_DAYS')
+    report = await compactor.run()
+    return {**report, **compactor.stats}
 
 # Test results endpoints
 @app.post('/api/results', response_model=schemas.TestResultResponse)
-def save_test_result(
+async def save_test_result(
     result: schemas.TestResultCreate, 
+    response: Response,
+    user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    if result.text_id is not None and result.text_id not in text_pool:
+        raise HTTPException(status_code=400, detail=f'Unknown text {result.text_id}')
+    if settings.WRITE_BEHIND_ENABLED:
+        # Принят в журнал; в истории появится после сброса в базу
+        accepted_entry, = await write_behind.submit(user.username, [result])
+        response.status_code = 202
+        return accepted(accepted_entry)
+    return await crud.create_test_result(db, user.username, result)
+
+@app.post('/api/results/batch', response_model=schemas.TestResultBatchResponse)
+async def save_test_results_batch(
+    batch: schemas.TestResultBatch,
     username: str = Depends(get_current_username),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    return crud.create_test_result(db, username, result)
+    if len(batch.results) > settings.RESULTS_BATCH_LIMIT:
+        raise HTTPException(
+            status_code=413,
+            detail=f'Batch is limited to {settings.RESULTS_BATCH_LIMIT} results'
+        )
+    items = []
+    valid = []
+    for index, raw in enumerate(batch.results):
+        try:
+            result = schemas.QueuedTestResult.model_validate(raw)
+        except ValidationError as e:
+            items.append({'index': index, 'status': 'invalid', 'detail': e.errors(include_url=False, include_context=False)})
+            continue
+        if result.text_id is not None and result.text_id not in text_pool:
+            items.append({'index': index, 'status': 'invalid', 'detail': f'Unknown text {result.text_id}'})
+            continue
+        valid.append((index, result))
+    if valid and settings.WRITE_BEHIND_ENABLED:
+        await write_behind.submit(username, [result for _, result in valid])
+        items.extend({'index': index, 'status': 'queued'} for index, _ in valid)
+    elif valid:
+        rows = await crud.create_test_results(db, username, [result for _, result in valid])
+        items.extend(
+            {'index': index, 'status': 'created', 'id': row.id}
+            for (index, _), row in zip(valid, rows)
+        )
+    items.sort(key=lambda item: item['index'])
+    return {
+        'created': sum(item['status'] == 'created' for item in items),
+        'queued': sum(item['status'] == 'queued' for item in items),
+        'items': items
+    }
 
 @app.get('/api/results/user/{username}', response_model=List[schemas.TestResultResponse])
-def get_user_results(username: str, limit: int = 50, db: Session = Depends(get_db)):
-    return crud.get_user_results(db, username, limit)
+async def get_user_results(
+    username: str,
+    limit: int = 50,
+    format: str = Query('json', pattern=FORMAT_PATTERN),
+    db: AsyncSession = Depends(get_db)
+):
+    return rows_response(crud.RESULT_COLUMNS, await crud.get_user_results(db, username, limit), format)
+
+@app.get('/api/results/user/{username}/history', response_model=schemas.TestResultPage)
+async def get_user_results_page(
+    username: str,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    time_mode: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    format: str = Query('json', pattern=FORMAT_PATTERN),
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        items, next_cursor = await crud.get_user_results_page(
+            db, username, limit, cursor, time_mode=time_mode, since=since, until=until
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ORJSONResponse({'items': rows_body(crud.RESULT_COLUMNS, items, format), 'next_cursor': next_cursor})
+
+@app.get('/api/results/user/{username}/export')
+async def export_user_results(
+    username: str,
+    format: str = Query('ndjson', pattern='^(ndjson|csv)$'),
+    db: AsyncSession = Depends(get_db)
+):
+    if not await crud.get_user_by_username(db, username):
+        raise HTTPException(status_code=404, detail='User not found')
+    # Сессия для выгрузки открывается внутри генератора и живет, пока идет ответ
+    return StreamingResponse(
+        export.export_results(AsyncSessionLocal, username, format),
+        media_type=export.MEDIA_TYPES[format],
+        headers={'Content-Disposition': f'attachment; filename="{username}_results.{format}"'}
+    )
 
 @app.get('/api/profile/{username}', response_model=schemas.UserProfile)
-def get_user_profile(username: str, db: Session = Depends(get_db)):
-    user = crud.get_user_profile(db, username)
+async def get_user_profile(username: str, db: AsyncSession = Depends(get_db)):
+    user = await crud.get_user_profile(db, username)
     if not user:
         raise HTTPException(status_code=404, detail='User not found')
     return user
 
+@app.get('/api/profile/{username}/stats', response_model=schemas.UserStatsResponse)
+async def get_user_stats(
+    username: str,
+    points: int = Query(stats.DEFAULT_HISTORY_POINTS, ge=1, le=366),
+    db: AsyncSession = Depends(get_db)
+):
+    if not await crud.get_user_by_username(db, username):
+        raise HTTPException(status_code=404, detail='User not found')
+    return await stats.get_stats(db, username, points)
+
+@app.get('/api/profile/{username}/heatmap', response_model=schemas.UserHeatmapResponse)
+async def get_user_heatmap(
+    username: str,
+    bigrams: int = Query(20, ge=0, le=200),
+    min_attempts: int = Query(5, ge=1),
+    db: AsyncSession = Depends(get_db)
+):
+    if not await crud.get_user_by_username(db, username):
+        raise HTTPException(status_code=404, detail='User not found')
+    return await heatmap.get_heatmap(db, username, bigrams, min_attempts)
+
+# Race endpoints
+@app.get('/api/races')
+async def list_races():
+    return races.manager.snapshot()
+
+@app.websocket('/api/races/{room_id}')
+async def race(
+    websocket: WebSocket,
+    room_id: str,
+    time_mode: int = 30,
+    language: Optional[str] = None,
+    token: Optional[str] = None
+):
+    await races.serve(websocket, room_id, time_mode, language, token)
+
 # Leaderboard endpoints
+async def check_time_mode(time_mode: Optional[int] = None):
+    if time_mode is not None and time_mode not in TIME_MODES:
+        raise HTTPException(status_code=400, detail=f'time_mode must be one of {list(TIME_MODES)}')
+    return time_mode
+
+async def get_leaderboard(metric: str, limit: int, time_mode: Optional[int], period: str, fmt: str, db: AsyncSession):
+    if period == 'all':
+        return entries_response(LEADERBOARD_COLUMNS, leaderboards.top(metric, time_mode, limit), fmt)
+    if period not in rollups.PERIODS:
+        raise HTTPException(status_code=400, detail=f'period must be one of {list(rollups.PERIODS)}')
+    mode = rollups.ALL_TIME_MODES if time_mode is None else time_mode
+    return entries_response(LEADERBOARD_COLUMNS, [
+        entry(metric, score, username, total_tests, best_wpm, best_accuracy, level)
+        for username, score, total_tests, best_wpm, best_accuracy, level
+        in await rollups.get_board(db, metric, mode, period, limit)
+    ], fmt)
+
 @app.get('/api/leaderboard/wpm', response_model=List[schemas.LeaderboardEntry])
-def get_leaderboard_wpm(limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_leaderboard_wpm(db, limit)
+async def get_leaderboard_wpm(
+    limit: int = 100,
+    time_mode: Optional[int] = Depends(check_time_mode),
+    period: str = 'all',
+    format: str = Query('json', pattern=FORMAT_PATTERN),
+    db: AsyncSession = Depends(get_db)
+):
+    return await get_leaderboard('wpm', limit, time_mode, period, format, db)
 
 @app.get('/api/leaderboard/accuracy', response_model=List[schemas.LeaderboardEntry])
-def get_leaderboard_accuracy(limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_leaderboard_accuracy(db, limit)
+async def get_leaderboard_accuracy(
+    limit: int = 100,
+    time_mode: Optional[int] = Depends(check_time_mode),
+    period: str = 'all',
+    format: str = Query('json', pattern=FORMAT_PATTERN),
+    db: AsyncSession = Depends(get_db)
+):
+    return await get_leaderboard('accuracy', limit, time_mode, period, format, db)
+
+@app.get('/api/leaderboard/text/{text_id}', response_model=List[schemas.LeaderboardEntry])
+async def get_text_leaderboard(
+    text_id: int,
+    metric: str = Query('wpm', pattern='^(wpm|accuracy)$'),
+    limit: int = 100,
+    format: str = Query('json', pattern=FORMAT_PATTERN)
+):
+    if text_id not in text_pool:
+        raise HTTPException(status_code=404, detail='Text not found')
+    return entries_response(LEADERBOARD_COLUMNS, leaderboards.top_text(metric, text_id, limit), format)
+
+@app.get('/api/leaderboard/{metric}/rank/{username}', response_model=schemas.LeaderboardRank)
+async def get_leaderboard_rank(metric: str, username: str, time_mode: Optional[int] = Depends(check_time_mode)):
+    if metric not in METRICS:
+        raise HTTPException(status_code=404, detail=f'Unknown leaderboard {metric}')
+    rank = leaderboards.rank(metric, username, time_mode)
+    if rank is None:
+        raise HTTPException(status_code=404, detail='User not found on leaderboard')
+    return rank
 
 if __name__ == '__main__':
     import uvicorn
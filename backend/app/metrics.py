@@ -0,0 +1,238 @@
+from bisect import bisect_left
+from contextvars import ContextVar
+from threading import Lock
+import time
+
+from sqlalchemy import event
+from starlette.routing import Match
+
+from .database import engine, async_engine, pool_stats
+from .passwords import password_hasher
+
+# Метрики в текстовом формате Prometheus без сторонних библиотек.
+# На запрос — один bisect и несколько сложений под блокировкой;
+# маршрут берется по шаблону (/api/profile/{username}), а не по пути,
+# чтобы число рядов не росло с числом пользователей.
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values)) + '}'
+
+def format_value(value: float):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = Lock()
+        # значения меток -> [счетчики по корзинам (не накопленные), сумма, количество]
+        self._series = {}
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            self.observe_locked(value, labels)
+
+    # Для нескольких гистограмм под одной общей блокировкой
+    def observe_locked(self, value: float, labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in sorted(series):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += bucket_count
+                le = bound if bound == '+Inf' else format_value(float(bound))
+                lines.append(f'{self.name}_bucket{format_labels((*self.labels, "le"), (*labels, le))} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.labels, labels)} {format_value(float(total))}')
+            lines.append(f'{self.name}_count{format_labels(self.labels, labels)} {count}')
+        return lines
+
+class Gauge:
+    def __init__(self, name: str, help: str, labels=(), kind: str = 'gauge'):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.kind = kind
+        self._lock = Lock()
+        self._values = {}
+
+    def inc(self, amount: float = 1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, amount: float = 1, *labels):
+        self.inc(-amount, *labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f'{self.name}{format_labels(self.labels, labels)} {format_value(value)}' for labels, value in values)
+        return lines
+
+# Готовые гистограммы из других модулей (корзины не накопленные, как в
+# HashStats и PoolStats) в формате Prometheus
+def render_buckets(name: str, labels: dict, buckets: dict, total: float):
+    lines = []
+    cumulative = 0
+    names, values = tuple(labels), tuple(labels.values())
+    for bound, count in buckets.items():
+        cumulative += count
+        lines.append(f'{name}_bucket{format_labels((*names, "le"), (*values, bound))} {cumulative}')
+    lines.append(f'{name}_sum{format_labels(names, values)} {format_value(float(total))}')
+    lines.append(f'{name}_count{format_labels(names, values)} {cumulative}')
+    return lines
+
+# Запросы к базе в рамках текущего HTTP-запроса: [количество, секунды]
+current_queries = ContextVar('current_queries', default=None)
+
+class Metrics:
+    def __init__(self):
+        # Общая блокировка метрик запроса: одна на запрос вместо трех
+        self._request_lock = Lock()
+        self.request_duration = Histogram(
+            'sakhatype_http_request_duration_seconds', 'HTTP request latency by route template',
+            ('method', 'route', 'status')
+        )
+        self.in_flight = Gauge('sakhatype_http_requests_in_flight', 'HTTP requests being processed')
+        self.request_queries = Histogram(
+            'sakhatype_db_queries_per_request', 'Database queries executed per HTTP request',
+            ('route',), QUERY_COUNT_BUCKETS
+        )
+        self.request_query_time = Histogram(
+            'sakhatype_db_query_seconds_per_request', 'Time spent in database queries per HTTP request',
+            ('route',)
+        )
+        self.queries = Gauge('sakhatype_db_queries_total', 'Database queries executed', ('engine',), kind='counter')
+        self.query_time = Gauge('sakhatype_db_query_seconds_total', 'Time spent in database queries', ('engine',), kind='counter')
+        self.collectors = []
+
+    # Снимки других подсистем (пароли, пул соединений) добавляются при рендере
+    def collector(self, fn):
+        self.collectors.append(fn)
+        return fn
+
+    def instrument_engine(self, engine, name: str):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            context._metrics_started = time.perf_counter()
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - context._metrics_started
+            self.queries.inc(1, name)
+            self.query_time.inc(elapsed, name)
+            queries = current_queries.get()
+            if queries is not None:
+                queries[0] += 1
+                queries[1] += elapsed
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, queries):
+        with self._request_lock:
+            self.request_duration.observe_locked(seconds, (method, route, str(status)))
+            self.request_queries.observe_locked(queries[0], (route,))
+            self.request_query_time.observe_locked(queries[1], (route,))
+
+    def render(self):
+        lines = []
+        with self._request_lock:
+            for metric in (self.request_duration, self.request_queries, self.request_query_time):
+                lines.extend(metric.render())
+        for metric in (self.in_flight, self.queries, self.query_time):
+            lines.extend(metric.render())
+        for collect in self.collectors:
+            lines.extend(collect())
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+metrics.instrument_engine(async_engine.sync_engine, 'async')
+metrics.instrument_engine(engine, 'sync')
+
+@metrics.collector
+def password_hash_metrics():
+    snapshot = password_hasher.snapshot()
+    name = 'sakhatype_password_hash_duration_seconds'
+    lines = [f'# HELP {name} Argon2 hash and verify latency, including queueing', f'# TYPE {name} histogram']
+    for operation, buckets in snapshot['latency_buckets'].items():
+        lines.extend(render_buckets(name, {'operation': operation}, buckets, snapshot['latency_seconds_total'][operation]))
+    lines += [
+        '# HELP sakhatype_password_hash_queued Argon2 tasks waiting for a worker',
+        '# TYPE sakhatype_password_hash_queued gauge',
+        f'sakhatype_password_hash_queued {snapshot["queued"]}',
+        '# HELP sakhatype_password_hash_rejected_total Logins rejected because the hashing queue was full',
+        '# TYPE sakhatype_password_hash_rejected_total counter',
+        f'sakhatype_password_hash_rejected_total {snapshot["rejected"]}',
+    ]
+    return lines
+
+@metrics.collector
+def pool_metrics():
+    name = 'sakhatype_db_pool_wait_seconds'
+    lines = [f'# HELP {name} Time spent waiting for a pooled connection', f'# TYPE {name} histogram']
+    checked_out = ['# HELP sakhatype_db_pool_checked_out Connections in use', '# TYPE sakhatype_db_pool_checked_out gauge']
+    for snapshot in pool_stats():
+        lines.extend(render_buckets(name, {'pool': snapshot['pool']}, snapshot['wait_buckets'], snapshot['wait_seconds_total']))
+        if snapshot['checked_out'] is not None:
+            checked_out.append(f'sakhatype_db_pool_checked_out{format_labels(("pool",), (snapshot["pool"],))} {snapshot["checked_out"]}')
+    return lines + checked_out
+
+def route_template(scope):
+    route = scope.get('route')
+    if route is not None:
+        return route.path
+    # Ответ отдан до маршрутизации (например, из кэша): ищем маршрут сами
+    app = scope.get('app')
+    for candidate in getattr(getattr(app, 'router', None), 'routes', ()):
+        match, _ = candidate.matches(scope)
+        if match == Match.FULL:
+            return candidate.path
+    return 'unmatched'
+
+# Чистый ASGI middleware: дешевле BaseHTTPMiddleware и видит ответ целиком,
+# включая попадания в кэш ответов
+class MetricsMiddleware:
+    def __init__(self, app, registry: Metrics = metrics):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        registry = self.registry
+        status = 500
+        queries = [0, 0.0]
+        token = current_queries.set(queries)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        registry.in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            registry.in_flight.dec()
+            current_queries.reset(token)
+            registry.observe_request(scope['method'], route_template(scope), status, elapsed, queries)
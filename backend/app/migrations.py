@@ -0,0 +1,148 @@
+from sqlalchemy import Table, Column, Integer, String, DateTime, MetaData, select, update, delete, func, bindparam, inspect
+from sqlalchemy.engine import Connection
+from datetime import datetime
+
+from . import models, stats, heatmap, dictionary, compaction
+
+# Версии схемы. Каждая миграция применяется один раз и записывается в
+# schema_migrations. Первая создает недостающие таблицы по текущим моделям,
+# поэтому последующие шаги должны быть идемпотентными: на новой базе их
+# объекты уже созданы create_all.
+migration_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', migration_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String, nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+def create_tables(connection: Connection):
+    models.Base.metadata.create_all(bind=connection)
+
+def create_missing_indexes(connection: Connection):
+    inspector = inspect(connection)
+    for table in models.Base.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for index in table.indexes:
+            # Индексы по столбцам, которые добавит более поздняя миграция,
+            # создаются вместе с этими столбцами
+            if index.name not in existing and {column.name for column in index.columns} <= columns:
+                index.create(bind=connection)
+
+def add_missing_columns(connection: Connection, table_name: str, *column_names: str):
+    existing = {column['name'] for column in inspect(connection).get_columns(table_name)}
+    table = models.Base.metadata.tables[table_name]
+    for name in column_names:
+        if name in existing:
+            continue
+        column = table.c[name]
+        ddl = f'ALTER TABLE {table_name} ADD COLUMN {name} {column.type.compile(dialect=connection.dialect)}'
+        if column.default is not None and column.default.is_scalar:
+            ddl += f' DEFAULT {column.default.arg!r}'
+        connection.exec_driver_sql(ddl)
+
+def add_user_stat_columns(connection: Connection):
+    # Старые базы создавались, когда в users были только логин и пароль
+    add_missing_columns(
+        connection, 'users',
+        'total_tests', 'total_time_seconds', 'best_wpm', 'best_accuracy',
+        'total_experience', 'level', 'created_at'
+    )
+
+def replace_history_index(connection: Connection):
+    inspector = inspect(connection)
+    if 'ix_test_results_username_created_at' in {index['name'] for index in inspector.get_indexes('test_results')}:
+        connection.exec_driver_sql('DROP INDEX ix_test_results_username_created_at')
+    create_missing_indexes(connection)
+
+def create_user_stats(connection: Connection):
+    create_tables(connection)
+    stats.backfill(connection)
+
+def add_keystroke_column(connection: Connection):
+    add_missing_columns(connection, 'test_results', 'keystrokes')
+
+def create_user_heatmaps(connection: Connection):
+    create_tables(connection)
+    heatmap.rebuild(connection)
+
+def add_word_metadata(connection: Connection):
+    add_missing_columns(connection, 'words', 'language', 'length', 'frequency', 'frequency_rank')
+    words = models.Word.__table__
+    connection.execute(update(words).where(words.c.language.is_(None)).values(language=dictionary.DEFAULT_LANGUAGE))
+    connection.execute(update(words).where(words.c.frequency.is_(None)).values(frequency=0))
+    # Нормализуем уже загруженные слова (NFC, «5» вместо «ҕ» и т. п.)
+    changed = []
+    for word_id, word in connection.execute(select(words.c.id, words.c.word)):
+        normalized = dictionary.normalize_word(word or '')
+        if normalized != word:
+            changed.append({'word_id': word_id, 'normalized': normalized})
+    if changed:
+        connection.execute(
+            update(words).where(words.c.id == bindparam('word_id')).values(word=bindparam('normalized')),
+            changed
+        )
+    connection.execute(delete(words).where(words.c.word.is_(None)))
+    # Дубликаты (в том числе появившиеся после нормализации) — оставляем первое вхождение
+    first = select(func.min(words.c.id)).group_by(words.c.language, words.c.word)
+    connection.execute(delete(words).where(words.c.id.not_in(first)))
+    connection.execute(update(words).values(length=func.length(words.c.word)))
+    for (language,) in connection.execute(select(words.c.language).distinct()).all():
+        dictionary.rank_words(connection, language)
+    create_missing_indexes(connection)
+
+def drop_users_board_indexes(connection: Connection):
+    # Доски читаются из памяти и leaderboard_rollups; индексы по users
+    # только замедляли запись каждого результата
+    for name in ('ix_users_best_wpm_total_tests', 'ix_users_best_accuracy_total_tests'):
+        connection.exec_driver_sql(f'DROP INDEX IF EXISTS {name}')
+
+def create_user_month_stats(connection: Connection):
+    create_tables(connection)
+    compaction.backfill(connection)
+
+def create_texts(connection: Connection):
+    create_tables(connection)
+    add_missing_columns(connection, 'test_results', 'text_id')
+    create_missing_indexes(connection)
+
+MIGRATIONS = [
+    (1, 'initial schema', create_tables),
+    (2, 'user statistics columns', add_user_stat_columns),
+    (3, 'hot query indexes', create_missing_indexes),
+    (4, 'result history keyset indexes', replace_history_index),
+    (5, 'user statistics aggregates', create_user_stats),
+    (6, 'keystroke logs', add_keystroke_column),
+    (7, 'user heatmaps', create_user_heatmaps),
+    (8, 'word metadata', add_word_metadata),
+    (9, 'quote texts', create_texts),
+    (10, 'write-behind checkpoints', create_tables),
+    (11, 'monthly result summaries', create_tables),
+    (12, 'drop unused users board indexes', drop_users_board_indexes),
+    (13, 'hot monthly result aggregates', create_user_month_stats),
+]
+
+def applied_versions(connection: Connection):
+    migration_metadata.create_all(bind=connection)
+    return set(connection.scalars(select(schema_migrations.c.version)))
+
+def upgrade(connection: Connection):
+    applied = applied_versions(connection)
+    done = []
+    for version, name, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        migrate(connection)
+        connection.execute(schema_migrations.insert().values(
+            version=version, name=name, applied_at=datetime.utcnow()
+        ))
+        done.append(version)
+    return done
+
+if __name__ == '__main__':
+    from .database import engine
+
+    with engine.begin() as connection:
+        done = upgrade(connection)
+    print(f'Applied migrations: {done}' if done else 'Schema is up to date')
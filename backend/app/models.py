@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, LargeBinary, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import deferred
 from datetime import datetime
 
 Base = declarative_base()
@@ -22,6 +23,35 @@ class Word(Base):
 
     id = Column(Integer, primary_key=True)
     word = Column(String)
+    language = Column(String, default='sah', nullable=False)
+    length = Column(Integer)
+    frequency = Column(Integer, default=0, nullable=False)
+    # 1 — самое частое слово языка; пересчитывается после импорта
+    frequency_rank = Column(Integer)
+
+    __table_args__ = (
+        Index('ix_words_language_word', 'language', 'word', unique=True),
+        Index('ix_words_language_rank', 'language', 'frequency_rank'),
+        Index('ix_words_language_length', 'language', 'length'),
+    )
+
+class Text(Base):
+    __tablename__ = 'texts'
+
+    id = Column(Integer, primary_key=True)
+    # Слова через один пробел — в том виде, в каком текст набирается
+    content = Column(String, nullable=False)
+    checksum = Column(String, nullable=False)
+    language = Column(String, default='sah', nullable=False)
+    source = Column(String)
+    length = Column(Integer, nullable=False)
+    word_count = Column(Integer, nullable=False)
+    bucket = Column(String, nullable=False)  # short, medium, long
+
+    __table_args__ = (
+        Index('ix_texts_checksum', 'checksum', unique=True),
+        Index('ix_texts_language_bucket', 'language', 'bucket', 'id'),
+    )
 
 class TestResult(Base):
     __tablename__ = 'test_results'
@@ -36,4 +66,114 @@ class TestResult(Base):
     time_mode = Column(Integer)  # 15, 30, 60 секунд
     test_duration = Column(Integer)  # фактическая длительность
     consistency = Column(Float, default=0.0)  # консистентность печати
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Сжатый журнал нажатий (keystrokes.pack), загружается только по запросу
+    keystrokes = deferred(Column(LargeBinary, nullable=True))
+    # Текст режима цитат; для теста на случайных словах пусто
+    text_id = Column(Integer, ForeignKey('texts.id'), nullable=True)
+
+    __table_args__ = (
+        # Keyset-пагинация истории по (created_at, id), в том числе с фильтром по режиму
+        Index('ix_test_results_user_history', 'username', created_at.desc(), id.desc()),
+        Index('ix_test_results_user_mode_history', 'username', 'time_mode', created_at.desc(), id.desc()),
+    )
+
+class LeaderboardRollup(Base):
+    __tablename__ = 'leaderboard_rollups'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    username = Column(String, ForeignKey('users.username'), nullable=False)
+    time_mode = Column(Integer, nullable=False)  # 0 — все режимы
+    period = Column(String, nullable=False)  # 'all', 'day:2024-01-31', 'week:2024-W05'
+    best_wpm = Column(Float, default=0.0)
+    best_accuracy = Column(Float, default=0.0)
+    tests = Column(Integer, default=0)
+
+    __table_args__ = (
+        UniqueConstraint('username', 'time_mode', 'period'),
+        Index('ix_rollup_board_wpm', 'time_mode', 'period', 'best_wpm'),
+        Index('ix_rollup_board_accuracy', 'time_mode', 'period', 'best_accuracy'),
+    )
+
+class UserStats(Base):
+    __tablename__ = 'user_stats'
+
+    username = Column(String, ForeignKey('users.username'), primary_key=True)
+    time_mode = Column(Integer, primary_key=True)  # 0 — все режимы
+    tests = Column(Integer, default=0)
+    sum_accuracy = Column(Float, default=0.0)
+    sum_consistency = Column(Float, default=0.0)
+    # Среднее и сумма квадратов отклонений WPM (алгоритм Уэлфорда)
+    wpm_mean = Column(Float, default=0.0)
+    wpm_m2 = Column(Float, default=0.0)
+    # Кольцевые буферы последних результатов (float32), позиция — tests % размер
+    recent_wpm = Column(LargeBinary, default=b'')
+    recent_accuracy = Column(LargeBinary, default=b'')
+
+class UserDailyStats(Base):
+    __tablename__ = 'user_daily_stats'
+
+    username = Column(String, ForeignKey('users.username'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    tests = Column(Integer, default=0)
+    sum_wpm = Column(Float, default=0.0)
+    sum_accuracy = Column(Float, default=0.0)
+    best_wpm = Column(Float, default=0.0)
+
+class UserHeatmap(Base):
+    __tablename__ = 'user_heatmaps'
+
+    username = Column(String, ForeignKey('users.username'), primary_key=True)
+    tests = Column(Integer, default=0)  # результатов с журналом нажатий
+    # Сжатые массивы uint32 по буквам и парам букв (heatmap.dump)
+    data = Column(LargeBinary, default=b'')
+
+# Лучший результат пользователя на тексте, обновляется вместе с результатами
+class TextBest(Base):
+    __tablename__ = 'text_bests'
+
+    text_id = Column(Integer, ForeignKey('texts.id'), primary_key=True)
+    username = Column(String, ForeignKey('users.username'), primary_key=True)
+    best_wpm = Column(Float, default=0.0)
+    best_accuracy = Column(Float, default=0.0)
+    tests = Column(Integer, default=0)
+
+# Последний номер записи журнала write-behind, примененной к базе.
+# Обновляется в одной транзакции с результатами, поэтому повторное
+# проигрывание журнала после сбоя не дублирует их
+class WriteBehindState(Base):
+    __tablename__ = 'write_behind_state'
+
+    log = Column(String, primary_key=True)
+    applied_seq = Column(Integer, default=0)
+
+# Горячие (еще не сжатые) результаты по месяцам и корзинам WPM для
+# помесячного ряда. Обновляется вместе с результатами, компакция вычитает
+# из нее то, что переносит в result_summaries
+class UserMonthStats(Base):
+    __tablename__ = 'user_month_stats'
+
+    username = Column(String, ForeignKey('users.username'), primary_key=True)
+    month = Column(Date, primary_key=True)  # первое число месяца
+    wpm_bucket = Column(Integer, primary_key=True)  # compaction.histogram_bucket
+    tests = Column(Integer, default=0)
+    sum_wpm = Column(Float, default=0.0)
+    sum_accuracy = Column(Float, default=0.0)
+    best_wpm = Column(Float, default=0.0)
+
+# Помесячная сводка результатов, вытесненных компакцией из test_results
+class ResultSummary(Base):
+    __tablename__ = 'result_summaries'
+
+    username = Column(String, ForeignKey('users.username'), primary_key=True)
+    month = Column(Date, primary_key=True)  # первое число месяца
+    time_mode = Column(Integer, primary_key=True)
+    tests = Column(Integer, default=0)
+    total_seconds = Column(Integer, default=0)
+    sum_wpm = Column(Float, default=0.0)
+    sum_accuracy = Column(Float, default=0.0)
+    sum_consistency = Column(Float, default=0.0)
+    best_wpm = Column(Float, default=0.0)
+    best_accuracy = Column(Float, default=0.0)
+    # Счетчики uint32 по корзинам WPM шириной compaction.HISTOGRAM_WIDTH
+    wpm_histogram = Column(LargeBinary, default=b'')
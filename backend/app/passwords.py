@@ -0,0 +1,128 @@
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+import asyncio
+import multiprocessing
+import time
+
+from .auth import verify_and_rehash, get_password_hash
+from .config import settings
+
+class PasswordHashSaturated(Exception):
+    pass
+
+class HashStats:
+    LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+    def __init__(self):
+        self._lock = Lock()
+        self.completed = {'hash': 0, 'verify': 0}
+        self.latency_seconds_total = {'hash': 0.0, 'verify': 0.0}
+        self.latency_buckets = {'hash': [0] * (len(self.LATENCY_BUCKETS) + 1), 'verify': [0] * (len(self.LATENCY_BUCKETS) + 1)}
+        self.depth_buckets = [0] * (len(self.DEPTH_BUCKETS) + 1)
+        self.rejected = 0
+        self.rehashed = 0
+
+    def observe_depth(self, depth: int):
+        with self._lock:
+            self.depth_buckets[bisect_left(self.DEPTH_BUCKETS, depth)] += 1
+
+    def observe_latency(self, operation: str, seconds: float):
+        with self._lock:
+            self.completed[operation] += 1
+            self.latency_seconds_total[operation] += seconds
+            self.latency_buckets[operation][bisect_left(self.LATENCY_BUCKETS, seconds)] += 1
+
+    def observe_rejected(self):
+        with self._lock:
+            self.rejected += 1
+
+    def observe_rehashed(self):
+        with self._lock:
+            self.rehashed += 1
+
+    def snapshot(self):
+        latency_labels = [*map(str, self.LATENCY_BUCKETS), '+Inf']
+        with self._lock:
+            return {
+                'completed': dict(self.completed),
+                'rejected': self.rejected,
+                'rehashed': self.rehashed,
+                'latency_seconds_total': dict(self.latency_seconds_total),
+                'latency_buckets': {
+                    operation: dict(zip(latency_labels, buckets))
+                    for operation, buckets in self.latency_buckets.items()
+                },
+                'queue_depth_buckets': dict(zip([*map(str, self.DEPTH_BUCKETS), '+Inf'], self.depth_buckets)),
+            }
+
+# Сервис хэширования паролей: argon2 считается в отдельных процессах
+# (по одному на ядро), поэтому всплеск логинов не занимает event loop и GIL.
+# Очередь ограничена: если задач больше лимита, новая сразу отклоняется,
+# а не ждет, увеличивая задержку для всех.
+class PasswordHasher:
+    def __init__(self, workers: int, queue_limit: int):
+        self.workers = max(1, workers)
+        self.queue_limit = max(0, queue_limit)
+        self.stats = HashStats()
+        self._executor = None
+        self._lock = Lock()
+        self._pending = 0
+
+    def start(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                # Первая задача запускает процессы заранее, а не на первом логине
+                self._executor.submit(int)
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    async def run(self, operation: str, fn, *args):
+        executor = self.start()
+        with self._lock:
+            # В работе у пула workers задач, остальные ждут в очереди
+            if self._pending - self.workers >= self.queue_limit:
+                self.stats.observe_rejected()
+                raise PasswordHashSaturated()
+            self._pending += 1
+            depth = max(0, self._pending - self.workers)
+        self.stats.observe_depth(depth)
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self.stats.observe_latency(operation, time.perf_counter() - started)
+
+    async def hash(self, password: str):
+        return await self.run('hash', get_password_hash, password)
+
+    async def verify(self, password: str, hashed_password: str):
+        verified, new_hash = await self.run('verify', verify_and_rehash, password, hashed_password)
+        if new_hash is not None:
+            self.stats.observe_rehashed()
+        return verified, new_hash
+
+    def snapshot(self):
+        with self._lock:
+            pending = self._pending
+        return {
+            'workers': self.workers,
+            'queue_limit': self.queue_limit,
+            'in_flight': min(pending, self.workers),
+            'queued': max(0, pending - self.workers),
+            **self.stats.snapshot(),
+        }
+
+password_hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE_LIMIT)
@@ -0,0 +1,182 @@
+from collections import Counter, deque
+from datetime import datetime
+from threading import Event, Lock, Thread
+import logging
+import os
+import sys
+import threading
+import time
+
+from sqlalchemy import event
+
+from .auth import is_admin_token
+from .config import settings
+from .database import engine, async_engine
+
+logger = logging.getLogger(__name__)
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAX_STACK_DEPTH = 128
+# Потоки, которые просто ждут работу, в профиль не попадают
+IDLE_FILES = ('threading.py', 'queue.py', 'thread.py')
+
+def short_path(path: str):
+    if 'site-packages' + os.sep in path:
+        return path.rsplit('site-packages' + os.sep, 1)[1]
+    if path.startswith(APP_ROOT):
+        return os.path.relpath(path, APP_ROOT)
+    return os.path.basename(path)
+
+def frame_label(frame, line: int = None):
+    code = frame.f_code
+    return f'{code.co_name} ({short_path(code.co_filename)}:{line or code.co_firstlineno})'
+
+# Семплирующий профайлер: отдельный поток раз в interval снимает стеки всех
+# потоков через sys._current_frames(). В отличие от cProfile видит и поток
+# event loop, и потоки драйвера базы и threadpool, а результат сразу
+# получается в формате collapsed stacks (flamegraph.pl, speedscope).
+# Профиль по настенному времени: ожидание (select в event loop, очередь
+# драйвера) тоже попадает в него; у верхнего кадра указана текущая строка,
+# чтобы ожидание отличалось от работы.
+class StackSampler:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples = Counter()
+        self.total = 0
+        self._stop = Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or os.path.basename(frame.f_code.co_filename) in IDLE_FILES:
+                    continue
+                stack = [frame_label(frame, frame.f_lineno)]
+                frame = frame.f_back
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f'thread-{ident}'))
+                self.samples[';'.join(reversed(stack))] += 1
+                self.total += 1
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+# Профиль запроса: заголовок X-Profile вместе с X-Admin-Token. Ответ
+# обработчика отбрасывается, вместо него возвращаются стеки; исходный
+# статус — в X-Profile-Status. Профиль общий для процесса: параллельные
+# запросы тоже попадут в него, поэтому профилировать лучше на тихом инстансе.
+class ProfilingMiddleware:
+    def __init__(self, app, interval: float = None):
+        self.app = app
+        self.interval = (settings.PROFILING_INTERVAL_MS if interval is None else interval) / 1000
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        headers = dict(scope['headers'])
+        if b'x-profile' not in headers or not is_admin_token(headers.get(b'x-admin-token', b'').decode()):
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def discard(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+        sampler = StackSampler(self.interval).start()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            elapsed = time.perf_counter() - started
+            sampler.stop()
+        body = sampler.collapsed().encode()
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/plain; charset=utf-8'),
+                (b'content-length', str(len(body)).encode()),
+                (b'x-profile-status', str(status).encode()),
+                (b'x-profile-samples', str(sampler.total).encode()),
+                (b'x-profile-duration-ms', f'{elapsed * 1000:.1f}'.encode()),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+EXPLAINED = ('select', 'insert', 'update', 'delete', 'with')
+
+def explain(connection, statement: str, parameters):
+    # План запрашивается на том же соединении сырым курсором драйвера,
+    # поэтому события SQLAlchemy не срабатывают повторно
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.dialect.name == 'sqlite' else 'EXPLAIN '
+    cursor = connection.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return [str(row[-1]) if connection.dialect.name == 'sqlite' else str(row[0]) for row in cursor.fetchall()]
+    except Exception as e:
+        return [f'EXPLAIN failed: {e}']
+    finally:
+        cursor.close()
+
+# Журнал медленных запросов: последние SLOW_QUERY_LOG_SIZE запросов дольше
+# порога с планом выполнения. Быстрые запросы стоят одно сравнение.
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float, size: int):
+        self.threshold = threshold_ms / 1000
+        self.entries = deque(maxlen=size)
+        self._lock = Lock()
+
+    def instrument_engine(self, engine, name: str):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            context._slow_query_started = time.perf_counter()
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - context._slow_query_started
+            if elapsed >= self.threshold:
+                self.record(conn, name, statement, parameters, executemany, elapsed)
+
+    def record(self, connection, engine_name: str, statement: str, parameters, executemany: bool, elapsed: float):
+        plan = None
+        if not executemany and statement.lstrip().lower().startswith(EXPLAINED):
+            plan = explain(connection, statement, parameters)
+        entry = {
+            'at': datetime.utcnow().isoformat(),
+            'engine': engine_name,
+            'duration_ms': round(elapsed * 1000, 2),
+            'statement': statement,
+            'parameters': repr(parameters)[:500],
+            'plan': plan,
+        }
+        with self._lock:
+            self.entries.append(entry)
+        logger.info('Slow query (%.1f ms): %s; plan: %s', elapsed * 1000, ' '.join(statement.split()), plan)
+
+    def snapshot(self):
+        with self._lock:
+            return list(reversed(self.entries))
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+slow_queries = SlowQueryLog(settings.SLOW_QUERY_MS, settings.SLOW_QUERY_LOG_SIZE)
+if settings.SLOW_QUERY_MS > 0:
+    slow_queries.instrument_engine(async_engine.sync_engine, 'async')
+    slow_queries.instrument_engine(engine, 'sync')
@@ -0,0 +1,353 @@
+from collections import deque
+import asyncio
+import json
+import re
+import secrets
+import time
+
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+
+from . import crud, schemas, keystrokes
+from .auth import get_current_username
+from .config import settings
+from .database import AsyncSessionLocal
+from .leaderboard import TIME_MODES
+from .metrics import metrics
+from .word_pool import word_pool
+from .write_behind import write_behind
+
+ROOM_ID = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+WAITING, COUNTDOWN, RACING, FINISHED = 'waiting', 'countdown', 'racing', 'finished'
+# Закрытие WebSocket: нарушение протокола и отказ во входе
+POLICY_VIOLATION = 1008
+
+class RaceError(Exception):
+    pass
+
+def dumps(message: dict):
+    return json.dumps(message, ensure_ascii=False, separators=(',', ':'))
+
+# Исходящие сообщения игрока пишет отдельная задача. Служебные сообщения
+# идут по порядку, а снимок прогресса хранится один: если клиент не успел
+# прочитать прошлый, он получит сразу последний, и медленный клиент не
+# копит очередь и не задерживает рассылку остальным.
+class Player:
+    def __init__(self, websocket: WebSocket, name: str, username: str = None):
+        self.websocket = websocket
+        self.name = name
+        self.username = username
+        self.ready = False
+        self.progress = 0
+        self.result = None
+        self._messages = deque()
+        self._tick = None
+        self._wakeup = asyncio.Event()
+
+    def send(self, message: str):
+        self._messages.append(message)
+        self._wakeup.set()
+
+    def send_tick(self, message: str):
+        self._tick = message
+        self._wakeup.set()
+
+    def close(self):
+        self.send(None)
+
+    async def writer(self):
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self._messages:
+                    message = self._messages.popleft()
+                    if message is None:
+                        # Закрытие прерывает и цикл чтения в serve
+                        await self.websocket.close()
+                        return
+                    await self.websocket.send_text(message)
+                if self._tick is not None:
+                    tick, self._tick = self._tick, None
+                    await self.websocket.send_text(tick)
+        except (WebSocketDisconnect, RuntimeError):
+            return
+
+class Room:
+    def __init__(self, room_id: str, time_mode: int, words):
+        self.id = room_id
+        self.time_mode = time_mode
+        self.words = words
+        self.text = ' '.join(words)
+        self.players = {}
+        self.state = WAITING
+        self.starts_at = None
+        self.ends_at = None
+        self.results_deadline = None
+        self.dirty = False
+
+    def broadcast(self, message: dict):
+        payload = dumps(message)
+        for player in self.players.values():
+            player.send(payload)
+
+    def elapsed(self, now: float):
+        return max(0.0, now - self.starts_at) if self.starts_at is not None else 0.0
+
+    def snapshot(self, now: float):
+        minutes = self.elapsed(now) / 60
+        return {
+            'type': 'tick',
+            't': int(self.elapsed(now) * 1000),
+            # Время отправки по часам сервера — для замера задержки рассылки
+            'sent_at': time.time(),
+            # [имя, символов набрано верно, WPM]
+            'players': [
+                [player.name, player.progress, round(player.progress / 5 / minutes, 1) if minutes else 0.0]
+                for player in self.players.values()
+            ],
+        }
+
+    def standings(self):
+        def score(player):
+            return player.result['wpm'] if player.result else player.progress / 5 / (self.time_mode / 60)
+        return [
+            {
+                'place': place,
+                'name': player.name,
+                'progress': player.progress,
+                'wpm': round(score(player), 2),
+                'accuracy': player.result['accuracy'] if player.result else None,
+                'result_id': player.result['id'] if player.result else None,
+            }
+            for place, player in enumerate(sorted(self.players.values(), key=score, reverse=True), 1)
+        ]
+
+    def summary(self):
+        return {'id': self.id, 'state': self.state, 'time_mode': self.time_mode, 'players': len(self.players)}
+
+# Комнаты живут в памяти процесса. Один общий таймер раз в тик продвигает
+# все комнаты: прогресс от клиентов только записывается в игрока, а
+# рассылается один сериализованный снимок на комнату за тик.
+class RaceManager:
+    def __init__(self, tick_ms: float, countdown: float, room_size: int, min_players: int, result_grace: float):
+        self.tick = tick_ms / 1000
+        self.countdown = countdown
+        self.room_size = room_size
+        self.min_players = min_players
+        self.result_grace = result_grace
+        self.rooms = {}
+        self.connections = 0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        for room in list(self.rooms.values()):
+            self.close_room(room)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            next_tick += self.tick
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            now = loop.time()
+            for room in list(self.rooms.values()):
+                self.advance(room, now)
+
+    def advance(self, room: Room, now: float):
+        if room.state == WAITING and not room.players:
+            del self.rooms[room.id]
+        elif room.state == COUNTDOWN and now >= room.starts_at:
+            room.state = RACING
+            room.broadcast({'type': 'start', 'time_mode': room.time_mode})
+        elif room.state == RACING:
+            if room.dirty:
+                room.dirty = False
+                payload = dumps(room.snapshot(now))
+                for player in room.players.values():
+                    player.send_tick(payload)
+            if now >= room.ends_at:
+                room.state = FINISHED
+                room.results_deadline = now + self.result_grace
+                room.broadcast({'type': 'end'})
+        elif room.state == FINISHED:
+            if now >= room.results_deadline or all(player.result for player in room.players.values()):
+                room.broadcast({'type': 'results', 'standings': room.standings()})
+                self.close_room(room)
+
+    def close_room(self, room: Room):
+        for player in room.players.values():
+            player.close()
+        self.rooms.pop(room.id, None)
+
+    def get_room(self, room_id: str, time_mode: int, language: str = None):
+        room = self.rooms.get(room_id)
+        if room is None:
+            words = word_pool.sample(settings.RACE_WORDS, language=language)
+            room = self.rooms[room_id] = Room(room_id, time_mode, words)
+        return room
+
+    def join(self, room: Room, player: Player):
+        if room.state != WAITING:
+            raise RaceError('Race already started')
+        if len(room.players) >= self.room_size:
+            raise RaceError('Room is full')
+        if player.name in room.players:
+            raise RaceError('Already in this room')
+        room.players[player.name] = player
+        player.send(dumps({
+            'type': 'joined',
+            'room': room.id,
+            'name': player.name,
+            'time_mode': room.time_mode,
+            'words': room.words,
+            'players': list(room.players),
+        }))
+        room.broadcast({'type': 'players', 'players': list(room.players)})
+
+    def leave(self, room: Room, player: Player):
+        if room.players.get(player.name) is not player:
+            return
+        del room.players[player.name]
+        room.dirty = True
+        room.broadcast({'type': 'players', 'players': list(room.players)})
+        if room.state == WAITING:
+            self.maybe_start(room)
+        elif not room.players:
+            self.close_room(room)
+
+    def maybe_start(self, room: Room):
+        players = room.players.values()
+        if len(room.players) >= self.min_players and all(player.ready for player in players):
+            now = asyncio.get_running_loop().time()
+            room.state = COUNTDOWN
+            room.starts_at = now + self.countdown
+            room.ends_at = room.starts_at + room.time_mode
+            room.broadcast({'type': 'countdown', 'starts_in': self.countdown})
+
+    async def handle(self, room: Room, player: Player, message: dict):
+        kind = message.get('type')
+        if kind == 'ready':
+            if room.state == WAITING and not player.ready:
+                player.ready = True
+                self.maybe_start(room)
+        elif kind == 'progress':
+            # Прогресс вне гонки (запоздавший после end) просто не учитывается
+            progress = message.get('chars')
+            if room.state == RACING and isinstance(progress, int):
+                # Не больше, чем можно набрать к этому моменту, и не больше текста
+                elapsed = room.elapsed(asyncio.get_running_loop().time())
+                limit = min(len(room.text), int(keystrokes.MAX_KEYS_PER_SECOND * (elapsed + 1)))
+                player.progress = max(0, min(progress, limit))
+                room.dirty = True
+        elif kind == 'result':
+            if room.state != FINISHED or player.result is not None:
+                raise RaceError('Results are accepted once, after the race ends')
+            player.result = await self.save_result(room, player, message.get('result'))
+        else:
+            raise RaceError(f'Unknown message type {kind!r}')
+
+    async def save_result(self, room: Room, player: Player, raw):
+        # Длительность и режим задает комната, а не клиент
+        try:
+            result = schemas.TestResultCreate.model_validate({
+                **(raw if isinstance(raw, dict) else {}),
+                'time_mode': room.time_mode,
+                'test_duration': room.time_mode,
+            })
+        except ValidationError as e:
+            raise RaceError(f'Invalid result: {e.errors(include_url=False, include_context=False)}')
+        if result.keystrokes is not None and not room.text.startswith(result.keystrokes.text):
+            raise RaceError('Keystroke log does not match the race text')
+        saved = {'id': None, 'wpm': result.wpm, 'accuracy': result.accuracy}
+        if player.username is not None and settings.WRITE_BEHIND_ENABLED:
+            await write_behind.submit(player.username, [result])
+        elif player.username is not None:
+            async with AsyncSessionLocal() as db:
+                saved['id'] = (await crud.create_test_result(db, player.username, result)).id
+        return saved
+
+    def snapshot(self):
+        return [room.summary() for room in self.rooms.values()]
+
+manager = RaceManager(
+    settings.RACE_TICK_MS, settings.RACE_COUNTDOWN_SECONDS, settings.RACE_ROOM_SIZE,
+    settings.RACE_MIN_PLAYERS, settings.RACE_RESULT_GRACE_SECONDS
+)
+
+@metrics.collector
+def race_metrics():
+    return [
+        '# HELP sakhatype_race_connections Open race WebSocket connections',
+        '# TYPE sakhatype_race_connections gauge',
+        f'sakhatype_race_connections {manager.connections}',
+        '# HELP sakhatype_race_rooms Race rooms in memory',
+        '# TYPE sakhatype_race_rooms gauge',
+        f'sakhatype_race_rooms {len(manager.rooms)}',
+    ]
+
+async def authenticate(token: str = None):
+    if token is None:
+        return None
+    try:
+        return await get_current_username(token)
+    except HTTPException:
+        raise RaceError('Invalid token')
+
+# Протокол: клиент шлет {"type": "ready"}, во время гонки
+# {"type": "progress", "chars": N} (верно набранные символы), после "end" —
+# {"type": "result", "result": {...TestResultCreate}}. Сервер шлет joined,
+# players, countdown, start, tick (не чаще RACE_TICK_MS), end и results.
+# Токен передается в query: браузер не дает задать заголовки WebSocket.
+async def serve(websocket: WebSocket, room_id: str, time_mode: int, language: str = None, token: str = None):
+    try:
+        if not ROOM_ID.match(room_id):
+            raise RaceError('Invalid room id')
+        if time_mode not in TIME_MODES:
+            raise RaceError(f'time_mode must be one of {list(TIME_MODES)}')
+        if language is not None and language not in word_pool.languages:
+            raise RaceError(f'language must be one of {word_pool.languages}')
+        username = await authenticate(token)
+    except RaceError as e:
+        await websocket.close(code=POLICY_VIOLATION, reason=str(e))
+        return
+
+    await websocket.accept()
+    player = Player(websocket, username or f'guest-{secrets.token_hex(3)}', username)
+    room = manager.get_room(room_id, time_mode, language)
+    try:
+        manager.join(room, player)
+    except RaceError as e:
+        await websocket.send_text(dumps({'type': 'error', 'detail': str(e)}))
+        await websocket.close(code=POLICY_VIOLATION)
+        return
+
+    manager.connections += 1
+    writer = asyncio.create_task(player.writer())
+    try:
+        while True:
+            text = await websocket.receive_text()
+            try:
+                message = json.loads(text)
+                await manager.handle(room, player, message if isinstance(message, dict) else {})
+            except (ValueError, RaceError) as e:
+                player.send(dumps({'type': 'error', 'detail': str(e)}))
+    # RuntimeError — сокет уже закрыт сервером вместе с комнатой
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        manager.connections -= 1
+        manager.leave(room, player)
+        player.close()
+        await writer
@@ -0,0 +1,138 @@
+from collections import OrderedDict
+from threading import Lock
+from urllib.parse import parse_qsl, urlencode
+import hashlib
+import re
+import time
+
+from fastapi import Request, Response
+
+from .config import settings
+
+# Публичные GET-ответы, которые кэшируются целиком, и теги для их сброса:
+# доски зависят от всех результатов, профиль и результаты — от одного пользователя
+CACHED_ROUTES = [
+    re.compile(r'^/api/leaderboard/'),
+    re.compile(r'^/api/profile/(?P<username>[^/]+)(/stats|/heatmap)?$'),
+    re.compile(r'^/api/results/user/(?P<username>[^/]+)$'),
+]
+LEADERBOARD_TAG = 'leaderboard'
+
+def user_tag(username: str):
+    return f'user:{username}'
+
+def route_tag(path: str):
+    for pattern in CACHED_ROUTES:
+        match = pattern.match(path)
+        if match:
+            username = match.groupdict().get('username')
+            return user_tag(username) if username else LEADERBOARD_TAG
+    return None
+
+# Хранилище реализует подмножество команд Redis (get, set с ex, mget, incr),
+# поэтому вместо него можно передать redis.asyncio.Redis.
+# По умолчанию — LRU в памяти процесса.
+class MemoryBackend:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = Lock()
+
+    async def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    async def set(self, key: str, value: bytes, ex: int = None):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ex if ex else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def mget(self, keys):
+        with self._lock:
+            return [self._counters.get(key) for key in keys]
+
+    async def incr(self, key: str):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+def make_backend():
+    if settings.RESPONSE_CACHE_URL:
+        import redis.asyncio as redis
+        return redis.Redis.from_url(settings.RESPONSE_CACHE_URL)
+    return MemoryBackend(settings.RESPONSE_CACHE_SIZE)
+
+def make_etag(body: bytes):
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+def etag_matches(if_none_match: str, etag: str):
+    if not if_none_match:
+        return False
+    candidates = {candidate.strip().removeprefix('W/') for candidate in if_none_match.split(',')}
+    return '*' in candidates or etag in candidates
+
+# Сброс — не удаление ключей, а увеличение версии тега: версия входит в ключ
+# записи, поэтому старые записи больше не находятся и вытесняются сами.
+# Ответ, посчитанный до сброса и сохраненный после, попадет под старую
+# версию и тоже не будет отдан.
+class ResponseCache:
+    def __init__(self, backend, ttl: int, max_age: int):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_age = max_age
+
+    async def entry_key(self, request: Request, tag: str):
+        (version,) = await self.backend.mget([f'version:{tag}'])
+        query = urlencode(sorted(parse_qsl(request.url.query, keep_blank_values=True)))
+        return f'response:{int(version or 0)}:{request.url.path}?{query}'
+
+    async def invalidate(self, *tags: str):
+        for tag in tags:
+            await self.backend.incr(f'version:{tag}')
+
+    async def invalidate_user(self, username: str, leaderboard: bool = True):
+        await self.invalidate(user_tag(username), *([LEADERBOARD_TAG] if leaderboard else []))
+
+    def respond(self, request: Request, etag: str, media_type: str, body: bytes, status: str):
+        headers = {
+            'ETag': etag,
+            # При max-age 0 браузер и прокси каждый раз переспрашивают с If-None-Match
+            'Cache-Control': f'public, max-age={self.max_age}' if self.max_age else 'public, no-cache',
+            'X-Cache': status,
+        }
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type=media_type, headers=headers)
+
+    async def middleware(self, request: Request, call_next):
+        tag = route_tag(request.url.path) if request.method == 'GET' else None
+        if tag is None:
+            return await call_next(request)
+
+        key = await self.entry_key(request, tag)
+        cached = await self.backend.get(key)
+        if cached is not None:
+            etag, media_type, body = cached.split(b'\n', 2)
+            return self.respond(request, etag.decode(), media_type.decode(), body, 'HIT')
+
+        response = await call_next(request)
+        if response.status_code != 200:
+            return response
+        body = b''.join([chunk async for chunk in response.body_iterator])
+        etag = make_etag(body)
+        media_type = response.headers.get('content-type', 'application/json')
+        await self.backend.set(key, b'\n'.join([etag.encode(), media_type.encode(), body]), ex=self.ttl)
+        return self.respond(request, etag, media_type, body, 'MISS')
+
+response_cache = ResponseCache(make_backend(), settings.RESPONSE_CACHE_TTL, settings.RESPONSE_CACHE_MAX_AGE)
@@ -0,0 +1,132 @@
+from datetime import datetime
+
+from sqlalchemy import select, case
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import models
+
+ALL_TIME_MODES = 0
+PERIODS = ('daily', 'weekly', 'all')
+
+def dialect_insert(db):
+    # INSERT ... ON CONFLICT есть только в диалектных insert().
+    # db — сессия или соединение
+    dialect = db.dialect if isinstance(db, Connection) else db.bind.dialect
+    return postgresql.insert if dialect.name == 'postgresql' else sqlite.insert
+
+def period_key(period: str, moment: datetime):
+    if period == 'daily':
+        return f'day:{moment:%Y-%m-%d}'
+    if period == 'weekly':
+        year, week, _ = moment.isocalendar()
+        return f'week:{year}-W{week:02d}'
+    return 'all'
+
+def result_keys(time_mode: int, created_at: datetime):
+    periods = [period_key(period, created_at) for period in PERIODS]
+    return [(mode, period) for mode in (time_mode, ALL_TIME_MODES) for period in periods]
+
+def merge_results(rows, username, time_mode, wpm, accuracy, created_at):
+    for key in result_keys(time_mode, created_at):
+        row = rows.get((username, *key))
+        if row is None:
+            rows[(username, *key)] = [wpm, accuracy, 1]
+        else:
+            row[0] = max(row[0], wpm)
+            row[1] = max(row[1], accuracy)
+            row[2] += 1
+
+def rollup_mappings(rows):
+    return [
+        {
+            'username': username,
+            'time_mode': time_mode,
+            'period': period,
+            'best_wpm': wpm,
+            'best_accuracy': accuracy,
+            'tests': tests,
+        }
+        for (username, time_mode, period), (wpm, accuracy, tests) in rows.items()
+    ]
+
+# Обновляет сводные строки результатов (день, неделя, всё время; свой режим
+# и все режимы) одним INSERT ... ON CONFLICT в текущей транзакции.
+# Коммит делает вызывающий код. results_by_user — {username: [результаты]}:
+# пачка write-behind обновляет строки всех своих пользователей сразу.
+async def record_results(db: AsyncSession, results_by_user):
+    rows = {}
+    for username, results in results_by_user.items():
+        for result in results:
+            merge_results(rows, username, result.time_mode, result.wpm, result.accuracy, result.created_at)
+    if not rows:
+        return
+    table = models.LeaderboardRollup.__table__
+    statement = dialect_insert(db)(table)
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.username, table.c.time_mode, table.c.period],
+        set_={
+            'best_wpm': case((table.c.best_wpm < statement.excluded.best_wpm, statement.excluded.best_wpm), else_=table.c.best_wpm),
+            'best_accuracy': case((table.c.best_accuracy < statement.excluded.best_accuracy, statement.excluded.best_accuracy), else_=table.c.best_accuracy),
+            'tests': table.c.tests + statement.excluded.tests,
+        }
+    ), rollup_mappings(rows))
+
+async def record_result(db: AsyncSession, username: str, result: models.TestResult):
+    await record_results(db, {username: [result]})
+
+# Разовое заполнение сводной таблицы по уже накопленным результатам.
+def backfill(db: Session, chunk_size: int = 10000):
+    db.query(models.LeaderboardRollup).delete()
+    rows = {}
+    results = db.query(
+            models.TestResult.username,
+            models.TestResult.time_mode,
+            models.TestResult.wpm,
+            models.TestResult.accuracy,
+            models.TestResult.created_at
+        ).yield_per(chunk_size)
+    for username, time_mode, wpm, accuracy, created_at in results:
+        merge_results(rows, username, time_mode, wpm, accuracy, created_at or datetime.utcnow())
+    db.bulk_insert_mappings(models.LeaderboardRollup, rollup_mappings(rows))
+    db.commit()
+    return len(rows)
+
+def backfill_if_empty(db: Session):
+    if db.query(models.LeaderboardRollup.id).first() is not None:
+        return 0
+    if db.query(models.TestResult.id).first() is None:
+        return 0
+    return backfill(db)
+
+def board_query(metric: str, time_mode: int, period: str, limit: int = 100, moment: datetime = None):
+    score = models.LeaderboardRollup.best_wpm if metric == 'wpm' else models.LeaderboardRollup.best_accuracy
+    return select(
+            models.LeaderboardRollup.username,
+            score,
+            models.User.total_tests,
+            models.User.best_wpm,
+            models.User.best_accuracy,
+            models.User.level
+        )\
+        .join(models.User, models.User.username == models.LeaderboardRollup.username)\
+        .where(
+            models.LeaderboardRollup.time_mode == time_mode,
+            models.LeaderboardRollup.period == period_key(period, moment or datetime.utcnow())
+        )\
+        .order_by(score.desc())\
+        .limit(limit)
+
+async def get_board(db: AsyncSession, metric: str, time_mode: int, period: str, limit: int = 100, moment: datetime = None):
+    return (await db.execute(board_query(metric, time_mode, period, limit, moment))).all()
+
+if __name__ == '__main__':
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        print(f'Rollup rows: {backfill(db)}')
+    finally:
+        db.close()
@@ -1,6 +1,8 @@
-from pydantic import BaseModel
-from typing import Optional
-from datetime import datetime
+from pydantic import BaseModel, Field, model_validator
+from typing import Optional, List, Dict, Any
+from datetime import datetime, date
+
+from . import keystrokes
 
 class User(BaseModel):
     username: str
@@ -19,6 +21,73 @@ class UserProfile(BaseModel):
     class Config:
         from_attributes = True
 
+class ModeStats(BaseModel):
+    tests: int
+    avg_wpm: float
+    avg_accuracy: float
+    avg_consistency: float
+    wpm_stddev: float
+    wpm_consistency: float
+    last_10_wpm: Optional[float] = None
+    last_10_accuracy: Optional[float] = None
+    last_100_wpm: Optional[float] = None
+    last_100_accuracy: Optional[float] = None
+
+class HistoryPoint(BaseModel):
+    day: date
+    tests: int
+    avg_wpm: float
+    best_wpm: float
+    avg_accuracy: float
+
+class MonthPoint(BaseModel):
+    month: date
+    tests: int
+    avg_wpm: float
+    best_wpm: float
+    avg_accuracy: float
+    # Число тестов по корзинам WPM шириной 10, последняя — 250 и выше
+    wpm_histogram: List[int]
+
+class UserStatsResponse(BaseModel):
+    username: str
+    overall: ModeStats
+    modes: Dict[int, ModeStats]
+    history: List[HistoryPoint]
+    months: List[MonthPoint] = []
+
+class HeatmapCell(BaseModel):
+    key: str
+    attempts: int
+    errors: int
+    error_rate: float
+    avg_latency_ms: Optional[float] = None
+
+class UserHeatmapResponse(BaseModel):
+    username: str
+    tests: int
+    sakha_letters: str
+    characters: List[HeatmapCell]
+    bigrams: List[HeatmapCell]
+
+class TextResponse(BaseModel):
+    id: int
+    content: str
+    language: str
+    source: Optional[str] = None
+    length: int
+    word_count: int
+    bucket: str
+
+    class Config:
+        from_attributes = True
+
+class KeystrokeLog(BaseModel):
+    # Набираемый текст (слова через пробел) и журнал нажатий в base64,
+    # формат описан в keystrokes.py
+    text: str = Field(max_length=keystrokes.MAX_KEYSTROKES)
+    data: str
+
 class TestResultCreate(BaseModel):
     wpm: float
     raw_wpm: float
@@ -26,11 +95,36 @@ class TestResultCreate(BaseModel):
     burst_wpm: float
     total_errors: int
     time_mode: int
-    test_duration: int
+    test_duration: int = Field(gt=0, le=keystrokes.MAX_TEST_SECONDS)
     consistency: float = 0.0
+    keystrokes: Optional[KeystrokeLog] = None
+    text_id: Optional[int] = None
+
+    @model_validator(mode='after')
+    def replay_keystrokes(self):
+        # С журналом нажатий статистика пересчитывается на сервере,
+        # присланные клиентом значения не используются
+        if self.keystrokes is not None:
+            if self.test_duration != self.time_mode:
+                raise ValueError('test_duration must equal time_mode for a keystroke log')
+            stats = keystrokes.validate(self.keystrokes.data, self.keystrokes.text, self.test_duration)
+            for name, value in stats.items():
+                setattr(self, name, value)
+        return self
+
+# Результат из офлайн-очереди клиента (POST /api/results/batch): единственный
+# путь, где принимается время прохождения теста от клиента (crud.result_time)
+class QueuedTestResult(TestResultCreate):
+    created_at: Optional[datetime] = None
+
+class TestResultBatch(BaseModel):
+    # Элементы проверяются по отдельности, чтобы один битый результат
+    # из очереди клиента не отклонял весь пакет
+    results: List[Dict[str, Any]]
 
 class TestResultResponse(BaseModel):
-    id: int
+    # None, пока результат ждет в журнале write-behind
+    id: Optional[int] = None
     username: str
     wpm: float
     raw_wpm: float
@@ -41,10 +135,26 @@ class TestResultResponse(BaseModel):
     test_duration: int
     consistency: float
     created_at: datetime
+    text_id: Optional[int] = None
 
     class Config:
         from_attributes = True
 
+class BatchItemStatus(BaseModel):
+    index: int
+    status: str  # created | queued | invalid
+    id: Optional[int] = None
+    detail: Optional[Any] = None
+
+class TestResultBatchResponse(BaseModel):
+    created: int
+    queued: int = 0
+    items: List[BatchItemStatus]
+
+class TestResultPage(BaseModel):
+    items: List[TestResultResponse]
+    next_cursor: Optional[str] = None
+
 class LeaderboardEntry(BaseModel):
     username: str
     wpm: Optional[float] = None
@@ -55,4 +165,12 @@ class LeaderboardEntry(BaseModel):
     level: int
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class LeaderboardRank(BaseModel):
+    username: str
+    metric: str
+    time_mode: Optional[int] = None
+    rank: int
+    score: float
+    total: int
\ No newline at end of file
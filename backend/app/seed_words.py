@@ -1,6 +1,9 @@
-from app.database import SessionLocal
-from app.models import Word, Base
-from sqlalchemy import inspect
+from sqlalchemy import select, func
+
+from app import dictionary
+from app.database import engine
+from app.models import Word
+from app.word_pool import word_pool
 
 # Якутские слова для тренировки печати
 SAKHA_WORDS = [
@@ -37,8 +40,10 @@ SAKHA_WORDS = [
     
     # Дополнительные слова
     'туох', 'ханна', 'хас', 'кэм', 'хайдах', 'тугу', 'ким', 'туохха', 'хаһаан', 'хана',
-    
-    # Русские слова (для разнообразия)
+]
+
+# Русские слова (для разнообразия)
+RUSSIAN_WORDS = [
     'мир', 'человек', 'дом', 'земля', 'вода', 'огонь', 'солнце', 'луна', 'звезда', 'небо',
     'лес', 'река', 'гора', 'поле', 'море', 'ветер', 'дождь', 'снег', 'лёд', 'холод',
     'тепло', 'свет', 'тьма', 'день', 'ночь', 'утро', 'вечер', 'год', 'месяц', 'неделя',
@@ -49,26 +54,24 @@ SAKHA_WORDS = [
 ]
 
 def seed_words():
-    db = SessionLocal()
     try:
-        # Проверяем, есть ли уже слова в базе
-        existing_count = db.query(Word).count()
-        if existing_count > 0:
-            print(f"База данных уже содержит {existing_count} слов. Пропускаем заполнение.")
-            return
-        
-        # Добавляем слова
-        for word_text in SAKHA_WORDS:
-            word = Word(word=word_text)
-            db.add(word)
-        
-        db.commit()
-        print(f"Успешно добавлено {len(SAKHA_WORDS)} слов в базу данных.")
+        with engine.begin() as connection:
+            # Проверяем, есть ли уже слова в базе
+            existing_count = connection.scalar(select(func.count(Word.id)))
+            if existing_count > 0:
+                print(f"База данных уже содержит {existing_count} слов. Пропускаем заполнение.")
+                return
+            # Повторы и варианты написания («5» вместо «ҕ») сливает импортер
+            dictionary.import_words(connection, ((word, 1) for word in SAKHA_WORDS), 'sah')
+            dictionary.import_words(connection, ((word, 1) for word in RUSSIAN_WORDS), 'ru')
+            rows = connection.execute(
+                select(Word.word, Word.language).order_by(Word.language, Word.frequency_rank, Word.id)
+            ).all()
+        # Обновляем пул слов, если сидинг запущен внутри процесса сервера
+        word_pool.load_rows(rows)
+        print(f"Успешно добавлено {len(rows)} слов в базу данных.")
     except Exception as e:
         print(f"Ошибка при заполнении базы данных: {e}")
-        db.rollback()
-    finally:
-        db.close()
 
 if __name__ == "__main__":
     seed_words()
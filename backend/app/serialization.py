@@ -0,0 +1,29 @@
+from operator import itemgetter
+
+from fastapi.responses import ORJSONResponse
+
+# Быстрый путь для списков: строки уже в порядке полей схемы ответа
+# (crud.RESULT_COLUMNS, leaderboard.LEADERBOARD_COLUMNS), поэтому
+# pydantic-модель на каждую строку не строится, а orjson кодирует dict и
+# datetime сам. Формат columnar — {столбец: [значения]}: без повторения
+# ключей в каждой строке, сразу в виде рядов для графиков.
+FORMAT_PATTERN = '^(json|columnar)$'
+
+def records(columns, rows):
+    return [dict(zip(columns, row)) for row in rows]
+
+def columnar(columns, rows):
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    return dict(zip(columns, map(list, values)))
+
+def rows_body(columns, rows, fmt: str = 'json'):
+    return columnar(columns, rows) if fmt == 'columnar' else records(columns, rows)
+
+def rows_response(columns, rows, fmt: str = 'json'):
+    return ORJSONResponse(rows_body(columns, rows, fmt))
+
+# Для ответов, которые уже собраны словарями (доски рекордов в памяти)
+def entries_response(columns, entries, fmt: str = 'json'):
+    if fmt == 'columnar':
+        return ORJSONResponse(columnar(columns, list(map(itemgetter(*columns), entries))))
+    return ORJSONResponse(entries)
@@ -0,0 +1,213 @@
+from array import array
+from math import ceil, sqrt
+
+from sqlalchemy import select, insert, case
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .compaction import get_months
+from .rollups import ALL_TIME_MODES, dialect_insert
+
+RECENT_SIZE = 100
+DEFAULT_HISTORY_POINTS = 60
+
+def new_stats(username: str, time_mode: int):
+    return models.UserStats(
+        username=username,
+        time_mode=time_mode,
+        tests=0,
+        sum_accuracy=0.0,
+        sum_consistency=0.0,
+        wpm_mean=0.0,
+        wpm_m2=0.0,
+        recent_wpm=b'',
+        recent_accuracy=b''
+    )
+
+def push_recent(buffer: bytes, position: int, value: float):
+    values = array('f', buffer or b'')
+    if len(values) < RECENT_SIZE:
+        values.append(value)
+    else:
+        values[position % RECENT_SIZE] = value
+    return values.tobytes()
+
+def recent_values(buffer: bytes, tests: int):
+    # Значения от старых к новым
+    values = array('f', buffer or b'')
+    if len(values) < RECENT_SIZE:
+        return values.tolist()
+    start = tests % RECENT_SIZE
+    return (values[start:] + values[:start]).tolist()
+
+def apply_result(stats: models.UserStats, result):
+    position = stats.tests
+    stats.tests += 1
+    stats.sum_accuracy += result.accuracy
+    stats.sum_consistency += result.consistency or 0.0
+    delta = result.wpm - stats.wpm_mean
+    stats.wpm_mean += delta / stats.tests
+    stats.wpm_m2 += delta * (result.wpm - stats.wpm_mean)
+    stats.recent_wpm = push_recent(stats.recent_wpm, position, result.wpm)
+    stats.recent_accuracy = push_recent(stats.recent_accuracy, position, result.accuracy)
+
+def merge_day(days, result):
+    day = days.get(result.created_at.date())
+    if day is None:
+        days[result.created_at.date()] = [1, result.wpm, result.accuracy, result.wpm]
+    else:
+        day[0] += 1
+        day[1] += result.wpm
+        day[2] += result.accuracy
+        day[3] = max(day[3], result.wpm)
+
+def day_mappings(username: str, days):
+    return [
+        {'username': username, 'day': day, 'tests': tests, 'sum_wpm': sum_wpm, 'sum_accuracy': sum_accuracy, 'best_wpm': best_wpm}
+        for day, (tests, sum_wpm, sum_accuracy, best_wpm) in days.items()
+    ]
+
+def stats_mapping(stats: models.UserStats):
+    return {column.name: getattr(stats, column.name) for column in models.UserStats.__table__.columns}
+
+# Обновляет накопительную статистику пользователя в текущей транзакции:
+# строки по режимам (и по всем режимам) плюс дневные корзины для графика.
+# Уэлфорд и кольцевые буферы считаются здесь, поэтому строки сначала
+# создаются пустыми (INSERT ... ON CONFLICT DO NOTHING), а затем читаются
+# под блокировкой: параллельная запись того же пользователя ждет commit,
+# а не затирает обновление. В SQLite блокировку записи берет сам INSERT
+async def record_results(db: AsyncSession, results_by_user):
+    modes = {ALL_TIME_MODES} | {result.time_mode for results in results_by_user.values() for result in results}
+    keys = {
+        (username, mode)
+        for username, results in results_by_user.items()
+        for result in results
+        for mode in (result.time_mode, ALL_TIME_MODES)
+    }
+    if not keys:
+        return
+    await db.execute(
+        dialect_insert(db)(models.UserStats).on_conflict_do_nothing(),
+        [stats_mapping(new_stats(username, mode)) for username, mode in keys]
+    )
+    rows = {
+        (row.username, row.time_mode): row
+        for row in await db.scalars(
+            select(models.UserStats)
+            .where(
+                models.UserStats.username.in_(list(results_by_user)),
+                models.UserStats.time_mode.in_(modes)
+            )
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
+    }
+    mappings = []
+    for username, results in results_by_user.items():
+        days = {}
+        for result in results:
+            for mode in (result.time_mode, ALL_TIME_MODES):
+                apply_result(rows[username, mode], result)
+            merge_day(days, result)
+        mappings.extend(day_mappings(username, days))
+
+    table = models.UserDailyStats.__table__
+    statement = dialect_insert(db)(table)
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.username, table.c.day],
+        set_={
+            'tests': table.c.tests + statement.excluded.tests,
+            'sum_wpm': table.c.sum_wpm + statement.excluded.sum_wpm,
+            'sum_accuracy': table.c.sum_accuracy + statement.excluded.sum_accuracy,
+            'best_wpm': case((table.c.best_wpm < statement.excluded.best_wpm, statement.excluded.best_wpm), else_=table.c.best_wpm),
+        }
+    ), mappings)
+
+def average(values):
+    return sum(values) / len(values) if values else None
+
+def summarize(stats: models.UserStats):
+    wpm = recent_values(stats.recent_wpm, stats.tests)
+    accuracy = recent_values(stats.recent_accuracy, stats.tests)
+    stddev = sqrt(stats.wpm_m2 / stats.tests) if stats.tests else 0.0
+    return {
+        'tests': stats.tests,
+        'avg_wpm': stats.wpm_mean,
+        'avg_accuracy': stats.sum_accuracy / stats.tests if stats.tests else 0.0,
+        'avg_consistency': stats.sum_consistency / stats.tests if stats.tests else 0.0,
+        'wpm_stddev': stddev,
+        # Стабильность скорости между тестами: 100 — все тесты с одинаковым WPM
+        'wpm_consistency': max(0.0, 100.0 * (1 - stddev / stats.wpm_mean)) if stats.wpm_mean else 0.0,
+        'last_10_wpm': average(wpm[-10:]),
+        'last_10_accuracy': average(accuracy[-10:]),
+        'last_100_wpm': average(wpm),
+        'last_100_accuracy': average(accuracy),
+    }
+
+def downsample(days, points: int):
+    # Склеиваем соседние дни, чтобы на графике было не больше points точек
+    size = max(1, ceil(len(days) / max(points, 1)))
+    history = []
+    for start in range(0, len(days), size):
+        bucket = days[start:start + size]
+        tests = sum(day.tests for day in bucket)
+        history.append({
+            'day': bucket[0].day,
+            'tests': tests,
+            'avg_wpm': sum(day.sum_wpm for day in bucket) / tests,
+            'best_wpm': max(day.best_wpm for day in bucket),
+            'avg_accuracy': sum(day.sum_accuracy for day in bucket) / tests,
+        })
+    return history
+
+async def get_stats(db: AsyncSession, username: str, points: int = DEFAULT_HISTORY_POINTS):
+    rows = (await db.scalars(select(models.UserStats).where(models.UserStats.username == username))).all()
+    days = (await db.scalars(
+        select(models.UserDailyStats)
+        .where(models.UserDailyStats.username == username)
+        .order_by(models.UserDailyStats.day)
+    )).all()
+    by_mode = {row.time_mode: summarize(row) for row in rows}
+    return {
+        'username': username,
+        'overall': by_mode.pop(ALL_TIME_MODES, summarize(new_stats(username, ALL_TIME_MODES))),
+        'modes': by_mode,
+        'history': downsample(days, points),
+        'months': await get_months(db, username),
+    }
+
+# Разовый пересчет по накопленным результатам (для миграции)
+def backfill(connection: Connection):
+    # Только нужные столбцы: на этой версии схемы более поздних столбцов еще нет
+    results = connection.execute(
+        select(
+            models.TestResult.username,
+            models.TestResult.time_mode,
+            models.TestResult.wpm,
+            models.TestResult.accuracy,
+            models.TestResult.consistency,
+            models.TestResult.created_at
+        )
+        .order_by(models.TestResult.username, models.TestResult.created_at, models.TestResult.id)
+        .execution_options(yield_per=10000)
+    )
+    username, rows, days = None, {}, {}
+
+    def flush():
+        if rows:
+            connection.execute(insert(models.UserStats), [stats_mapping(row) for row in rows.values()])
+            connection.execute(insert(models.UserDailyStats), day_mappings(username, days))
+
+    for result in results:
+        if result.username != username:
+            flush()
+            username, rows, days = result.username, {}, {}
+        if result.created_at is None:
+            continue
+        for mode in (result.time_mode, ALL_TIME_MODES):
+            if mode not in rows:
+                rows[mode] = new_stats(username, mode)
+            apply_result(rows[mode], result)
+        merge_day(days, result)
+    flush()
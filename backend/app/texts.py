@@ -0,0 +1,195 @@
+from array import array
+from bisect import bisect_left
+import argparse
+import hashlib
+import random
+import sys
+import unicodedata
+
+from sqlalchemy import select, case, func
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .dictionary import DEFAULT_LANGUAGE
+from .rollups import dialect_insert
+
+# Корзины по длине текста в символах: (название, верхняя граница)
+BUCKETS = (('short', 100), ('medium', 300), ('long', None))
+BUCKET_NAMES = tuple(name for name, _ in BUCKETS)
+MAX_TEXT_LENGTH = 2000
+CHUNK_SIZE = 1000
+
+def bucket_for(length: int):
+    for name, limit in BUCKETS:
+        if limit is None or length < limit:
+            return name
+
+# Текст хранится уже разбитым на слова: NFC, пробельные символы схлопнуты
+# в один пробел. Так он совпадает с тем, что набирает пользователь
+# и что приходит в журнале нажатий.
+def normalize_text(raw: str):
+    words = unicodedata.normalize('NFC', raw).split()
+    text = ' '.join(words)
+    if not text or len(text) > MAX_TEXT_LENGTH or any(ord(char) > 0xFFFF for char in text):
+        return None
+    return text
+
+def text_row(text: str, language: str, source: str = None):
+    return {
+        'content': text,
+        'checksum': hashlib.sha256(f'{language}\n{text}'.encode()).hexdigest(),
+        'language': language,
+        'source': source,
+        'length': len(text),
+        'word_count': text.count(' ') + 1,
+        'bucket': bucket_for(len(text)),
+    }
+
+# Отрывки в файле разделены пустыми строками
+def read_passages(lines):
+    passage = []
+    for line in lines:
+        if line.strip():
+            passage.append(line)
+        elif passage:
+            yield ' '.join(passage)
+            passage = []
+    if passage:
+        yield ' '.join(passage)
+
+def insert_chunk(connection: Connection, rows):
+    statement = dialect_insert(connection)(models.Text).on_conflict_do_nothing(index_elements=['checksum'])
+    return connection.execute(statement, rows).rowcount
+
+# Потоковый импорт порциями; повторно загруженные тексты пропускаются по checksum
+def import_texts(connection: Connection, passages, language: str = DEFAULT_LANGUAGE,
+                 source: str = None, chunk_size: int = CHUNK_SIZE):
+    rows = []
+    seen = skipped = 0
+    for raw in passages:
+        seen += 1
+        text = normalize_text(raw)
+        if text is None:
+            skipped += 1
+            continue
+        rows.append(text_row(text, language, source))
+        if len(rows) >= chunk_size:
+            insert_chunk(connection, rows)
+            rows = []
+    if rows:
+        insert_chunk(connection, rows)
+    return {'read': seen, 'skipped': skipped}
+
+# Номера текстов в памяти, по массиву на язык и корзину: случайный текст —
+# случайный индекс в массиве и одно чтение по первичному ключу
+class TextPool:
+    def __init__(self):
+        self._ids = {}
+
+    def __len__(self):
+        return sum(len(ids) for ids in self._ids.values())
+
+    def __contains__(self, text_id: int):
+        for ids in self._ids.values():
+            position = bisect_left(ids, text_id)
+            if position < len(ids) and ids[position] == text_id:
+                return True
+        return False
+
+    def load_rows(self, rows):
+        # rows — (id, language, bucket) по возрастанию id
+        ids = {}
+        for text_id, language, bucket in rows:
+            ids.setdefault((language, bucket), array('Q')).append(text_id)
+        self._ids = ids
+
+    async def load(self, db: AsyncSession):
+        result = await db.stream(
+            select(models.Text.id, models.Text.language, models.Text.bucket)
+            .order_by(models.Text.id)
+            .execution_options(yield_per=10000)
+        )
+        self.load_rows([tuple(row) async for row in result])
+
+    def pick(self, bucket: str, language: str = None, seed: int = None):
+        groups = [
+            ids for (text_language, text_bucket), ids in self._ids.items()
+            if text_bucket == bucket and (language is None or text_language == language)
+        ]
+        total = sum(len(ids) for ids in groups)
+        if not total:
+            return None
+        index = (random.Random(seed) if seed is not None else random).randrange(total)
+        for ids in groups:
+            if index < len(ids):
+                return ids[index]
+            index -= len(ids)
+
+text_pool = TextPool()
+
+async def get_text(db: AsyncSession, text_id: int):
+    return await db.get(models.Text, text_id)
+
+# Лучшие результаты на текстах обновляются одним INSERT ... ON CONFLICT
+# в транзакции результата, как сводные строки досок в rollups
+async def record_results(db: AsyncSession, results_by_user):
+    bests = {}
+    for username, results in results_by_user.items():
+        for result in results:
+            if result.text_id is None:
+                continue
+            best = bests.get((result.text_id, username))
+            if best is None:
+                bests[result.text_id, username] = [result.wpm, result.accuracy, 1]
+            else:
+                best[0] = max(best[0], result.wpm)
+                best[1] = max(best[1], result.accuracy)
+                best[2] += 1
+    if not bests:
+        return
+    table = models.TextBest.__table__
+    statement = dialect_insert(db)(table)
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.text_id, table.c.username],
+        set_={
+            'best_wpm': case((table.c.best_wpm < statement.excluded.best_wpm, statement.excluded.best_wpm), else_=table.c.best_wpm),
+            'best_accuracy': case((table.c.best_accuracy < statement.excluded.best_accuracy, statement.excluded.best_accuracy), else_=table.c.best_accuracy),
+            'tests': table.c.tests + statement.excluded.tests,
+        }
+    ), [
+        {'text_id': text_id, 'username': username, 'best_wpm': wpm, 'best_accuracy': accuracy, 'tests': tests}
+        for (text_id, username), (wpm, accuracy, tests) in bests.items()
+    ])
+
+async def get_text_bests(db: AsyncSession):
+    return (await db.execute(
+        select(models.TextBest.text_id, models.TextBest.username, models.TextBest.best_wpm, models.TextBest.best_accuracy)
+    )).all()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import passages for the quote mode into the texts table')
+    parser.add_argument('path', help="file with passages separated by blank lines, '-' for stdin")
+    parser.add_argument('--language', default=DEFAULT_LANGUAGE)
+    parser.add_argument('--source', help='author or book the passages come from')
+    args = parser.parse_args(argv)
+
+    from .database import engine
+
+    source = sys.stdin if args.path == '-' else open(args.path, encoding='utf-8')
+    try:
+        with engine.begin() as connection:
+            report = import_texts(connection, read_passages(source), args.language, args.source)
+            counts = connection.execute(
+                select(models.Text.bucket, func.count(models.Text.id))
+                .where(models.Text.language == args.language)
+                .group_by(models.Text.bucket)
+            ).all()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    buckets = ', '.join(f'{bucket}: {count}' for bucket, count in sorted(counts))
+    print(f"Read {report['read']} passages, skipped {report['skipped']}; '{args.language}' texts by length: {buckets}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+from array import array
+from bisect import bisect_right
+from itertools import groupby
+import random
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import crud, heatmap
+from .dictionary import DEFAULT_LANGUAGE
+
+# Списки «топ N» самых частых слов языка, которые отдает /api/words
+TOP_LISTS = (200, 1000, 10000)
+
+# Пул слов в памяти: все слова склеены в одну строку, границы слов хранятся
+# в компактном массиве смещений. Выборка не обращается к базе данных.
+# Слова каждого языка лежат подряд в порядке частоты, поэтому язык и «топ N» —
+# это просто диапазоны номеров слов.
+class WordPool:
+    def __init__(self):
+        self._data = self.build('', array('Q', [0]), {})
+
+    def __len__(self):
+        return len(self._data[1]) - 1
+
+    @property
+    def languages(self):
+        return sorted(self._data[4])
+
+    @staticmethod
+    def letter_postings(text: str, offsets):
+        # Признаки слов в разреженном виде: для каждой буквы алфавита heatmap —
+        # номера слов по каждому ее вхождению (группы подряд, границы в starts).
+        # Слово с k вхождениями буквы встречается в ее группе k раз.
+        letters = heatmap.letter_index(np.frombuffer(text.encode('utf-32-le'), dtype='<u4'))
+        lengths = np.diff(np.frombuffer(offsets, dtype=np.uint64)).astype(np.int64)
+        word_ids = np.repeat(np.arange(len(lengths), dtype=np.uint32), lengths)
+        order = np.argsort(letters, kind='stable')
+        starts = np.r_[0, np.cumsum(np.bincount(letters, minlength=heatmap.SIZE))]
+        return word_ids[order], starts
+
+    @classmethod
+    def build(cls, text: str, offsets, ranges):
+        postings, starts = cls.letter_postings(text, offsets)
+        # Внутри группы буквы номера слов возрастают, поэтому для каждой границы
+        # диапазона заранее находим позицию в каждой группе
+        bounds = {0, len(offsets) - 1}
+        for start, end in ranges.values():
+            bounds.update([start, end, *(min(start + top, end) for top in TOP_LISTS)])
+        bounds = np.array(sorted(bounds), dtype=np.int64)
+        return text, offsets, postings, starts, ranges, dict(zip(bounds.tolist(), cls.cut(postings, starts, bounds)))
+
+    @staticmethod
+    def cut(postings, starts, bounds):
+        # Для каждой границы и буквы — сколько вхождений буквы у слов до границы
+        return np.stack([
+            starts[letter] + np.searchsorted(postings[starts[letter]:starts[letter + 1]], bounds)
+            for letter in range(heatmap.SIZE)
+        ], axis=1)
+
+    # rows — пары (слово, язык), слова одного языка подряд
+    def load_rows(self, rows):
+        parts = []
+        offsets = array('Q', [0])
+        ranges = {}
+        position = 0
+        for language, group in groupby(rows, key=lambda row: row[1]):
+            start = len(offsets) - 1
+            for word, _ in group:
+                parts.append(word)
+                position += len(word)
+                offsets.append(position)
+            ranges[language] = (start, len(offsets) - 1)
+        text = ''.join(parts)
+        # Подменяем строку, смещения и признаки одним присваиванием, чтобы
+        # параллельные запросы не увидели наполовину загруженный пул
+        self._data = self.build(text, offsets, ranges)
+
+    def load_words(self, words, language: str = DEFAULT_LANGUAGE):
+        self.load_rows((word, language) for word in words)
+
+    async def load(self, db: AsyncSession):
+        self.load_rows([tuple(row) async for row in await crud.get_all_words(db)])
+
+    @staticmethod
+    def select_ranges(ranges, language: str = None, top: int = None):
+        selected = [ranges[language]] if language is not None else list(ranges.values())
+        if top is not None:
+            selected = [(start, min(start + top, end)) for start, end in selected]
+        return [(start, end) for start, end in selected if end > start]
+
+    def sample(self, limit: int, seed: int = None, language: str = None, top: int = None):
+        text, offsets, _, _, ranges, _ = self._data
+        if language is not None and language not in ranges:
+            return []
+        selected = self.select_ranges(ranges, language, top)
+        sizes = [0]
+        for start, end in selected:
+            sizes.append(sizes[-1] + end - start)
+        limit = min(max(limit, 0), sizes[-1])
+        rng = random.Random(seed) if seed is not None else random
+        words = []
+        # random.sample по range выбирает без повторов за O(limit)
+        for i in rng.sample(range(sizes[-1]), limit):
+            part = bisect_right(sizes, i) - 1
+            word = selected[part][0] + i - sizes[part]
+            words.append(text[offsets[word]:offsets[word + 1]])
+        return words
+
+    # Выборка с весом слова 1 + boost * сумма слабостей его букв (с повторами).
+    # Распределение — смесь равномерного по словам и, для каждой буквы,
+    # равномерного по ее вхождениям, поэтому на запрос нужен только выбор
+    # среди SIZE + 1 компонент бинарным поиском по накопленным весам,
+    # без массивов размером со словарь.
+    def sample_adaptive(self, weakness, limit: int, seed: int = None, boost: float = 4.0,
+                        language: str = None, top: int = None):
+        text, offsets, postings, starts, ranges, cuts = self._data
+        if language is not None and language not in ranges:
+            return []
+        selected = self.select_ranges(ranges, language, top)
+        # Вхождения букв в каждом диапазоне: [диапазон, буква]. Границы
+        # списков TOP_LISTS посчитаны при загрузке, остальные считаются здесь
+        def positions(bounds):
+            known = [cuts.get(bound) for bound in bounds]
+            if any(row is None for row in known):
+                return self.cut(postings, starts, np.array(bounds, dtype=np.int64)).reshape(len(bounds), heatmap.SIZE)
+            return np.array(known).reshape(len(bounds), heatmap.SIZE)
+        first = positions([start for start, _ in selected])
+        counts = positions([end for _, end in selected]) - first
+        word_starts = np.array([start for start, _ in selected], dtype=np.int64)
+        word_sizes = np.array([end - start for start, end in selected], dtype=np.int64)
+        size = int(word_sizes.sum())
+        limit = min(max(limit, 0), size)
+        if limit == 0:
+            return []
+        rng = np.random.default_rng(seed)
+
+        letter_counts = counts.sum(axis=0)
+        cumulative = np.cumsum(np.r_[size, boost * weakness * letter_counts])
+        component = np.searchsorted(cumulative, rng.random(limit) * cumulative[-1], side='right')
+        letter = np.maximum(component - 1, 0)
+
+        # Номер вхождения буквы среди выбранных диапазонов -> позиция в postings
+        occurrence = np.minimum((rng.random(limit) * letter_counts[letter]).astype(np.int64),
+                                np.maximum(letter_counts[letter] - 1, 0))
+        before = np.cumsum(counts, axis=0)[:, letter]
+        part = (before <= occurrence).sum(axis=0)
+        part = np.minimum(part, len(selected) - 1)
+        offset = occurrence - (before[part, np.arange(limit)] - counts[part, letter])
+        position = first[part, letter] + offset
+
+        word = rng.integers(0, size, limit)
+        word_part = np.searchsorted(np.cumsum(word_sizes), word, side='right')
+        uniform = word_starts[word_part] + word - (np.cumsum(word_sizes) - word_sizes)[word_part]
+        picks = np.where(
+            component == 0,
+            uniform,
+            postings[np.minimum(position, max(len(postings) - 1, 0))] if len(postings) else 0
+        )
+        return [text[offsets[i]:offsets[i + 1]] for i in picks.tolist()]
+
+word_pool = WordPool()
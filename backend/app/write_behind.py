@@ -0,0 +1,351 @@
+from datetime import datetime
+from threading import Thread
+import asyncio
+import json
+import logging
+import os
+import queue
+import time
+
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+
+from . import crud, models, schemas
+from .config import settings
+from .database import AsyncSessionLocal
+from .leaderboard import leaderboards
+from .metrics import metrics
+from .response_cache import response_cache
+from .rollups import dialect_insert
+
+logger = logging.getLogger(__name__)
+
+# Запись журнала — JSON-строка [номер, пользователь, created_at, результат]
+def encode_entry(seq: int, username: str, created_at: datetime, result: schemas.TestResultCreate):
+    return json.dumps(
+        [seq, username, created_at.isoformat(), result.model_dump(mode='json')],
+        ensure_ascii=False, separators=(',', ':')
+    ) + '\n'
+
+def read_segment(path: str):
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if not line.endswith('\n'):
+                # Запись, оборванная при сбое: клиент ее подтверждения не получил
+                break
+            seq, username, created_at, result = json.loads(line)
+            yield seq, username, datetime.fromisoformat(created_at), result
+
+# Отложенная запись результатов. Результат подтверждается клиенту, как
+# только он дописан в локальный журнал и журнал сброшен на диск; в базу
+# результаты попадают пачкой раз в WRITE_BEHIND_FLUSH_MS или по
+# WRITE_BEHIND_BATCH штук одной транзакцией; изменения статистики одного
+# пользователя сливаются (crud.add_test_results). Журнал пишет отдельный
+# поток: все записи, накопившиеся за время одного fsync, сбрасываются
+# следующим fsync вместе.
+#
+# Журнал разбит на сегменты path.N. Перед сбросом в базу поток закрывает
+# текущий сегмент и открывает следующий; после commit закрытые сегменты
+# удаляются. Номер последней примененной записи хранится в
+# write_behind_state в той же транзакции, поэтому при старте журнал
+# проигрывается без дублей, даже если процесс упал между commit и
+# удалением сегментов. Журнал принадлежит одному процессу: несколько
+# воркеров должны писать в разные файлы.
+#
+# Если пачка не применяется, ее записи применяются по одной. Запись, которая
+# не применяется и одна (например, результат удаленного пользователя),
+# уходит в path.dead, и applied_seq сдвигается за нее: иначе каждая
+# следующая попытка упиралась бы в нее, а все принятые после нее результаты
+# так и не попали бы в базу. Недоступность базы (OperationalError) так не
+# обрабатывается: пачка остается в очереди целиком.
+class WriteBehind:
+    def __init__(self, path: str, flush_ms: float, batch_size: int, fsync: bool = True, session_factory=AsyncSessionLocal):
+        self.path = os.path.abspath(path)
+        self.name = os.path.basename(self.path)
+        self.interval = flush_ms / 1000
+        self.batch_size = max(1, batch_size)
+        self.fsync = fsync
+        self.session_factory = session_factory
+        self.dead_letter_path = self.path + '.dead'
+        self.seq = 0
+        self.applied = 0
+        self.pending = []
+        self.stats = {'queued': 0, 'flushed': 0, 'flushes': 0, 'failed_flushes': 0, 'replayed': 0, 'dead_letters': 0}
+        self._segment = 0
+        self._file = None
+        self._writes = queue.SimpleQueue()
+        self._thread = None
+        self._loop = None
+        self._wakeup = None
+        self._flusher = None
+        self._stopping = False
+
+    def segment_path(self, number: int):
+        return f'{self.path}.{number}'
+
+    def segments(self):
+        directory = os.path.dirname(self.path)
+        prefix = self.name + '.'
+        return sorted(
+            (int(name[len(prefix):]), os.path.join(directory, name))
+            for name in os.listdir(directory)
+            if name.startswith(prefix) and name[len(prefix):].isdigit()
+        )
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        await self.replay()
+        self._segment += 1
+        self._file = open(self.segment_path(self._segment), 'ab')
+        self._thread = Thread(target=self._write_loop, name='write-behind', daemon=True)
+        self._thread.start()
+        self._flusher = self._loop.create_task(self._flush_loop())
+
+    async def replay(self):
+        async with self.session_factory() as db:
+            applied = await db.scalar(
+                select(models.WriteBehindState.applied_seq).where(models.WriteBehindState.log == self.name)
+            ) or 0
+        segments = self.segments()
+        entries = []
+        for _, path in segments:
+            for seq, username, created_at, raw in read_segment(path):
+                self.seq = max(self.seq, seq)
+                if seq <= applied:
+                    continue
+                try:
+                    entries.append((seq, username, created_at, schemas.TestResultCreate.model_validate(raw)))
+                except ValidationError as e:
+                    logger.error('Skipping write-behind entry %d for %s: %s', seq, username, e)
+        self.seq = max(self.seq, applied)
+        self.applied = applied
+        for start in range(0, len(entries), self.batch_size):
+            await self.apply(entries[start:start + self.batch_size])
+        for _, path in segments:
+            os.remove(path)
+        self._segment = segments[-1][0] if segments else 0
+        self.stats['replayed'] += len(entries)
+        if entries:
+            logger.warning('Replayed %d results from the write-behind log %s', len(entries), self.path)
+
+    async def stop(self):
+        if self._flusher is None:
+            return
+        # Последний сброс делает сам цикл: отмена посреди commit потеряла бы пачку
+        self._stopping = True
+        self._wakeup.set()
+        await self._flusher
+        self._flusher = None
+        await self._command('stop')
+        self._thread.join()
+        self._thread = None
+        if not self.pending:
+            for _, path in self.segments():
+                os.remove(path)
+
+    async def submit(self, username: str, results):
+        if self._thread is None:
+            raise RuntimeError('Write-behind log is not started')
+        now = datetime.utcnow()
+        entries = []
+        for result in results:
+            self.seq += 1
+            entries.append((self.seq, username, crud.result_time(result, now), result))
+        payload = ''.join(encode_entry(*entry) for entry in entries).encode()
+        future = self._loop.create_future()
+        self._writes.put(('write', payload, entries, future))
+        await future
+        return entries
+
+    async def _command(self, command: str):
+        future = self._loop.create_future()
+        self._writes.put((command, None, None, future))
+        await future
+
+    # Ответы потока идут через call_soon_threadsafe по порядку, поэтому все
+    # записи закрытого сегмента оказываются в pending раньше, чем завершится
+    # ротация
+    def _done(self, entries, future, error):
+        if error is None and entries:
+            self.pending.extend(entries)
+            self.stats['queued'] += len(entries)
+            if len(self.pending) >= self.batch_size:
+                self._wakeup.set()
+        if not future.done():
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+    def _sync(self, written):
+        if not written:
+            return
+        error = None
+        try:
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        except OSError as e:
+            error = e
+        for entries, future in written:
+            self._loop.call_soon_threadsafe(self._done, entries, future, error)
+
+    def _write_loop(self):
+        while True:
+            items = [self._writes.get()]
+            while True:
+                try:
+                    items.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            written = []
+            for command, payload, entries, future in items:
+                if command == 'write':
+                    try:
+                        self._file.write(payload)
+                    except OSError as e:
+                        self._loop.call_soon_threadsafe(self._done, None, future, e)
+                        continue
+                    written.append((entries, future))
+                    continue
+                self._sync(written)
+                written = []
+                self._file.close()
+                if command == 'rotate':
+                    self._segment += 1
+                    self._file = open(self.segment_path(self._segment), 'ab')
+                self._loop.call_soon_threadsafe(self._done, None, future, None)
+                if command == 'stop':
+                    return
+            self._sync(written)
+
+    async def _flush_loop(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self.pending:
+                await self.flush()
+        # Последний сброс — после stop, чтобы забрать и пришедшее во время предыдущего
+        await self.flush()
+
+    async def flush(self):
+        await self._command('rotate')
+        batch, self.pending = self.pending, []
+        started = time.perf_counter()
+        done = 0
+        try:
+            while done < len(batch):
+                await self.apply(batch[done:done + self.batch_size])
+                done = min(len(batch), done + self.batch_size)
+        except Exception:
+            # Непримененные записи остаются и в памяти, и в сегментах журнала
+            self.pending[:0] = batch[done:]
+            self.stats['failed_flushes'] += 1
+            logger.exception('Write-behind flush failed, %d results stay queued', len(batch) - done)
+            return
+        for number, path in self.segments():
+            if number < self._segment:
+                os.remove(path)
+        self.stats['flushes'] += 1
+        self.stats['flushed'] += len(batch)
+        if batch:
+            logger.debug('Flushed %d results in %.1f ms', len(batch), (time.perf_counter() - started) * 1000)
+
+    async def apply(self, entries):
+        # Записи, уже примененные по одной до сбоя, повторно не пишутся
+        entries = [entry for entry in entries if entry[0] > self.applied]
+        if not entries:
+            return
+        try:
+            await self.commit(entries)
+        except OperationalError:
+            raise
+        except Exception as e:
+            if len(entries) > 1:
+                for entry in entries:
+                    await self.apply([entry])
+            else:
+                await self.dead_letter(entries[0], e)
+
+    async def dead_letter(self, entry, error: Exception):
+        seq, username = entry[0], entry[1]
+        logger.error('Moving write-behind entry %d for %s to %s: %r', seq, username, self.dead_letter_path, error)
+        await asyncio.to_thread(self._append_dead_letter, encode_entry(*entry).encode())
+        async with self.session_factory() as db:
+            await self.mark_applied(db, seq)
+            await db.commit()
+        self.applied = seq
+        self.stats['dead_letters'] += 1
+
+    def _append_dead_letter(self, payload: bytes):
+        with open(self.dead_letter_path, 'ab') as file:
+            file.write(payload)
+            file.flush()
+            if self.fsync:
+                os.fsync(file.fileno())
+
+    async def mark_applied(self, db, seq: int):
+        table = models.WriteBehindState
+        statement = dialect_insert(db)(table).values(log=self.name, applied_seq=seq)
+        await db.execute(statement.on_conflict_do_update(
+            index_elements=[table.log],
+            set_={'applied_seq': statement.excluded.applied_seq}
+        ))
+
+    async def commit(self, entries):
+        results_by_user = {}
+        for _, username, created_at, result in entries:
+            results_by_user.setdefault(username, []).append((result, created_at))
+        async with self.session_factory() as db:
+            updated = await crud.add_test_results(db, results_by_user)
+            await self.mark_applied(db, entries[-1][0])
+            await db.commit()
+        self.applied = entries[-1][0]
+        for username, (user, rows) in updated.items():
+            if user:
+                for row in rows:
+                    leaderboards.record_result(user, row)
+            await response_cache.invalidate_user(username)
+
+    def snapshot(self):
+        return {
+            'enabled': self._thread is not None,
+            'pending': len(self.pending),
+            'seq': self.seq,
+            'segment': self._segment,
+            **self.stats,
+        }
+
+# Ответ на принятый, но еще не записанный в базу результат: id появится после сброса
+def accepted(entry):
+    _, username, created_at, result = entry
+    return {**result.model_dump(exclude={'keystrokes'}), 'id': None, 'username': username, 'created_at': created_at}
+
+write_behind = WriteBehind(
+    settings.WRITE_BEHIND_LOG, settings.WRITE_BEHIND_FLUSH_MS, settings.WRITE_BEHIND_BATCH, settings.WRITE_BEHIND_FSYNC
+)
+
+@metrics.collector
+def write_behind_metrics():
+    snapshot = write_behind.snapshot()
+    return [
+        '# HELP sakhatype_write_behind_pending Results acknowledged but not yet written to the database',
+        '# TYPE sakhatype_write_behind_pending gauge',
+        f'sakhatype_write_behind_pending {snapshot["pending"]}',
+        '# HELP sakhatype_write_behind_flushed_total Results written to the database by the flusher',
+        '# TYPE sakhatype_write_behind_flushed_total counter',
+        f'sakhatype_write_behind_flushed_total {snapshot["flushed"]}',
+        '# HELP sakhatype_write_behind_failed_flushes_total Flushes that failed and were retried',
+        '# TYPE sakhatype_write_behind_failed_flushes_total counter',
+        f'sakhatype_write_behind_failed_flushes_total {snapshot["failed_flushes"]}',
+        '# HELP sakhatype_write_behind_dead_letters_total Results that could not be applied and were moved to the dead-letter file',
+        '# TYPE sakhatype_write_behind_dead_letters_total counter',
+        f'sakhatype_write_behind_dead_letters_total {snapshot["dead_letters"]}',
+    ]
@@ -0,0 +1,51 @@
+"""Адаптивная выборка слов по слабым буквам пользователя на словаре в 1M слов.
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_adaptive_words
+"""
+import random
+import time
+
+import numpy as np
+
+from app import heatmap
+from app.word_pool import WordPool
+
+SIZE = 1_000_000
+LIMIT = 200
+REPEAT = 2000
+ALPHABET = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюяҕҥөһү'
+
+def measure(fn):
+    fn()
+    started = time.perf_counter()
+    for _ in range(REPEAT):
+        fn()
+    return (time.perf_counter() - started) / REPEAT
+
+def main():
+    rng = random.Random(1)
+    words = [''.join(rng.choices(ALPHABET, k=rng.randint(2, 10))) for _ in range(SIZE)]
+    pool = WordPool()
+    started = time.perf_counter()
+    pool.load_words(words)
+    load_time = time.perf_counter() - started
+    _, _, postings, starts, _, _ = pool._data
+
+    weakness = np.zeros(heatmap.SIZE)
+    for letter in heatmap.SAKHA_LETTERS:
+        weakness[heatmap.ALPHABET.index(letter)] = 1.5
+
+    uniform = measure(lambda: pool.sample(LIMIT))
+    adaptive = measure(lambda: pool.sample_adaptive(weakness, LIMIT))
+    sample = pool.sample_adaptive(weakness, 10_000, seed=1)
+    share = sum(any(letter in word for letter in heatmap.SAKHA_LETTERS) for word in sample) / len(sample)
+    baseline = sum(any(letter in word for letter in heatmap.SAKHA_LETTERS) for word in words[:10_000]) / 10_000
+
+    print(f'words: {SIZE}, load with features: {load_time:.2f} s, '
+          f'features: {(postings.nbytes + starts.nbytes) / 2**20:.1f} MiB')
+    print(f'{LIMIT} words uniform: {uniform * 1e6:.0f} us, adaptive: {adaptive * 1e6:.0f} us')
+    print(f'words with Sakha letters: {baseline:.0%} of dictionary, {share:.0%} of adaptive sample')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""Накладные расходы аутентификации на запрос: проверка JWT на каждый запрос
+против LRU проверенных токенов при 10 000 активных токенов.
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_auth
+"""
+import asyncio
+import random
+import time
+
+from app import auth
+
+ACTIVE_TOKENS = 10_000
+REQUESTS = 100_000
+
+def measure(tokens, cache_size):
+    auth.token_cache = auth.TokenCache(cache_size)
+    order = random.Random(0).choices(tokens, k=REQUESTS)
+
+    async def run():
+        for token in order:
+            await auth.get_current_username(token)
+
+    started = time.perf_counter()
+    asyncio.run(run())
+    return (time.perf_counter() - started) / REQUESTS
+
+def main():
+    tokens = [auth.create_access_token(f'user{i}') for i in range(ACTIVE_TOKENS)]
+    print(f'{"mode":>22} {"us/request":>11}')
+    no_cache = measure(tokens, 0)
+    print(f'{"jwt.decode every time":>22} {no_cache * 1e6:>11.2f}')
+    cached = measure(tokens, ACTIVE_TOKENS * 2)
+    print(f'{"token cache":>22} {cached * 1e6:>11.2f}')
+    print(f'speedup: {no_cache / cached:.1f}x, cache entries: {len(auth.token_cache)}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Компакция test_results: скорость и длительность транзакций по пачкам.
+
+Заполняет SQLite-базу синтетическими результатами за --days дней
+(bench_rollups.generate), затем сжимает все, что старше --hot-days, в
+помесячные сводки (с архивом при --archive). Длительность транзакции пачки
+и есть время, на которое компакция забирает блокировку записи; с --archive
+в нее входит и запись архива, которая идет до захвата блокировки. В конце
+сравнивается чтение первой страницы истории и помесячного ряда до и после.
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_compaction --results 2000000 --users 20000 --batch 2000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app import archive, compaction, crud, migrations, models
+from app.compaction import Compactor
+from benchmarks.bench_rollups import generate
+from benchmarks.load_test import percentile
+
+async def reads(sessions, users, repeat=200):
+    async with sessions() as db:
+        started = time.perf_counter()
+        for i in range(repeat):
+            await crud.get_user_results_page(db, f'user{i % users}', 50)
+        history = (time.perf_counter() - started) / repeat
+        started = time.perf_counter()
+        for i in range(repeat):
+            await compaction.get_months(db, f'user{i % users}')
+        months = (time.perf_counter() - started) / repeat
+    return history, months
+
+async def run(path, directory, args):
+    async_engine = create_async_engine(f'sqlite+aiosqlite:///{path}')
+    sessions = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    results = archive.ResultArchive(os.path.join(directory, 'archive')) if args.archive else None
+    archive.result_archive = results
+    before = await reads(sessions, args.users)
+
+    job = Compactor(args.hot_days, args.batch, 3600, 0, results, sessions)
+    durations = []
+    compact_batch = job.compact_batch
+
+    async def timed(*args):
+        started = time.perf_counter()
+        done, last_id = await compact_batch(*args)
+        if done:
+            durations.append(time.perf_counter() - started)
+        return done, last_id
+
+    job.compact_batch = timed
+    started = time.perf_counter()
+    report = await job.run()
+    elapsed = time.perf_counter() - started
+    after = await reads(sessions, args.users)
+    await async_engine.dispose()
+
+    print(f'compacted {report["compacted"]} results older than {report["cutoff"]:%Y-%m-%d} in {elapsed:.1f} s '
+          f'({report["compacted"] / elapsed:.0f} rows/s), {len(durations)} batches')
+    print(f'batch transaction: p50 {percentile(durations, 0.5) * 1e3:.1f} ms, '
+          f'p99 {percentile(durations, 0.99) * 1e3:.1f} ms, max {max(durations, default=0) * 1e3:.1f} ms')
+    print(f'history page: {before[0] * 1e3:.2f} ms before, {after[0] * 1e3:.2f} ms after')
+    print(f'monthly series: {before[1] * 1e3:.2f} ms before, {after[1] * 1e3:.2f} ms after')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--results', type=int, default=500000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--hot-days', type=int, default=30)
+    parser.add_argument('--batch', type=int, default=2000)
+    parser.add_argument('--archive', action='store_true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'compaction.db')
+        engine = create_engine(f'sqlite:///{path}')
+        with engine.begin() as connection:
+            migrations.upgrade(connection)
+        generate(engine, args.users, args.results, args.days, seed=1)
+        with engine.begin() as connection:
+            compaction.backfill(connection)
+        asyncio.run(run(path, directory, args))
+        with engine.connect() as connection:
+            hot = connection.scalar(select(func.count(models.TestResult.id)))
+            summaries = connection.scalar(select(func.count()).select_from(models.ResultSummary))
+        print(f'hot rows left: {hot}, summary rows: {summaries}')
+        engine.dispose()
+
+if __name__ == '__main__':
+    main()
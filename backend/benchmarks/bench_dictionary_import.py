@@ -0,0 +1,55 @@
+"""Импорт словаря: 1M строк TSV (с повторами и вариантами написания) в SQLite
+порциями через executemany. Память процесса не должна расти с размером файла.
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_dictionary_import
+"""
+import os
+import random
+import resource
+import tempfile
+import time
+
+from sqlalchemy import create_engine, select, func
+
+from app import dictionary, migrations, models
+
+LINES = 1_000_000
+VOCABULARY = 300_000
+ALPHABET = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюяҕҥөһү5'
+
+def write_corpus(path):
+    # Слово выводится из своего номера, чтобы генератор сам не держал словарь
+    # в памяти; частые номера встречаются чаще (примерно по Ципфу)
+    rng = random.Random(1)
+    with open(path, 'w', encoding='utf-8') as f:
+        for _ in range(LINES):
+            word_rng = random.Random(int(VOCABULARY * rng.random() ** 3))
+            word = ''.join(word_rng.choices(ALPHABET, k=word_rng.randint(2, 12)))
+            f.write(f'{word.upper() if rng.random() < 0.1 else word}\t{rng.randint(1, 100)}\n')
+
+def peak_rss_mib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = os.path.join(tmp, 'corpus.tsv')
+        write_corpus(corpus)
+        engine = create_engine(f'sqlite:///{os.path.join(tmp, "words.db")}')
+        with engine.begin() as connection:
+            migrations.upgrade(connection)
+        before = peak_rss_mib()
+
+        started = time.perf_counter()
+        with engine.begin() as connection, open(corpus, encoding='utf-8') as source:
+            report = dictionary.import_words(connection, dictionary.read_tsv(source))
+            words = connection.scalar(select(func.count(models.Word.id)))
+        elapsed = time.perf_counter() - started
+
+        print(f'lines: {report["read"]}, skipped: {report["skipped"]}, unique words: {words}')
+        print(f'import: {elapsed:.2f} s ({report["read"] / elapsed / 1e3:.0f}k lines/s), '
+              f'peak RSS: {before:.0f} MiB before, {peak_rss_mib():.0f} MiB after')
+        engine.dispose()
+
+if __name__ == '__main__':
+    main()
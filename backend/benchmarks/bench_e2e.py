@@ -0,0 +1,462 @@
+"""Сквозной бенчмарк API: задержки и пропускная способность каждого эндпоинта.
+
+Готовит синтетическую SQLite-базу (пользователи с паролем «password»,
+миллионы результатов со сводными таблицами, большой словарь и тексты
+режима цитат) и кэширует ее в --data-dir по параметрам генерации. Каждый
+прогон идет на свежей копии этой базы, поэтому прогоны сравнимы между собой.
+
+Сценарии:
+    sweep — по очереди каждый эндпоинт main.py (--requests запросов);
+    mix   — реалистичная смесь на --duration секунд: слова, сохранение
+            результатов, профили, доски и всплески логинов.
+WebSocket гонок здесь не меряется, для него есть benchmarks.race_load.
+
+Приложение вызывается в том же процессе через httpx.ASGITransport (клиент и
+сервер делят ядро и цикл событий), поднимается в uvicorn (--spawn) или
+берется уже запущенное (--url; база — из --seed-only, те же параметры
+генерации). Итог печатается таблицей и пишется в JSON (--output); с
+--compare сравнивается с прошлым JSON, при регрессии код выхода 1.
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_e2e --results 2000000 --scenario mix --output e2e.json
+    python -m benchmarks.bench_e2e --scenario sweep --spawn --compare e2e.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import secrets
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+from benchmarks.load_test import RESULT, percentile, spawn_server
+
+PASSWORD = 'password'
+LOGIN_BURST = 'POST /api/auth/login (burst)'
+
+USER_TOTALS = '''
+UPDATE users SET
+    total_tests = totals.tests, total_time_seconds = totals.seconds,
+    best_wpm = totals.wpm, best_accuracy = totals.accuracy,
+    total_experience = totals.experience, level = 1 + totals.experience / 1000
+FROM (
+    SELECT username, count(*) AS tests, sum(test_duration) AS seconds, max(wpm) AS wpm,
+           max(accuracy) AS accuracy, sum(CAST(wpm + accuracy AS INTEGER)) AS experience
+    FROM test_results GROUP BY username
+) AS totals
+WHERE users.username = totals.username
+'''
+
+def synthetic_words(count, seed):
+    from benchmarks.bench_dictionary_import import ALPHABET
+
+    rng = random.Random(seed)
+    for _ in range(count):
+        # Частоты с длинным хвостом, как у настоящего корпуса
+        yield ''.join(rng.choices(ALPHABET, k=rng.randint(2, 12))), int(1e6 * rng.random() ** 4) + 1
+
+def synthetic_passages(count, seed):
+    rng = random.Random(seed)
+    vocabulary = [word for word, _ in synthetic_words(5000, seed)]
+    for _ in range(count):
+        yield ' '.join(rng.choices(vocabulary, k=rng.randint(10, 120))) + '.'
+
+def dataset_path(args):
+    name = f'e2e-{args.users}u-{args.results}r-{args.days}d-{args.words}w-{args.texts}t-{args.seed}.db'
+    return os.path.join(args.data_dir, name)
+
+# Все импорты app — внутри функций: config и database читают окружение при
+# импорте, а DATABASE_URL и прочее выставляются в main
+def seed(path, args):
+    from sqlalchemy import create_engine, update
+
+    from app import dictionary, migrations, models, stats, texts
+    from app.auth import get_password_hash
+    from benchmarks.bench_rollups import generate
+
+    started = time.perf_counter()
+    partial = path + '.partial'
+    if os.path.exists(partial):
+        os.remove(partial)
+    engine = create_engine(f'sqlite:///{partial}')
+    with engine.begin() as connection:
+        migrations.upgrade(connection)
+    generate(engine, args.users, args.results, args.days, args.seed)
+    with engine.begin() as connection:
+        # Один хэш на всех: argon2 на каждого пользователя занял бы часы
+        connection.execute(update(models.User).values(password=get_password_hash(PASSWORD)))
+        connection.exec_driver_sql(USER_TOTALS)
+        stats.backfill(connection)
+        dictionary.import_words(connection, synthetic_words(args.words, args.seed))
+        texts.import_texts(connection, synthetic_passages(args.texts, args.seed), source='bench')
+    engine.dispose()
+    os.replace(partial, path)
+    print(f'seeded {path} in {time.perf_counter() - started:.0f} s')
+
+def text_ids(path):
+    from sqlalchemy import create_engine, select
+
+    from app import models
+
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.connect() as connection:
+        ids = connection.scalars(select(models.Text.id)).all()
+    engine.dispose()
+    return ids
+
+class Context:
+    def __init__(self, users, tokens, texts, admin_token, rng):
+        self.users = users
+        self.tokens = tokens
+        self.texts = texts
+        self.admin = {'X-Admin-Token': admin_token or ''}
+        # Имена регистрируемых пользователей не должны повторяться между прогонами
+        self.tag = secrets.token_hex(3)
+        self.registered = itertools.count()
+        self.rng = rng
+
+    def user(self):
+        return f'user{self.rng.randrange(self.users)}'
+
+    def auth(self):
+        username, token = self.rng.choice(self.tokens)
+        return username, {'Authorization': f'Bearer {token}'}
+
+def result_body(ctx):
+    wpm = round(ctx.rng.uniform(30, 120), 2)
+    return {**RESULT, 'wpm': wpm, 'raw_wpm': wpm + 5, 'burst_wpm': wpm + 10, 'accuracy': round(ctx.rng.uniform(85, 100), 2)}
+
+def login(ctx):
+    return 'POST', '/api/auth/login', {'data': {'username': ctx.user(), 'password': PASSWORD}}
+
+def submit(ctx):
+    _, headers = ctx.auth()
+    return 'POST', '/api/results', {'json': result_body(ctx), 'headers': headers}
+
+def register(ctx):
+    username = f'e2e{ctx.tag}{next(ctx.registered)}'
+    return 'POST', '/api/auth/register', {'json': {'username': username, 'password': PASSWORD}}
+
+def submit_batch(ctx):
+    _, headers = ctx.auth()
+    return 'POST', '/api/results/batch', {'json': {'results': [result_body(ctx) for _ in range(10)]}, 'headers': headers}
+
+def admin(method, path):
+    return lambda ctx: (method, path, {'headers': ctx.admin})
+
+# (название, запрос, предел числа запросов в sweep). Название до «?» —
+# метод и шаблон пути маршрута: по ним проверяется, что покрыт весь main.py.
+# Argon2 и перезагрузки словаря на порядки медленнее остального, их меньше.
+ENDPOINTS = [
+    ('GET /', lambda ctx: ('GET', '/', {}), None),
+    ('GET /metrics', lambda ctx: ('GET', '/metrics', {}), None),
+    ('POST /api/auth/register', register, 50),
+    ('POST /api/auth/login', login, 50),
+    ('GET /api/users/me', lambda ctx: ('GET', '/api/users/me', {'headers': ctx.auth()[1]}), None),
+    ('GET /api/words', lambda ctx: ('GET', '/api/words', {'params': {'limit': 200}}), None),
+    ('GET /api/words?top', lambda ctx: ('GET', '/api/words', {'params': {'limit': 200, 'top': 1000}}), None),
+    ('GET /api/words?mode=adaptive', lambda ctx: (
+        'GET', '/api/words', {'params': {'limit': 200, 'mode': 'adaptive'}, 'headers': ctx.auth()[1]}
+    ), None),
+    ('POST /api/admin/words/reload', admin('POST', '/api/admin/words/reload'), 5),
+    ('GET /api/texts/random', lambda ctx: ('GET', '/api/texts/random', {}), None),
+    ('GET /api/texts/{text_id}', lambda ctx: ('GET', f'/api/texts/{ctx.rng.choice(ctx.texts)}', {}), None),
+    ('POST /api/admin/texts/reload', admin('POST', '/api/admin/texts/reload'), 5),
+    ('GET /api/admin/db/pool', admin('GET', '/api/admin/db/pool'), None),
+    ('GET /api/admin/passwords', admin('GET', '/api/admin/passwords'), None),
+    ('GET /api/admin/slow-queries', admin('GET', '/api/admin/slow-queries'), None),
+    ('DELETE /api/admin/slow-queries', admin('DELETE', '/api/admin/slow-queries'), None),
+    ('GET /api/admin/write-behind', admin('GET', '/api/admin/write-behind'), None),
+    # 409, если компакция выключена (RESULTS_HOT_DAYS=0)
+    ('POST /api/admin/compaction', admin('POST', '/api/admin/compaction'), 5),
+    ('POST /api/results', submit, None),
+    ('POST /api/results/batch', submit_batch, None),
+    ('GET /api/results/user/{username}', lambda ctx: ('GET', f'/api/results/user/{ctx.user()}', {}), None),
+    ('GET /api/results/user/{username}/history', lambda ctx: (
+        'GET', f'/api/results/user/{ctx.user()}/history', {'params': {'limit': 50}}
+    ), None),
+    ('GET /api/results/user/{username}/export', lambda ctx: ('GET', f'/api/results/user/{ctx.user()}/export', {}), None),
+    ('GET /api/profile/{username}', lambda ctx: ('GET', f'/api/profile/{ctx.user()}', {}), None),
+    ('GET /api/profile/{username}/stats', lambda ctx: ('GET', f'/api/profile/{ctx.user()}/stats', {}), None),
+    ('GET /api/profile/{username}/heatmap', lambda ctx: ('GET', f'/api/profile/{ctx.user()}/heatmap', {}), None),
+    ('GET /api/races', lambda ctx: ('GET', '/api/races', {}), None),
+    ('GET /api/leaderboard/wpm', lambda ctx: ('GET', '/api/leaderboard/wpm', {}), None),
+    ('GET /api/leaderboard/accuracy', lambda ctx: ('GET', '/api/leaderboard/accuracy', {}), None),
+    ('GET /api/leaderboard/text/{text_id}', lambda ctx: ('GET', f'/api/leaderboard/text/{ctx.rng.choice(ctx.texts)}', {}), None),
+    ('GET /api/leaderboard/{metric}/rank/{username}', lambda ctx: (
+        'GET', f'/api/leaderboard/{ctx.rng.choice(("wpm", "accuracy"))}/rank/{ctx.user()}', {}
+    ), None),
+]
+REQUESTS = {name: build for name, build, _ in ENDPOINTS}
+
+# Смесь без логинов: они идут отдельными всплесками (--burst-size раз в --burst-every секунд)
+MIX = [
+    ('GET /api/words', 0.4),
+    ('POST /api/results', 0.2),
+    ('GET /api/profile/{username}', 0.1),
+    ('GET /api/profile/{username}/stats', 0.05),
+    ('GET /api/results/user/{username}/history', 0.05),
+    ('GET /api/leaderboard/wpm', 0.1),
+    ('GET /api/leaderboard/{metric}/rank/{username}', 0.05),
+    ('GET /api/texts/random', 0.05),
+]
+
+def uncovered_routes():
+    from fastapi.routing import APIRoute
+
+    from app.main import app
+
+    covered = {name.split('?')[0] for name, _, _ in ENDPOINTS}
+    return sorted(
+        f'{method} {route.path}'
+        for route in app.routes if isinstance(route, APIRoute)
+        for method in route.methods - {'HEAD'}
+        if f'{method} {route.path}' not in covered
+    )
+
+async def issue(client, ctx, name, samples):
+    method, url, kwargs = REQUESTS[name.replace(' (burst)', '')](ctx)
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+        status = response.status_code
+    except httpx.HTTPError as e:
+        # Вместо кода ответа — тип ошибки транспорта
+        status = type(e).__name__
+    samples.setdefault(name, []).append((time.perf_counter() - started, status))
+
+async def sweep(client, ctx, args):
+    samples, elapsed = {}, {}
+    for name, _, limit in ENDPOINTS:
+        count = min(args.requests, limit or args.requests)
+        for _ in range(args.warmup):
+            await issue(client, ctx, name, {})
+        remaining = iter(range(count))
+
+        async def worker():
+            for _ in remaining:
+                await issue(client, ctx, name, samples)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed[name] = time.perf_counter() - started
+        print(f'{name:<48} {count / elapsed[name]:>8.1f} req/s', file=sys.stderr)
+    return samples, elapsed
+
+async def mix(client, ctx, args):
+    samples = {}
+    names = [name for name, _ in MIX]
+    weights = [weight for _, weight in MIX]
+    deadline = time.perf_counter() + args.duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            await issue(client, ctx, ctx.rng.choices(names, weights)[0], samples)
+
+    async def bursts():
+        while time.perf_counter() + args.burst_every < deadline:
+            await asyncio.sleep(args.burst_every)
+            await asyncio.gather(*(issue(client, ctx, LOGIN_BURST, samples) for _ in range(args.burst_size)))
+
+    started = time.perf_counter()
+    await asyncio.gather(bursts(), *(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    return samples, {name: elapsed for name in samples}
+
+def summarize(samples, elapsed):
+    endpoints = {}
+    for name, values in samples.items():
+        latencies = [latency for latency, _ in values]
+        statuses = {}
+        for _, status in values:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        endpoints[name] = {
+            'count': len(values),
+            'errors': sum(1 for _, status in values if isinstance(status, str) or status >= 400),
+            'statuses': statuses,
+            'rps': round(len(values) / elapsed[name], 2),
+            'mean_ms': round(sum(latencies) / len(latencies) * 1e3, 3),
+            'p50_ms': round(percentile(latencies, 0.5) * 1e3, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1e3, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1e3, 3),
+            'max_ms': round(max(latencies) * 1e3, 3),
+        }
+    return endpoints
+
+def print_report(endpoints):
+    print(f'{"endpoint":<48} {"count":>7} {"req/s":>8} {"p50, ms":>9} {"p95, ms":>9} {"p99, ms":>9} {"errors":>7}')
+    for name, row in endpoints.items():
+        print(
+            f'{name:<48} {row["count"]:>7} {row["rps"]:>8.1f} {row["p50_ms"]:>9.2f} '
+            f'{row["p95_ms"]:>9.2f} {row["p99_ms"]:>9.2f} {row["errors"]:>7}'
+        )
+
+# Регрессия — p99 выросла или req/s упали больше чем на threshold
+def compare(baseline, endpoints, threshold):
+    print(f'\n{"endpoint":<48} {"p50":>8} {"p99":>8} {"req/s":>8}')
+    regressions = []
+    for name, row in endpoints.items():
+        old = baseline['endpoints'].get(name)
+        if old is None:
+            continue
+        deltas = [
+            (row[key] - old[key]) / old[key] if old[key] else 0.0
+            for key in ('p50_ms', 'p99_ms', 'rps')
+        ]
+        regressed = deltas[1] > threshold or deltas[2] < -threshold
+        if regressed:
+            regressions.append(name)
+        print(f'{name:<48} ' + ' '.join(f'{delta:>+8.1%}' for delta in deltas) + ('  REGRESSION' if regressed else ''))
+    return regressions
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def login_sessions(client, args):
+    tokens = []
+    for i in range(min(args.sessions, args.users)):
+        response = await client.post('/api/auth/login', data={'username': f'user{i}', 'password': PASSWORD})
+        response.raise_for_status()
+        tokens.append((f'user{i}', response.json()['access_token']))
+    return tokens
+
+async def run(client, args, texts):
+    if args.url:
+        # Чужой SECRET_KEY неизвестен: токены только через логин
+        tokens = await login_sessions(client, args)
+    else:
+        from app.auth import create_access_token
+
+        tokens = [(f'user{i}', create_access_token(f'user{i}')) for i in range(min(args.sessions, args.users))]
+    ctx = Context(args.users, tokens, texts, os.environ.get('ADMIN_TOKEN'), random.Random(args.seed))
+    if args.scenario == 'sweep':
+        return await sweep(client, ctx, args)
+    return await mix(client, ctx, args)
+
+async def run_asgi(args, texts):
+    from app.main import app
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench', limits=limits, timeout=60) as client:
+            return await run(client, args, texts)
+
+async def run_http(url, args, texts):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        return await run(client, args, texts)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenario', choices=('sweep', 'mix'), default='mix')
+    parser.add_argument('--spawn', action='store_true')
+    parser.add_argument('--url')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--burst-every', type=float, default=5)
+    parser.add_argument('--burst-size', type=int, default=20)
+    # Параметры синтетической базы; база кэшируется по ним в --data-dir
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--results', type=int, default=1000000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--words', type=int, default=300000)
+    parser.add_argument('--texts', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'sakhatype-bench'))
+    parser.add_argument('--seed-only', action='store_true')
+    parser.add_argument('--write-behind', action='store_true')
+    parser.add_argument('--output')
+    parser.add_argument('--compare')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    path = dataset_path(args)
+    workdir = tempfile.mkdtemp()
+    database = os.path.join(workdir, 'bench.db')
+    env = {
+        'DATABASE_URL': f'sqlite:///{database}',
+        'ADMIN_TOKEN': os.environ.get('ADMIN_TOKEN') or secrets.token_urlsafe(16),
+        'SECRET_KEY': os.environ.get('SECRET_KEY') or secrets.token_urlsafe(32),
+    }
+    if args.write_behind:
+        env.update(WRITE_BEHIND_ENABLED='true', WRITE_BEHIND_LOG=os.path.join(workdir, 'results.wbl'))
+    if not args.url:
+        os.environ.update(env)
+
+    if not os.path.exists(path):
+        seed(path, args)
+    if args.seed_only:
+        print(path)
+        return
+    shutil.copyfile(path, database)
+    texts = text_ids(database)
+    uncovered = uncovered_routes()
+    if uncovered:
+        print(f'not covered by the benchmark: {", ".join(uncovered)}', file=sys.stderr)
+
+    process = None
+    try:
+        if args.url:
+            transport = args.url
+            samples, elapsed = asyncio.run(run_http(args.url, args, texts))
+        elif args.spawn:
+            transport = 'uvicorn'
+            process = spawn_server(args.port, dict(os.environ, **env))
+            samples, elapsed = asyncio.run(run_http(f'http://127.0.0.1:{args.port}', args, texts))
+        else:
+            transport = 'asgi'
+            samples, elapsed = asyncio.run(run_asgi(args, texts))
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    endpoints = summarize(samples, elapsed)
+    print_report(endpoints)
+    report = {
+        'meta': {
+            'started_at': datetime.utcnow().isoformat(),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'transport': transport,
+            'dataset': os.path.basename(path),
+            'uncovered': uncovered,
+            'args': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        },
+        'endpoints': endpoints,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            regressions = compare(json.load(file), endpoints, args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} regressions over {args.threshold:.0%}', file=sys.stderr)
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Проверка журналов нажатий: 10 000 воспроизведений 60-секундных тестов.
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_keystrokes
+"""
+import random
+import statistics
+import time
+
+from app import keystrokes
+
+REPLAYS = 10_000
+DURATION = 60
+WPM = 90
+WORDS = ['саха', 'дойду', 'киһи', 'сир', 'ыал', 'олох', 'үлэ', 'кыра', 'улахан', 'ҕаҕа', 'өрүс', 'ыҥырыы']
+
+def make_log(rng):
+    text = ' '.join(rng.choices(WORDS, k=200))
+    interval = 60000 / (WPM * 5)
+    deltas, codes = [], []
+    for char in text:
+        if rng.random() < 0.05:
+            codes += [ord('а'), keystrokes.BACKSPACE]
+            deltas += [max(1, int(rng.gauss(interval, 30)))] * 2
+        codes.append(ord(char))
+        deltas.append(max(1, int(rng.gauss(interval, 30))))
+        if sum(deltas) >= DURATION * 1000:
+            break
+    return text, keystrokes.encode(deltas[:-1], codes[:-1]), len(codes) - 1
+
+def main():
+    rng = random.Random(1)
+    logs = [make_log(rng) for _ in range(200)]
+    timings = []
+    started = time.perf_counter()
+    for i in range(REPLAYS):
+        text, data, _ = logs[i % len(logs)]
+        begin = time.perf_counter()
+        keystrokes.validate(data, text, DURATION)
+        timings.append(time.perf_counter() - begin)
+    total = time.perf_counter() - started
+    timings.sort()
+    text, data, size = logs[0]
+    deltas, codes = keystrokes.decode(data)
+    print(f'replays: {REPLAYS}, keystrokes per test: ~{size}')
+    print(f'mean: {statistics.fmean(timings) * 1e6:.0f} us, p50: {timings[len(timings) // 2] * 1e6:.0f} us, '
+          f'p99: {timings[int(len(timings) * 0.99)] * 1e6:.0f} us, total: {total:.2f} s')
+    print(f'payload: {len(data)} base64 chars, stored blob: {len(keystrokes.pack(deltas, codes, text))} bytes')
+
+if __name__ == '__main__':
+    main()
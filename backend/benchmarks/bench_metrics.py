@@ -0,0 +1,89 @@
+"""Стоимость инструментирования: запрос к ASGI-приложению FastAPI с
+MetricsMiddleware и без него (без сети и HTTP-клиента), плюс учет запросов
+к базе через события SQLAlchemy и время рендера /metrics.
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_metrics
+"""
+import asyncio
+import time
+
+from fastapi import FastAPI
+from sqlalchemy import create_engine, text
+
+from app.metrics import Metrics, MetricsMiddleware
+
+REQUESTS = 20000
+QUERIES = 5000
+
+def make_app():
+    app = FastAPI()
+
+    @app.get('/api/profile/{username}')
+    async def profile(username: str):
+        return {'username': username}
+
+    return app
+
+async def call(app, path: str):
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+        'root_path': '', 'headers': [], 'client': ('127.0.0.1', 1), 'server': ('test', 80), 'app': app,
+    }
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+
+async def measure(app):
+    for i in range(500):
+        await call(app, f'/api/profile/user{i}')
+    started = time.perf_counter()
+    for i in range(REQUESTS):
+        await call(app, f'/api/profile/user{i % 1000}')
+    return (time.perf_counter() - started) / REQUESTS
+
+def measure_queries(instrumented: bool):
+    engine = create_engine('sqlite://')
+    if instrumented:
+        Metrics().instrument_engine(engine, 'bench')
+    with engine.connect() as connection:
+        statement = text('SELECT 1')
+        connection.execute(statement)
+        started = time.perf_counter()
+        for _ in range(QUERIES):
+            connection.execute(statement)
+        elapsed = (time.perf_counter() - started) / QUERIES
+    engine.dispose()
+    return elapsed
+
+def main():
+    plain = make_app()
+    registry = Metrics()
+    instrumented = make_app()
+    instrumented.add_middleware(MetricsMiddleware, registry=registry)
+
+    # Поочередно и по лучшему из трех, чтобы шум не выдавался за накладные расходы
+    base = with_metrics = float('inf')
+    for _ in range(3):
+        base = min(base, asyncio.run(measure(plain)))
+        with_metrics = min(with_metrics, asyncio.run(measure(instrumented)))
+    print(f'request without metrics: {base * 1e6:.1f} us, with metrics: {with_metrics * 1e6:.1f} us, '
+          f'overhead: {(with_metrics - base) * 1e6:.1f} us ({(with_metrics / base - 1):.1%})')
+
+    query_base = min(measure_queries(False) for _ in range(3))
+    query_metrics = min(measure_queries(True) for _ in range(3))
+    print(f'SELECT 1 without events: {query_base * 1e6:.1f} us, with events: {query_metrics * 1e6:.1f} us, '
+          f'overhead: {(query_metrics - query_base) * 1e6:.1f} us')
+
+    started = time.perf_counter()
+    output = registry.render()
+    print(f'/metrics render: {(time.perf_counter() - started) * 1e3:.2f} ms, {len(output.splitlines())} lines')
+
+if __name__ == '__main__':
+    main()
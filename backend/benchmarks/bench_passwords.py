@@ -0,0 +1,53 @@
+"""Пропускная способность входа в зависимости от параметров argon2.
+
+Параметры передаются процессам пула через переменные окружения, поэтому
+для каждой настройки создается свой PasswordHasher.
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_passwords
+"""
+import asyncio
+import os
+import statistics
+import time
+
+COSTS = [(1, 16384), (2, 32768), (3, 65536), (4, 131072)]
+LOGINS = 24
+CONCURRENCY = 8
+
+async def measure(hasher):
+    hashed = await hasher.hash('password')
+    latencies = []
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def login():
+        async with semaphore:
+            started = time.perf_counter()
+            verified, _ = await hasher.verify('password', hashed)
+            assert verified
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(LOGINS)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return LOGINS / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1]
+
+def main():
+    from app.passwords import PasswordHasher
+    from app.config import settings
+
+    print(f'workers: {settings.PASSWORD_HASH_WORKERS}, concurrency: {CONCURRENCY}')
+    print(f'{"time_cost":>9} {"memory, KiB":>12} {"logins/s":>9} {"p50, ms":>9} {"p95, ms":>9}')
+    for time_cost, memory_cost in COSTS:
+        os.environ['ARGON2_TIME_COST'] = str(time_cost)
+        os.environ['ARGON2_MEMORY_COST'] = str(memory_cost)
+        hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, LOGINS)
+        try:
+            throughput, p50, p95 = asyncio.run(measure(hasher))
+        finally:
+            hasher.shutdown()
+        print(f'{time_cost:>9} {memory_cost:>12} {throughput:>9.1f} {p50 * 1e3:>9.0f} {p95 * 1e3:>9.0f}')
+
+if __name__ == '__main__':
+    main()
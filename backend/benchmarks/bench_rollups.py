@@ -0,0 +1,125 @@
+"""Синтетический набор результатов и замер досок за день/неделю/всё время.
+
+Заполняет отдельную SQLite-базу пользователями, результатами тестов и
+сводной таблицей leaderboard_rollups, затем сравнивает чтение доски через
+индекс (time_mode, period, score) с агрегатом по test_results.
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_rollups --results 20000000 --users 50000
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app import models, rollups
+from app.leaderboard import TIME_MODES
+
+def generate(engine, users, results, days, seed):
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    names = [f'user{i}' for i in range(users)]
+    boards = {}
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.executemany(
+            'INSERT INTO users (username, password, total_tests, total_time_seconds, best_wpm, '
+            'best_accuracy, total_experience, level, created_at) VALUES (?, ?, 0, 0, 0, 0, 0, 1, ?)',
+            [(name, '', now) for name in names]
+        )
+        chunk = 200_000
+        for start in range(0, results, chunk):
+            rows = []
+            for _ in range(min(chunk, results - start)):
+                username = rng.choice(names)
+                time_mode = rng.choice(TIME_MODES)
+                wpm = round(rng.gauss(60, 20) % 200, 2)
+                accuracy = round(100 - rng.expovariate(0.2) % 50, 2)
+                created_at = now - timedelta(seconds=rng.randrange(days * 86400))
+                rows.append((username, wpm, wpm, accuracy, wpm, 0, time_mode, time_mode, 0.0, created_at))
+                for key in rollups.result_keys(time_mode, created_at):
+                    best = boards.get((username, *key))
+                    if best is None:
+                        boards[(username, *key)] = [wpm, accuracy, 1]
+                    else:
+                        best[0] = max(best[0], wpm)
+                        best[1] = max(best[1], accuracy)
+                        best[2] += 1
+            cursor.executemany(
+                'INSERT INTO test_results (username, wpm, raw_wpm, accuracy, burst_wpm, total_errors, '
+                'time_mode, test_duration, consistency, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+        cursor.executemany(
+            'INSERT INTO leaderboard_rollups (username, time_mode, period, best_wpm, best_accuracy, tests) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [(username, mode, period, *best) for (username, mode, period), best in boards.items()]
+        )
+        connection.commit()
+    finally:
+        connection.close()
+    return len(boards)
+
+def measure(fn, repeat=20):
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e3
+
+async def measure_boards(path, repeat=20):
+    engine = create_async_engine(f'sqlite+aiosqlite:///{path}')
+    async with async_sessionmaker(engine)() as db:
+        for period in rollups.PERIODS:
+            await rollups.get_board(db, 'wpm', 30, period)
+            started = time.perf_counter()
+            for _ in range(repeat):
+                await rollups.get_board(db, 'wpm', 30, period)
+            print(f'rollup board {period:>7}: {(time.perf_counter() - started) / repeat * 1e3:8.3f} ms')
+    await engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=20_000)
+    parser.add_argument('--results', type=int, default=1_000_000)
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'rollups.db')
+        engine = create_engine(f'sqlite:///{path}')
+        models.Base.metadata.create_all(bind=engine)
+        started = time.perf_counter()
+        rollup_rows = generate(engine, args.users, args.results, args.days, args.seed)
+        print(f'{args.results} results, {rollup_rows} rollup rows, generated in {time.perf_counter() - started:.1f}s')
+
+        db = sessionmaker(bind=engine)()
+        with engine.connect() as conn:
+            plan = conn.execute(text(
+                "EXPLAIN QUERY PLAN SELECT username FROM leaderboard_rollups "
+                "WHERE time_mode = 30 AND period = 'all' ORDER BY best_wpm DESC LIMIT 100"
+            )).all()
+            print('plan:', '; '.join(row[-1] for row in plan))
+
+        asyncio.run(measure_boards(path))
+
+        week_ago = datetime.utcnow() - timedelta(days=7)
+        aggregate = lambda: db.query(models.TestResult.username, func.max(models.TestResult.wpm))\
+            .filter(models.TestResult.time_mode == 30, models.TestResult.created_at >= week_ago)\
+            .group_by(models.TestResult.username)\
+            .order_by(func.max(models.TestResult.wpm).desc())\
+            .limit(100).all()
+        print(f'aggregate over test_results (weekly): {measure(aggregate, repeat=3):8.3f} ms')
+        db.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Стоимость списка результатов и доски рекордов на строку: до и после.
+
+До: ORM-объекты, проверка каждой строки pydantic-моделью (from_attributes),
+затем json.dumps — то, что делает FastAPI с response_model. После: кортежи
+нужных столбцов, dict на строку и orjson (app.serialization), а также
+формат columnar. Время чтения из базы и кодирования показано отдельно.
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_serialization --rows 100 500
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from app import crud, migrations, models, schemas
+from app.leaderboard import LeaderboardEngine, LEADERBOARD_COLUMNS
+from app.serialization import entries_response, rows_response
+
+def fill(engine, rows):
+    now = datetime.utcnow()
+    with engine.begin() as connection:
+        migrations.upgrade(connection)
+        connection.execute(insert(models.TestResult), [
+            {
+                'username': 'user', 'wpm': 40 + i % 80 + 0.25, 'raw_wpm': 50.5, 'accuracy': 90 + i % 10 + 0.5,
+                'burst_wpm': 90.0, 'total_errors': i % 12, 'time_mode': 30, 'test_duration': 30,
+                'consistency': 72.5, 'created_at': now - timedelta(minutes=i), 'text_id': None,
+            }
+            for i in range(rows)
+        ])
+
+def measure(fn, repeat):
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        value = fn()
+    return (time.perf_counter() - started) / repeat, value
+
+# Как FastAPI отдает response_model: проверка, сериализация в JSON-типы, json.dumps
+def pydantic_body(adapter, value, **options):
+    validated = adapter.validate_python(value, **options)
+    return JSONResponse(adapter.dump_python(validated, mode='json')).body
+
+def report(name, rows, load, encode, size):
+    print(
+        f'{name:<28} {rows:>6} {load / rows * 1e6:>10.2f} {encode / rows * 1e6:>12.2f} '
+        f'{(load + encode) / rows * 1e6:>10.2f} {size:>9}'
+    )
+
+def bench_results(engine, rows, repeat):
+    adapter = TypeAdapter(List[schemas.TestResultResponse])
+    with Session(engine) as session:
+        def load_objects():
+            # Без кэша сессии: каждый запрос получает свежие объекты
+            session.expunge_all()
+            return session.scalars(select(models.TestResult).where(
+                models.TestResult.username == 'user'
+            ).order_by(models.TestResult.created_at.desc()).limit(rows)).all()
+
+        load, objects = measure(load_objects, repeat)
+        encode, body = measure(lambda: pydantic_body(adapter, objects, from_attributes=True), repeat)
+        report('results: orm + pydantic', rows, load, encode, len(body))
+
+        load, tuples = measure(lambda: session.execute(crud.user_results_query('user', rows)).all(), repeat)
+        for fmt in ('json', 'columnar'):
+            encode, body = measure(lambda: rows_response(crud.RESULT_COLUMNS, tuples, fmt).body, repeat)
+            report(f'results: tuples + {fmt}', rows, load, encode, len(body))
+
+def bench_leaderboard(rows, repeat):
+    adapter = TypeAdapter(List[schemas.LeaderboardEntry])
+    board = LeaderboardEngine()
+    for i in range(rows):
+        user = models.User(username=f'user{i}', total_tests=10, best_wpm=40 + i * 0.37, best_accuracy=95.5, level=3)
+        board.record_result(user, models.TestResult(time_mode=30, wpm=user.best_wpm, accuracy=95.5, text_id=None))
+    load, entries = measure(lambda: board.top('wpm', None, rows), repeat)
+    encode, body = measure(lambda: pydantic_body(adapter, entries), repeat)
+    report('leaderboard: pydantic', rows, load, encode, len(body))
+    for fmt in ('json', 'columnar'):
+        encode, body = measure(lambda: entries_response(LEADERBOARD_COLUMNS, entries, fmt).body, repeat)
+        report(f'leaderboard: orjson {fmt}', rows, load, encode, len(body))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 500])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f'{"path":<28} {"rows":>6} {"load, us":>10} {"encode, us":>12} {"total, us":>10} {"bytes":>9}  (per row)')
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f'sqlite:///{os.path.join(directory, "serialization.db")}')
+        fill(engine, max(args.rows))
+        for rows in args.rows:
+            bench_results(engine, rows, args.repeat)
+            bench_leaderboard(rows, args.repeat)
+        engine.dispose()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Сравнение выдачи /api/words: ORDER BY random() в SQLite против пула в памяти.
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_word_pool
+"""
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, func, insert
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.word_pool import WordPool
+
+SIZES = [150, 100_000, 1_000_000]
+LIMIT = 100
+ALPHABET = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюяҕҥөһү'
+
+def make_db(path, size):
+    engine = create_engine(f'sqlite:///{path}')
+    models.Base.metadata.create_all(bind=engine)
+    rng = random.Random(size)
+    with engine.begin() as conn:
+        for start in range(0, size, 50_000):
+            rows = [
+                {'word': ''.join(rng.choices(ALPHABET, k=rng.randint(2, 10)))}
+                for _ in range(start, min(start + 50_000, size))
+            ]
+            conn.execute(insert(models.Word), rows)
+    return engine
+
+def measure(fn, repeat):
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat
+
+def main():
+    print(f'{"words":>10} {"sql, ms":>10} {"pool, ms":>10} {"load, s":>9} {"speedup":>9}')
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in SIZES:
+            engine = make_db(os.path.join(tmp, f'words_{size}.db'), size)
+            db = sessionmaker(bind=engine)()
+            pool = WordPool()
+            started = time.perf_counter()
+            pool.load_words(word for (word,) in db.query(models.Word.word).order_by(models.Word.id).yield_per(10000))
+            load_time = time.perf_counter() - started
+
+            sql_repeat = 200 if size < 100_000 else 10
+            # Прежний путь /api/words
+            sql = measure(lambda: db.query(models.Word.word).order_by(func.random()).limit(LIMIT).all(), sql_repeat)
+            mem = measure(lambda: pool.sample(LIMIT), 2000)
+            print(f'{size:>10} {sql * 1e3:>10.3f} {mem * 1e3:>10.4f} {load_time:>9.2f} {sql / mem:>8.0f}x')
+            db.close()
+            engine.dispose()
+
+if __name__ == '__main__':
+    main()
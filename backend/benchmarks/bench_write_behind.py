@@ -0,0 +1,133 @@
+"""Пропускная способность сохранения результатов: сразу в базу и через write-behind.
+
+Для каждого режима создает отдельную SQLite-базу с пользователями и
+сохраняет --results результатов из --concurrency параллельных задач:
+crud.create_test_result (транзакция на результат) против
+write_behind.submit (журнал с общим fsync и пачки в базу). Для write-behind
+отдельно показано время подтверждения и время до записи всего в базу.
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_write_behind --results 2000 --concurrency 16
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app import crud, migrations, models, schemas
+from app.config import settings
+from app.database import PoolStats, TimedAsyncQueuePool, configure, engine_options
+from app.write_behind import WriteBehind
+from benchmarks.load_test import percentile
+
+def prepare(directory, name, users):
+    url = f'sqlite:///{os.path.join(directory, name)}'
+    engine = create_engine(url)
+    with engine.begin() as connection:
+        migrations.upgrade(connection)
+        connection.execute(insert(models.User), [
+            {'username': f'user{i}', 'password': '-', 'created_at': datetime.utcnow()} for i in range(users)
+        ])
+    async_url = url.replace('sqlite://', 'sqlite+aiosqlite://', 1)
+    async_engine = create_async_engine(async_url, **engine_options(async_url, TimedAsyncQueuePool))
+    configure(async_engine.sync_engine, async_url, PoolStats(name))
+    return engine, async_engine
+
+def make_result(rng):
+    wpm = round(rng.uniform(30, 120), 2)
+    return schemas.TestResultCreate(
+        wpm=wpm, raw_wpm=wpm + 5, accuracy=round(rng.uniform(85, 100), 2), burst_wpm=wpm + 10,
+        total_errors=rng.randrange(10), time_mode=30, test_duration=30
+    )
+
+async def drive(save, results, concurrency, users):
+    latencies = []
+    errors = []
+    remaining = iter(range(results))
+
+    async def worker(rng):
+        for _ in remaining:
+            username = f'user{rng.randrange(users)}'
+            result = make_result(rng)
+            started = time.perf_counter()
+            try:
+                await save(username, result)
+            except OperationalError as e:
+                # database is locked: транзакции-конкуренты за блокировку записи SQLite
+                errors.append(e)
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(random.Random(i)) for i in range(concurrency)))
+    return time.perf_counter() - started, latencies, len(errors)
+
+def report(name, elapsed, latencies, errors):
+    print(
+        f'{name:<22} {len(latencies) / elapsed:>10.0f} {percentile(latencies, 0.5) * 1e3:>9.2f} '
+        f'{percentile(latencies, 0.99) * 1e3:>9.2f} {elapsed:>8.2f} {errors:>7}'
+    )
+
+def stored(engine):
+    with engine.connect() as connection:
+        return connection.scalar(select(func.count(models.TestResult.id)))
+
+async def run(args, directory):
+    print(f'{"mode":<22} {"results/s":>10} {"p50, ms":>9} {"p99, ms":>9} {"time, s":>8} {"errors":>7}')
+
+    engine, async_engine = prepare(directory, 'direct.db', args.users)
+    sessions = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    async def save_direct(username, result):
+        async with sessions() as db:
+            await crud.create_test_result(db, username, result)
+
+    elapsed, latencies, errors = await drive(save_direct, args.results, args.concurrency, args.users)
+    report('direct', elapsed, latencies, errors)
+    assert stored(engine) == len(latencies)
+    await async_engine.dispose()
+
+    engine, async_engine = prepare(directory, 'write_behind.db', args.users)
+    log = WriteBehind(
+        os.path.join(directory, 'results.wbl'), args.flush_ms, args.batch, not args.no_fsync,
+        async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    )
+    await log.start()
+
+    async def save_queued(username, result):
+        await log.submit(username, [result])
+
+    started = time.perf_counter()
+    elapsed, latencies, errors = await drive(save_queued, args.results, args.concurrency, args.users)
+    report('write-behind, ack', elapsed, latencies, errors)
+    await log.stop()
+    report('write-behind, stored', time.perf_counter() - started, latencies, errors)
+    assert stored(engine) == len(latencies)
+    print(f'flushes: {log.stats["flushes"]}, results per flush: {args.results / max(1, log.stats["flushes"]):.0f}')
+    await async_engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--results', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--flush-ms', type=float, default=settings.WRITE_BEHIND_FLUSH_MS)
+    parser.add_argument('--batch', type=int, default=settings.WRITE_BEHIND_BATCH)
+    parser.add_argument('--no-fsync', action='store_true')
+    # FULL — fsync на каждый commit, как без WAL; по умолчанию из настроек
+    parser.add_argument('--synchronous', default=settings.SQLITE_SYNCHRONOUS)
+    args = parser.parse_args()
+    settings.SQLITE_SYNCHRONOUS = args.synchronous
+    print(f'{args.results} results, concurrency {args.concurrency}, {args.users} users, synchronous={args.synchronous}')
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(args, directory))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Нагрузочный тест API: запросы в секунду и задержки по эндпоинтам.
+
+Поднимает uvicorn на временной базе (или бьёт в уже запущенный сервер через
+--url) и гоняет смесь запросов: слова, сохранение результатов и логины,
+которые нагружают argon2. Нужны httpx и uvicorn.
+
+Запуск из каталога backend:
+    python -m benchmarks.load_test --concurrency 64 --duration 20
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+RESULT = {
+    'wpm': 62.5, 'raw_wpm': 70.0, 'accuracy': 94.0, 'burst_wpm': 80.0,
+    'total_errors': 7, 'time_mode': 30, 'test_duration': 30, 'consistency': 75.0,
+}
+
+SCENARIOS = [
+    ('GET /api/words', 0.55),
+    ('POST /api/results', 0.25),
+    ('GET /api/leaderboard/wpm', 0.1),
+    ('POST /api/auth/login', 0.1),
+]
+LOGIN = 'POST /api/auth/login'
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+async def prepare_users(client, count):
+    tokens = []
+    for i in range(count):
+        username = f'load{i}'
+        await client.post('/api/auth/register', json={'username': username, 'password': 'password'})
+        response = await client.post('/api/auth/login', data={'username': username, 'password': 'password'})
+        tokens.append((username, response.json()['access_token']))
+    return tokens
+
+async def worker(client, tokens, deadline, latencies, errors, rng, weights):
+    names = [name for name, _ in SCENARIOS]
+    while time.perf_counter() < deadline:
+        scenario = rng.choices(names, weights)[0]
+        username, token = rng.choice(tokens)
+        started = time.perf_counter()
+        if scenario == 'GET /api/words':
+            response = await client.get('/api/words', params={'limit': 200})
+        elif scenario == 'POST /api/results':
+            response = await client.post('/api/results', json=RESULT, headers={'Authorization': f'Bearer {token}'})
+        elif scenario == 'GET /api/leaderboard/wpm':
+            response = await client.get('/api/leaderboard/wpm')
+        else:
+            response = await client.post('/api/auth/login', data={'username': username, 'password': 'password'})
+        latencies[scenario].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            errors[scenario] = errors.get(scenario, 0) + 1
+
+async def run(url, concurrency, duration, users, login_share):
+    weights = [login_share if name == LOGIN else weight for name, weight in SCENARIOS]
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        tokens = await prepare_users(client, users)
+        latencies = {name: [] for name, _ in SCENARIOS}
+        errors = {}
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(
+            worker(client, tokens, deadline, latencies, errors, random.Random(i), weights)
+            for i in range(concurrency)
+        ))
+    total = sum(len(values) for values in latencies.values())
+    print(f'{url}: {total / duration:.1f} req/s with concurrency {concurrency}')
+    print(f'{"endpoint":<28} {"count":>7} {"p50, ms":>9} {"p95, ms":>9} {"p99, ms":>9} {"errors":>7}')
+    for name, values in latencies.items():
+        if not values:
+            continue
+        print(
+            f'{name:<28} {len(values):>7} {percentile(values, 0.5) * 1e3:>9.1f} '
+            f'{percentile(values, 0.95) * 1e3:>9.1f} {percentile(values, 0.99) * 1e3:>9.1f} {errors.get(name, 0):>7}'
+        )
+
+# Без env сервер поднимается на временной базе со словарем из seed_words
+def spawn_server(port, env=None):
+    if env is None:
+        tmp = tempfile.mkdtemp()
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{os.path.join(tmp, "load.db")}')
+        subprocess.run([sys.executable, '-m', 'app.migrations'], env=env, check=True)
+        subprocess.run([sys.executable, '-m', 'app.seed_words'], env=env, check=True)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(port), '--log-level', 'warning'],
+        env=env
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f'http://127.0.0.1:{port}/')
+            break
+        except httpx.TransportError:
+            time.sleep(0.1)
+    return process
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--users', type=int, default=20)
+    # Доля логинов в смеси; 0 — замер без argon2
+    parser.add_argument('--login-share', type=float, default=0.1)
+    args = parser.parse_args()
+
+    process = None if args.url else spawn_server(args.port)
+    try:
+        asyncio.run(run(args.url or f'http://127.0.0.1:{args.port}', args.concurrency, args.duration, args.users, args.login_share))
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+if __name__ == '__main__':
+    main()
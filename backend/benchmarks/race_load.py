@@ -0,0 +1,111 @@
+"""Нагрузочный тест гонок: задержка рассылки прогресса по WebSocket.
+
+Поднимает uvicorn на временной базе (или подключается к запущенному серверу
+через --url) и запускает --racers гостей по комнатам из --room-size игроков.
+Каждый игрок ждет полную комнату, шлет ready, во время гонки раз в
+--interval шлет прогресс, а после end — результат. Задержка рассылки —
+разница между sent_at в снимке и временем его получения, поэтому с --url
+клиент и сервер должны работать на одной машине или с синхронными часами.
+Нужны uvicorn и websockets.
+
+Запуск из каталога backend:
+    python -m benchmarks.race_load --racers 2000 --room-size 20 --time-mode 15
+"""
+import argparse
+import asyncio
+import json
+import random
+import resource
+import time
+
+from websockets.asyncio.client import connect
+
+from benchmarks.load_test import RESULT, percentile, spawn_server
+
+async def send_progress(websocket, interval, rng):
+    chars = 0
+    while True:
+        await asyncio.sleep(interval)
+        # Около 60 WPM: пять символов в секунду
+        chars += rng.randint(0, int(10 * interval))
+        await websocket.send(json.dumps({'type': 'progress', 'chars': chars}))
+
+async def racer(url, room_id, room_size, time_mode, interval, latencies, stats, rng):
+    progress = None
+    try:
+        async with connect(f'{url}/api/races/{room_id}?time_mode={time_mode}', open_timeout=120, max_size=None) as websocket:
+            ready = False
+            async for raw in websocket:
+                message = json.loads(raw)
+                kind = message['type']
+                if kind == 'tick':
+                    latencies.append(time.time() - message['sent_at'])
+                elif kind == 'players' and not ready and len(message['players']) >= room_size:
+                    ready = True
+                    await websocket.send(json.dumps({'type': 'ready'}))
+                elif kind == 'start':
+                    progress = asyncio.create_task(send_progress(websocket, interval, rng))
+                elif kind == 'end':
+                    progress.cancel()
+                    await websocket.send(json.dumps({'type': 'result', 'result': RESULT}))
+                elif kind == 'results':
+                    stats['finished'] += 1
+                elif kind == 'error':
+                    stats['errors'] += 1
+    except (OSError, asyncio.TimeoutError) as e:
+        stats['failed'] += 1
+        stats['last_error'] = repr(e)
+    finally:
+        if progress is not None:
+            progress.cancel()
+
+async def run(url, racers, room_size, time_mode, interval):
+    # Только полные комнаты: неполная никогда не дождется всех игроков
+    racers = racers // room_size * room_size
+    ws_url = url.replace('http://', 'ws://', 1).replace('https://', 'wss://', 1)
+    prefix = f'load-{int(time.time())}'
+    latencies = []
+    stats = {'finished': 0, 'errors': 0, 'failed': 0, 'last_error': None}
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        racer(ws_url, f'{prefix}-{i // room_size}', room_size, time_mode, interval, latencies, stats, random.Random(i))
+        for i in range(racers)
+    ))
+    elapsed = time.perf_counter() - started
+    rooms = racers // room_size
+    print(f'{url}: {racers} racers in {rooms} rooms, {time_mode} s races, progress every {interval * 1e3:.0f} ms')
+    print(f'finished {stats["finished"]}, protocol errors {stats["errors"]}, failed connections {stats["failed"]} in {elapsed:.1f} s')
+    if stats['last_error']:
+        print(f'last connection error: {stats["last_error"]}')
+    print(f'{"ticks":>9} {"per racer":>10} {"p50, ms":>9} {"p95, ms":>9} {"p99, ms":>9} {"max, ms":>9}')
+    if latencies:
+        print(
+            f'{len(latencies):>9} {len(latencies) / racers:>10.1f} {percentile(latencies, 0.5) * 1e3:>9.1f} '
+            f'{percentile(latencies, 0.95) * 1e3:>9.1f} {percentile(latencies, 0.99) * 1e3:>9.1f} {max(latencies) * 1e3:>9.1f}'
+        )
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--racers', type=int, default=1000)
+    parser.add_argument('--room-size', type=int, default=20)
+    parser.add_argument('--time-mode', type=int, default=15)
+    parser.add_argument('--interval', type=float, default=0.1)
+    args = parser.parse_args()
+
+    # Тысячам соединений не хватает стандартного лимита в 1024 дескриптора;
+    # поднятый лимит наследует и запущенный сервер
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    process = None if args.url else spawn_server(args.port)
+    try:
+        asyncio.run(run(args.url or f'http://127.0.0.1:{args.port}', args.racers, args.room_size, args.time_mode, args.interval))
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import migrations
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "test.db"}')
+    with engine.begin() as connection:
+        migrations.upgrade(connection)
+    yield engine
+    engine.dispose()
@@ -0,0 +1,20 @@
+import time
+
+from app.auth import TokenCache
+
+def test_token_cache_evicts_least_recently_used():
+    cache = TokenCache(2)
+    expires_at = time.time() + 60
+    cache.put('a', 'alice', expires_at)
+    cache.put('b', 'bob', expires_at)
+    assert cache.get('a') == 'alice'
+    cache.put('c', 'carol', expires_at)
+    assert cache.get('b') is None
+    assert cache.get('a') == 'alice'
+    assert cache.get('c') == 'carol'
+
+def test_token_cache_drops_expired_tokens():
+    cache = TokenCache(10)
+    cache.put('old', 'alice', time.time() - 1)
+    assert cache.get('old') is None
+    assert len(cache) == 0
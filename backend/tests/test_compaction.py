@@ -0,0 +1,173 @@
+from datetime import datetime
+from types import SimpleNamespace
+import asyncio
+import os
+
+from sqlalchemy import event, func, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import archive, compaction, crud, models, schemas
+from app.compaction import Compactor
+
+NOW = datetime(2026, 5, 20, 12, 0)
+CREATED = [
+    datetime(2026, 1, 10, 9, 0), datetime(2026, 1, 25, 18, 30), datetime(2026, 2, 3, 7, 15),
+    datetime(2026, 3, 28, 23, 59), datetime(2026, 4, 2, 10, 0), datetime(2026, 5, 1, 8, 0),
+]
+
+def add_results(engine):
+    with engine.begin() as connection:
+        connection.execute(insert(models.User).values(username='aian', password='-', created_at=NOW))
+        connection.execute(insert(models.TestResult), [
+            {
+                'username': 'aian', 'wpm': 40.0 + 10 * i, 'raw_wpm': 60.0, 'accuracy': 90.0 + i, 'burst_wpm': 80.0,
+                'total_errors': 1, 'time_mode': 30 if i % 2 else 15, 'test_duration': 30, 'consistency': 70.0,
+                'created_at': created_at, 'keystrokes': b'\x01\x02' if i == 0 else None,
+            }
+            for i, created_at in enumerate(CREATED)
+        ])
+        # Результаты, накопленные до миграции горячих счетчиков
+        compaction.backfill(connection)
+
+def run(tmp_path, scenario):
+    async def main():
+        async_engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path / "test.db"}')
+        try:
+            return await scenario(async_sessionmaker(async_engine, expire_on_commit=False))
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(main())
+
+def test_compaction_moves_old_months_to_summaries_and_archive(engine, tmp_path, monkeypatch):
+    add_results(engine)
+    results = archive.ResultArchive(str(tmp_path / 'archive'))
+    monkeypatch.setattr(archive, 'result_archive', results)
+
+    async def compact(sessions):
+        # 60 дней от 20 мая — граница 1 марта: январь и февраль уходят в сводки
+        job = Compactor(hot_days=60, batch_size=2, interval=3600, pause_ms=0, archive=results, session_factory=sessions)
+        report = await job.run(NOW)
+        again = await job.run(NOW)
+        return report['compacted'], again['compacted']
+
+    assert run(tmp_path, compact) == (3, 0)
+    with engine.connect() as connection:
+        hot = connection.scalar(select(func.count(models.TestResult.id)))
+        summaries = connection.execute(
+            select(models.ResultSummary).order_by(models.ResultSummary.month, models.ResultSummary.time_mode)
+        ).all()
+    assert hot == 3
+    assert [(row.month.month, row.time_mode, row.tests, row.sum_wpm, row.best_accuracy) for row in summaries] == [
+        (1, 15, 1, 40.0, 90.0), (1, 30, 1, 50.0, 91.0), (2, 15, 1, 60.0, 92.0),
+    ]
+    assert results.months('aian') == ['2026-02', '2026-01']
+    assert results.read('aian', '2026-01')[0]['keystrokes'] == 'AQI='
+
+    # Повтор пачки после сбоя между записью архива и commit не дублирует историю
+    path = os.path.join(results.user_directory('aian'), '2026-01.ndjson.gz')
+    with open(path, 'rb') as file:
+        data = file.read()
+    with open(path, 'ab') as file:
+        file.write(data)
+
+    async def read(sessions):
+        async with sessions() as db:
+            pages, cursor = [], None
+            while True:
+                items, cursor = await crud.get_user_results_page(db, 'aian', 2, cursor)
+                pages.append([row.created_at for row in items])
+                if cursor is None:
+                    break
+            latest = await crud.get_user_results(db, 'aian', 10)
+            filtered, _ = await crud.get_user_results_page(db, 'aian', 10, time_mode=15, until=datetime(2026, 3, 1))
+            months = await compaction.get_months(db, 'aian')
+        return pages, latest, filtered, months
+
+    pages, latest, filtered, months = run(tmp_path, read)
+    assert pages == [CREATED[:3:-1], CREATED[3:1:-1], CREATED[1::-1]]
+    assert [row.created_at for row in latest] == CREATED[::-1]
+    assert [row.created_at for row in filtered] == [CREATED[2], CREATED[0]]
+    assert [(point['month'].month, point['tests'], point['best_wpm']) for point in months] == [
+        (1, 2, 50.0), (2, 1, 60.0), (3, 1, 70.0), (4, 1, 80.0), (5, 1, 90.0),
+    ]
+    assert months[0]['wpm_histogram'][4] == 1 and months[0]['wpm_histogram'][5] == 1
+
+def test_last_row_of_the_table_stays_hot(engine, tmp_path):
+    add_results(engine)
+
+    async def compact(sessions):
+        job = Compactor(hot_days=1, batch_size=100, interval=3600, pause_ms=0, session_factory=sessions)
+        return (await job.run(datetime(2027, 1, 1)))['compacted']
+
+    assert run(tmp_path, compact) == 5
+    with engine.connect() as connection:
+        assert connection.scalar(select(models.TestResult.created_at)) == CREATED[-1]
+        assert connection.scalar(select(func.sum(models.ResultSummary.tests))) == 5
+
+def test_parallel_batches_of_one_month_keep_the_histogram(engine, tmp_path):
+    def row(wpm):
+        return SimpleNamespace(
+            username='aian', created_at=CREATED[0], time_mode=30, test_duration=30,
+            wpm=wpm, accuracy=95.0, consistency=70.0
+        )
+
+    async def compact(sessions):
+        async def batch(wpm):
+            async with sessions() as db:
+                await compaction.record_summaries(db, [row(wpm), row(wpm + 100)])
+                await db.commit()
+
+        await asyncio.gather(*(batch(40.0 + i) for i in range(8)))
+        async with sessions() as db:
+            return await compaction.get_months(db, 'aian')
+
+    point, = run(tmp_path, compact)
+    assert point['tests'] == 16 and point['best_wpm'] == 147.0
+    assert sum(point['wpm_histogram']) == 16
+    assert point['wpm_histogram'][4] == 8 and point['wpm_histogram'][14] == 8
+
+def test_monthly_series_does_not_read_results(engine, tmp_path):
+    with engine.begin() as connection:
+        connection.execute(insert(models.User).values(username='aian', password='-', created_at=NOW))
+
+    def result(i):
+        return schemas.TestResultCreate(
+            wpm=40.0 + 10 * i, raw_wpm=60.0, accuracy=90.0 + i, burst_wpm=80.0,
+            total_errors=1, time_mode=30, test_duration=30, consistency=70.0
+        )
+
+    async def scenario(sessions):
+        async with sessions() as db:
+            await crud.add_test_results(db, {'aian': [(result(i), created_at) for i, created_at in enumerate(CREATED)]})
+            await db.commit()
+        statements = []
+        sync_engine = sessions.kw['bind'].sync_engine
+        listener = lambda connection, cursor, statement, *args: statements.append(statement)
+
+        async def months():
+            statements.clear()
+            event.listen(sync_engine, 'before_cursor_execute', listener)
+            try:
+                async with sessions() as db:
+                    return await compaction.get_months(db, 'aian'), list(statements)
+            finally:
+                event.remove(sync_engine, 'before_cursor_execute', listener)
+
+        before = await months()
+        # Граница 1 марта: январь и февраль переходят из горячих счетчиков в сводки
+        await Compactor(hot_days=60, batch_size=2, interval=3600, pause_ms=0, session_factory=sessions).run(NOW)
+        after = await months()
+        return before, after
+
+    (before, before_statements), (after, after_statements) = run(tmp_path, scenario)
+    assert after == before
+    assert [(point['month'].month, point['tests'], point['best_wpm']) for point in after] == [
+        (1, 2, 50.0), (2, 1, 60.0), (3, 1, 70.0), (4, 1, 80.0), (5, 1, 90.0),
+    ]
+    assert after[0]['wpm_histogram'][4] == 1 and after[0]['wpm_histogram'][5] == 1
+    for statements in (before_statements, after_statements):
+        assert len(statements) == 2
+        assert not [statement for statement in statements if 'test_results' in statement]
+    with engine.connect() as connection:
+        hot = connection.execute(select(models.UserMonthStats.month, models.UserMonthStats.tests)).all()
+    assert sorted(month.month for month, _ in hot) == [3, 4, 5]
@@ -0,0 +1,45 @@
+import numpy as np
+from sqlalchemy import select
+
+from app import dictionary, heatmap, models
+from app.word_pool import WordPool
+
+def test_normalize_word_merges_variants():
+    assert dictionary.normalize_word('Айыл5а') == 'айылҕа'
+    assert dictionary.normalize_word('ҥ'.upper() + 'ыырай') == 'ҥыырай'
+    # «ё» из двух кодовых точек приводится к одной
+    assert dictionary.normalize_word('лёд') == 'лёд'
+    assert dictionary.normalize_word('hello') == 'hello'
+    assert dictionary.normalize_word('2024') is None
+    assert dictionary.normalize_word('') is None
+
+def test_import_words_merges_duplicates_and_ranks(engine):
+    lines = ['word\tfrequency\n', 'саха\t3\n', 'айыл5а\t5\n', 'айылҕа\t2\n', 'кэрэ\n', '12\t4\n']
+    with engine.begin() as connection:
+        report = dictionary.import_words(connection, dictionary.read_tsv(lines), chunk_size=2)
+        # Повторный импорт добавляет частоты к уже загруженным словам
+        dictionary.import_words(connection, dictionary.read_text(['кэрэ кэрэ, кэрэ!']))
+        rows = connection.execute(
+            select(models.Word.word, models.Word.frequency, models.Word.frequency_rank, models.Word.length)
+            .where(models.Word.language == 'sah')
+            .order_by(models.Word.frequency_rank)
+        ).all()
+    assert report == {'read': 5, 'skipped': 1}
+    assert [tuple(row) for row in rows] == [('айылҕа', 7, 1, 6), ('кэрэ', 4, 2, 4), ('саха', 3, 3, 4)]
+
+def test_word_pool_filters_by_language_and_top():
+    pool = WordPool()
+    pool.load_rows([('мир', 'ru'), ('дом', 'ru'), ('саха', 'sah'), ('кэрэ', 'sah'), ('үлэ', 'sah')])
+    assert pool.languages == ['ru', 'sah']
+    assert sorted(pool.sample(10, seed=1, language='ru')) == ['дом', 'мир']
+    assert sorted(pool.sample(10, seed=1, language='sah', top=2)) == ['кэрэ', 'саха']
+    assert sorted(pool.sample(10, seed=1, top=1)) == ['мир', 'саха']
+    assert pool.sample(10, language='en') == []
+
+def test_adaptive_sampling_stays_inside_selected_words():
+    pool = WordPool()
+    pool.load_rows([('ҥаа', 'sah'), ('саха', 'sah'), ('ҥыл', 'sah'), ('мир', 'ru')])
+    weakness = np.zeros(heatmap.SIZE)
+    weakness[heatmap.ALPHABET.index('ҥ')] = 1.0
+    assert set(pool.sample_adaptive(weakness, 50, seed=2, language='sah', top=2)) == {'ҥаа', 'саха'}
+    assert set(pool.sample_adaptive(weakness, 20, seed=2, language='ru')) == {'мир'}
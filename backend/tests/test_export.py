@@ -0,0 +1,70 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app import export, migrations
+
+ROWS = 1_000_000
+# Допустимый прирост RSS во время выгрузки: порция строк плюс буферы драйвера,
+# а не размер всей истории (1M строк в памяти заняли бы сотни мегабайт)
+PEAK_RSS_BOUND_MB = 64
+
+def rss_mb():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+
+def fill_results(engine, rows):
+    started = datetime(2024, 1, 1)
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("INSERT INTO users (username, password) VALUES ('heavy', '')")
+        chunk = 50_000
+        for offset in range(0, rows, chunk):
+            cursor.executemany(
+                'INSERT INTO test_results (username, wpm, raw_wpm, accuracy, burst_wpm, total_errors, '
+                'time_mode, test_duration, consistency, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [
+                    ('heavy', 60.0 + i % 40, 65.0, 95.5, 80.0, i % 7, 30, 30, 70.0,
+                     (started + timedelta(seconds=i)).isoformat(' '))
+                    for i in range(offset, min(offset + chunk, rows))
+                ]
+            )
+        connection.commit()
+    finally:
+        connection.close()
+
+@pytest.fixture(scope='module')
+def heavy_db(tmp_path_factory):
+    path = tmp_path_factory.mktemp('export') / 'heavy.db'
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.begin() as connection:
+        migrations.upgrade(connection)
+    fill_results(engine, ROWS)
+    engine.dispose()
+    return path
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/status'), reason='RSS is read from /proc')
+@pytest.mark.parametrize('fmt', ['ndjson', 'csv'])
+def test_export_streams_million_rows_in_constant_memory(heavy_db, fmt):
+    async_engine = create_async_engine(f'sqlite+aiosqlite:///{heavy_db}')
+    session_factory = async_sessionmaker(async_engine)
+
+    async def consume():
+        lines = 0
+        baseline = peak = rss_mb()
+        async for chunk in export.export_results(session_factory, 'heavy', fmt, chunk_size=1000):
+            lines += chunk.count('\n')
+            peak = max(peak, rss_mb())
+        await async_engine.dispose()
+        return lines, peak - baseline
+
+    lines, growth = asyncio.run(consume())
+    assert lines == ROWS + (1 if fmt == 'csv' else 0)
+    assert growth < PEAK_RSS_BOUND_MB, f'RSS grew by {growth:.1f} MB'
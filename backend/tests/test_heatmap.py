@@ -0,0 +1,122 @@
+from datetime import datetime
+from types import SimpleNamespace
+import asyncio
+import random
+
+import numpy as np
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import archive, heatmap, keystrokes, models
+from app.compaction import Compactor
+
+WORDS = ['ҕаҕа', 'ыҥырыы', 'өрүс', 'һаһыл', 'үлэ', 'саха']
+
+def make_blob(rng):
+    text = ' '.join(rng.choices(WORDS, k=10))
+    deltas, codes = [], []
+    for char in text:
+        if char != ' ' and rng.random() < 0.2:
+            codes += [ord('а'), keystrokes.BACKSPACE]
+            deltas += [rng.randint(80, 300)] * 2
+        codes.append(ord(char))
+        deltas.append(rng.randint(80, 300))
+    return keystrokes.pack(deltas, codes, text)
+
+def test_incremental_updates_match_batch_recompute():
+    rng = random.Random(5)
+    blobs = [make_blob(rng) for _ in range(30)]
+    chars, bigrams = heatmap.empty()
+    for blob in blobs:
+        data = heatmap.dump(chars, bigrams)
+        chars, bigrams = heatmap.load(data)
+        new_chars, new_bigrams = heatmap.aggregate_logs([blob])
+        chars, bigrams = chars + new_chars, bigrams + new_bigrams
+    batch_chars, batch_bigrams = heatmap.aggregate_logs(blobs)
+    assert np.array_equal(chars, batch_chars)
+    assert np.array_equal(bigrams, batch_bigrams)
+
+def test_errors_are_counted_against_the_expected_letter():
+    text = 'ҥа'
+    codes = [ord('н'), keystrokes.BACKSPACE, ord('ҥ'), ord('а')]
+    chars, bigrams = heatmap.aggregate_logs([keystrokes.pack([0, 100, 150, 200], codes, text)])
+    letter = heatmap.ALPHABET.index('ҥ')
+    assert chars[heatmap.ATTEMPTS][letter] == 2
+    assert chars[heatmap.ERRORS][letter] == 1
+    assert chars[heatmap.LATENCY_SUM][letter] == 150
+    pair = letter * heatmap.SIZE + heatmap.ALPHABET.index('а')
+    assert bigrams[heatmap.ATTEMPTS][pair] == 1
+    assert bigrams[heatmap.LATENCY_SUM][pair] == 200
+
+def test_concurrent_results_do_not_lose_counts(engine, tmp_path):
+    rng = random.Random(9)
+    blobs = [make_blob(rng) for _ in range(10)]
+
+    async def main():
+        async_engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path / "test.db"}')
+        sessions = async_sessionmaker(async_engine, expire_on_commit=False)
+
+        async def submit(blob):
+            async with sessions() as db:
+                await heatmap.record_results(db, {'aian': [SimpleNamespace(keystrokes=blob)]})
+                await db.commit()
+
+        await asyncio.gather(*(submit(blob) for blob in blobs))
+        async with sessions() as db:
+            row = await db.scalar(select(models.UserHeatmap))
+        await async_engine.dispose()
+        return row
+
+    row = asyncio.run(main())
+    assert row.tests == 10
+    chars, bigrams = heatmap.load(row.data)
+    expected_chars, expected_bigrams = heatmap.aggregate_logs(blobs)
+    assert np.array_equal(chars, expected_chars) and np.array_equal(bigrams, expected_bigrams)
+
+def test_rebuild_keeps_compacted_history(engine, tmp_path, monkeypatch):
+    rng = random.Random(3)
+    blobs = [make_blob(rng) for _ in range(6)]
+    with engine.begin() as connection:
+        for username in ('aian', 'kyra'):
+            connection.execute(insert(models.User).values(username=username, password='-', created_at=datetime(2026, 5, 1)))
+        connection.execute(insert(models.TestResult), [
+            {
+                'username': username, 'wpm': 50.0, 'raw_wpm': 55.0, 'accuracy': 95.0, 'burst_wpm': 60.0,
+                'total_errors': 1, 'time_mode': 30, 'test_duration': 30, 'keystrokes': blob,
+                'created_at': datetime(2026, 1 + i, 10),
+            }
+            for username in ('aian', 'kyra')
+            for i, blob in enumerate(blobs[:3] if username == 'aian' else blobs[3:])
+        ])
+        heatmap.rebuild(connection)
+    results = archive.ResultArchive(str(tmp_path / 'archive'))
+
+    async def compact():
+        async_engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path / "test.db"}')
+        sessions = async_sessionmaker(async_engine, expire_on_commit=False)
+        # Январь и февраль уходят в архив; у kyra остается только последняя строка таблицы
+        await Compactor(hot_days=60, batch_size=100, interval=3600, pause_ms=0, archive=results,
+                        session_factory=sessions).run(datetime(2026, 5, 20))
+        await async_engine.dispose()
+
+    def heatmaps():
+        with engine.connect() as connection:
+            return {row.username: (row.tests, heatmap.load(row.data)) for row in connection.execute(select(models.UserHeatmap))}
+
+    asyncio.run(compact())
+    before = heatmaps()
+    with engine.begin() as connection:
+        assert heatmap.rebuild(connection, results=results) == 2
+    after = heatmaps()
+    for username, expected in (('aian', blobs[:3]), ('kyra', blobs[3:])):
+        tests, (chars, bigrams) = after[username]
+        expected_chars, expected_bigrams = heatmap.aggregate_logs(expected)
+        assert tests == 3 and before[username][0] == 3
+        assert np.array_equal(chars, expected_chars) and np.array_equal(bigrams, expected_bigrams)
+
+    # Без архива сжатую историю взять негде: агрегаты не трогаются
+    monkeypatch.setattr(archive, 'result_archive', None)
+    with engine.begin() as connection:
+        assert heatmap.rebuild(connection) == 0
+        assert heatmap.rebuild(connection, 'aian') == 0
+    assert {username: tests for username, (tests, _) in heatmaps().items()} == {'aian': 3, 'kyra': 3}
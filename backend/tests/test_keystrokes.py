@@ -0,0 +1,104 @@
+import random
+
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+from app import keystrokes, schemas
+
+WORDS = ['саха', 'дойду', 'киһи', 'үлэ', 'ҕаҕа', 'өрүс', 'һаһыл', 'ыҥырыы']
+
+# Пошаговое воспроизведение для сверки с векторизованным replay
+def reference(deltas, codes, text):
+    words = text.split(' ')
+    typed, word_index, correct_keys, keys, correct_chars = [], 0, 0, 0, 0
+    for code in codes:
+        if code == keystrokes.BACKSPACE:
+            if typed:
+                typed.pop()
+            continue
+        keys += 1
+        target = words[word_index] if word_index < len(words) else ''
+        if code == keystrokes.SPACE:
+            ok = ''.join(typed) == target
+            correct_keys += ok
+            correct_chars += sum(a == b for a, b in zip(typed, target)) + ok
+            typed, word_index = [], word_index + 1
+            continue
+        char = chr(code)
+        position = len(typed)
+        correct_keys += position < len(target) and target[position] == char
+        typed.append(char)
+    target = words[word_index] if word_index < len(words) else ''
+    correct_chars += sum(a == b for a, b in zip(typed, target))
+    return correct_keys, keys, correct_chars
+
+def random_log(rng, text):
+    deltas, codes = [], []
+    for word in text.split(' '):
+        for char in word:
+            if rng.random() < 0.1:
+                codes.append(ord(rng.choice('абвҥ')))
+                deltas.append(rng.randint(60, 250))
+                if rng.random() < 0.7:
+                    codes.append(keystrokes.BACKSPACE)
+                    deltas.append(rng.randint(60, 250))
+            if rng.random() < 0.03:
+                codes.append(keystrokes.BACKSPACE)
+                deltas.append(rng.randint(60, 250))
+            codes.append(ord(char))
+            deltas.append(rng.randint(60, 250))
+        codes.append(keystrokes.SPACE)
+        deltas.append(rng.randint(60, 250))
+    return deltas, codes
+
+def test_replay_matches_sequential_reference():
+    rng = random.Random(3)
+    for _ in range(200):
+        text = ' '.join(rng.choices(WORDS, k=rng.randint(1, 20)))
+        deltas, codes = random_log(rng, text)
+        cut = rng.randint(0, len(codes))
+        deltas, codes = np.array(deltas[:cut], np.uint16), np.array(codes[:cut], np.uint16)
+        events = keystrokes.replay(deltas, codes, text)
+        typed = events['is_char'] | events['is_space']
+        correct_keys, keys, correct_chars = reference(deltas, codes, text)
+        assert int(typed.sum()) == keys
+        assert int((events['correct'] & typed).sum()) == correct_keys
+        assert events['kept_correct'].sum() + events['word_ok'].sum() == correct_chars
+
+def test_validate_recomputes_stats_from_log():
+    text = 'саха дойду'
+    codes = [ord(char) for char in 'саха'] + [keystrokes.SPACE] + [ord(char) for char in 'дойду'] + [keystrokes.SPACE]
+    data = keystrokes.encode([0] + [500] * (len(codes) - 1), codes)
+    stats = keystrokes.validate(data, text, 15)
+    assert stats['accuracy'] == 100.0
+    assert stats['total_errors'] == 0
+    # 11 верных символов (с пробелами) за 15 секунд
+    assert stats['wpm'] == pytest.approx(11 / 5 / 0.25)
+    assert stats['raw_wpm'] == stats['wpm']
+
+def test_validate_rejects_impossible_logs():
+    with pytest.raises(ValueError):
+        keystrokes.validate('not base64!', 'саха', 15)
+    with pytest.raises(ValueError):
+        keystrokes.validate(keystrokes.encode([20000, 20000], [ord('с'), ord('а')]), 'саха', 15)
+    with pytest.raises(ValueError):
+        keystrokes.validate(keystrokes.encode([1] * 1000, [ord('с')] * 1000), 'саха', 15)
+    # Длительность задает размер массивов: огромная отклоняется до их создания
+    with pytest.raises(ValueError):
+        keystrokes.validate(keystrokes.encode([100], [ord('с')]), 'саха', 10 ** 8)
+
+def test_result_duration_is_bounded_by_time_modes():
+    result = {'wpm': 50.0, 'raw_wpm': 55.0, 'accuracy': 96.0, 'burst_wpm': 70.0, 'total_errors': 2, 'time_mode': 15}
+    log = {'text': 'саха', 'data': keystrokes.encode([100, 100], [ord('с'), ord('а')])}
+    assert schemas.TestResultCreate.model_validate({**result, 'test_duration': 15, 'keystrokes': log}).wpm > 0
+    for extra in ({'test_duration': 10 ** 7}, {'test_duration': 0}, {'test_duration': 60, 'keystrokes': log}):
+        with pytest.raises(ValidationError):
+            schemas.TestResultCreate.model_validate({**result, **extra})
+
+def test_pack_roundtrip():
+    deltas, codes = np.array([0, 120, 80], np.uint16), np.array([ord('ҥ'), 8, 32], np.uint16)
+    unpacked = keystrokes.unpack(keystrokes.pack(deltas, codes, 'ҥ'))
+    assert unpacked[0].tolist() == deltas.tolist()
+    assert unpacked[1].tolist() == codes.tolist()
+    assert unpacked[2] == 'ҥ'
@@ -0,0 +1,42 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app.metrics import Metrics, MetricsMiddleware, Histogram
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, '/a')
+    lines = histogram.render()
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/a",le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 4' in lines
+    assert 'latency_seconds_count{route="/a"} 4' in lines
+    assert 'latency_seconds_sum{route="/a"} 4.05' in lines
+
+def test_middleware_records_route_template_and_queries(tmp_path):
+    registry = Metrics()
+    engine = create_engine(f'sqlite:///{tmp_path / "metrics.db"}')
+    registry.instrument_engine(engine, 'test')
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, registry=registry)
+
+    @app.get('/items/{item_id}')
+    def get_item(item_id: int):
+        with engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+            connection.execute(text('SELECT 2'))
+        return {'id': item_id}
+
+    client = TestClient(app)
+    assert client.get('/items/1').status_code == 200
+    assert client.get('/items/2').status_code == 200
+    assert client.get('/missing').status_code == 404
+    output = registry.render()
+    assert 'sakhatype_http_request_duration_seconds_count{method="GET",route="/items/{item_id}",status="200"} 2' in output
+    assert 'sakhatype_http_request_duration_seconds_count{method="GET",route="unmatched",status="404"} 1' in output
+    assert 'sakhatype_db_queries_per_request_sum{route="/items/{item_id}"} 4.0' in output
+    assert 'sakhatype_db_queries_total{engine="test"} 4' in output
+    assert 'sakhatype_http_requests_in_flight 0' in output
+    engine.dispose()
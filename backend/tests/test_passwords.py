@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+from app.auth import pwd_context, verify_and_rehash
+from app.passwords import PasswordHasher, PasswordHashSaturated
+
+def test_outdated_hash_is_rehashed_with_current_parameters():
+    old_hash = pwd_context.using(argon2__time_cost=1, argon2__memory_cost=8192).hash('secret')
+    assert pwd_context.needs_update(old_hash)
+
+    verified, new_hash = verify_and_rehash('secret', old_hash)
+    assert verified
+    assert not pwd_context.needs_update(new_hash)
+    assert pwd_context.verify('secret', new_hash)
+
+    assert verify_and_rehash('wrong', old_hash) == (False, None)
+    assert verify_and_rehash('secret', new_hash) == (True, None)
+
+def test_saturated_queue_rejects_instead_of_waiting():
+    hasher = PasswordHasher(workers=1, queue_limit=1)
+
+    async def burst():
+        return await asyncio.gather(
+            *(hasher.run('hash', time.sleep, 0.2) for _ in range(4)),
+            return_exceptions=True
+        )
+
+    try:
+        outcomes = asyncio.run(burst())
+    finally:
+        hasher.shutdown()
+    # Одна задача в работе, одна в очереди, остальные отклонены сразу
+    assert sum(isinstance(outcome, PasswordHashSaturated) for outcome in outcomes) == 2
+    snapshot = hasher.snapshot()
+    assert snapshot['rejected'] == 2
+    assert snapshot['completed']['hash'] == 2
+    assert snapshot['queued'] == 0
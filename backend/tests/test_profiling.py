@@ -0,0 +1,49 @@
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app.config import settings
+from app.profiling import ProfilingMiddleware, SlowQueryLog
+
+def busy(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+def test_slow_query_log_records_plan(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "slow.db"}')
+    log = SlowQueryLog(threshold_ms=0, size=2)
+    log.instrument_engine(engine, 'test')
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)'))
+        connection.execute(text('SELECT name FROM items WHERE id = :id'), {'id': 1})
+        connection.execute(text('SELECT name FROM items WHERE name = :name'), {'name': 'a'})
+    entries = log.snapshot()
+    assert len(entries) == 2
+    assert entries[0]['plan'] == ['SCAN items']
+    assert 'USING INTEGER PRIMARY KEY' in entries[1]['plan'][0]
+    assert entries[1]['parameters'] == '(1,)'
+    engine.dispose()
+
+def test_profile_requires_admin_token(monkeypatch):
+    monkeypatch.setattr(settings, 'ADMIN_TOKEN', 'secret')
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, interval=1)
+
+    @app.get('/work')
+    def work():
+        busy(0.05)
+        return {'ok': True}
+
+    client = TestClient(app)
+    assert client.get('/work', headers={'X-Profile': '1'}).json() == {'ok': True}
+    assert client.get('/work', headers={'X-Profile': '1', 'X-Admin-Token': 'wrong'}).json() == {'ok': True}
+
+    response = client.get('/work', headers={'X-Profile': '1', 'X-Admin-Token': 'secret'})
+    assert response.headers['x-profile-status'] == '200'
+    assert int(response.headers['x-profile-samples']) > 0
+    stacks = [line.rsplit(' ', 1) for line in response.text.splitlines()]
+    assert all(count.isdigit() for _, count in stacks)
+    assert any('busy (tests/test_profiling.py:' in stack for stack, _ in stacks)
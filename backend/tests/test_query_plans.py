@@ -0,0 +1,57 @@
+from datetime import datetime
+
+from sqlalchemy import create_engine, delete, inspect
+from sqlalchemy.dialects import sqlite
+
+from app import crud, migrations, rollups
+
+def query_plan(connection, statement):
+    sql = str(statement.compile(dialect=sqlite.dialect(), compile_kwargs={'literal_binds': True}))
+    return ' | '.join(row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}'))
+
+def test_user_results_use_username_created_at_index(engine):
+    with engine.connect() as connection:
+        plan = query_plan(connection, crud.user_results_query('user', 50))
+    assert 'USING INDEX ix_test_results_user_history (username=?)' in plan
+    assert 'TEMP B-TREE' not in plan
+
+def test_history_pages_seek_by_cursor(engine):
+    after = (datetime(2024, 1, 31, 12, 0), 1000)
+    with engine.connect() as connection:
+        plan = query_plan(connection, crud.user_results_page_query('user', 51, after))
+        assert 'USING INDEX ix_test_results_user_history (username=? AND created_at<?)' in plan
+        assert 'TEMP B-TREE' not in plan
+
+        plan = query_plan(connection, crud.user_results_page_query('user', 51, after, time_mode=30))
+        assert 'USING INDEX ix_test_results_user_mode_history (username=? AND time_mode=? AND created_at<?)' in plan
+        assert 'TEMP B-TREE' not in plan
+
+def test_rollup_boards_use_composite_index(engine):
+    for metric, index in (('wpm', 'ix_rollup_board_wpm'), ('accuracy', 'ix_rollup_board_accuracy')):
+        with engine.connect() as connection:
+            plan = query_plan(connection, rollups.board_query(metric, 30, 'daily'))
+        assert f'leaderboard_rollups USING INDEX {index} (time_mode=? AND period=?)' in plan
+        assert 'TEMP B-TREE' not in plan
+
+def test_upgrade_adds_indexes_to_existing_database(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "old.db"}')
+    with engine.begin() as connection:
+        # Схема до появления статистики и индексов
+        connection.exec_driver_sql('CREATE TABLE users (username VARCHAR NOT NULL PRIMARY KEY, password VARCHAR)')
+        connection.exec_driver_sql("INSERT INTO users VALUES ('old', 'hash')")
+    with engine.begin() as connection:
+        assert migrations.upgrade(connection) == [version for version, _, _ in migrations.MIGRATIONS]
+    with engine.begin() as connection:
+        assert migrations.upgrade(connection) == []
+        indexes = {index['name'] for index in inspect(connection).get_indexes('test_results')}
+        assert {'ix_test_results_user_history', 'ix_test_results_user_mode_history'} <= indexes
+        assert connection.exec_driver_sql("SELECT total_tests, level FROM users").one() == (0, 1)
+    engine.dispose()
+
+def test_upgrade_drops_unused_users_board_indexes(engine):
+    with engine.begin() as connection:
+        # База, созданная до миграции 12
+        connection.exec_driver_sql('CREATE INDEX ix_users_best_wpm_total_tests ON users (best_wpm, total_tests)')
+        connection.execute(delete(migrations.schema_migrations).where(migrations.schema_migrations.c.version == 12))
+        assert migrations.upgrade(connection) == [12]
+        assert 'ix_users_best_wpm_total_tests' not in {index['name'] for index in inspect(connection).get_indexes('users')}
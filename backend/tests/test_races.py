@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app import races
+from app.main import app
+
+RESULT = {'wpm': 50.0, 'raw_wpm': 55.0, 'accuracy': 96.0, 'burst_wpm': 70.0, 'total_errors': 2}
+
+def sent(player):
+    # None — сигнал закрыть соединение
+    messages = [json.loads(message) for message in player._messages if message is not None]
+    player._messages.clear()
+    return messages
+
+def test_race_lifecycle_and_coalesced_ticks():
+    async def race():
+        manager = races.RaceManager(tick_ms=100, countdown=0, room_size=10, min_players=2, result_grace=5)
+        room = manager.rooms['r1'] = races.Room('r1', 15, ['саха', 'сирэ', 'улахан'])
+        a, b = races.Player(None, 'aian'), races.Player(None, 'sardaana')
+        manager.join(room, a)
+        manager.join(room, b)
+        assert [message['type'] for message in sent(a)] == ['joined', 'players', 'players']
+
+        await manager.handle(room, a, {'type': 'ready'})
+        assert room.state == races.WAITING
+        await manager.handle(room, b, {'type': 'ready'})
+        assert room.state == races.COUNTDOWN
+        with pytest.raises(races.RaceError):
+            manager.join(room, races.Player(None, 'late'))
+
+        manager.advance(room, room.starts_at)
+        assert room.state == races.RACING
+        # Прогресс ограничен длиной текста
+        await manager.handle(room, a, {'type': 'progress', 'chars': 5})
+        await manager.handle(room, b, {'type': 'progress', 'chars': 1000})
+        manager.advance(room, room.starts_at + 1)
+        await manager.handle(room, a, {'type': 'progress', 'chars': 9})
+        manager.advance(room, room.starts_at + 2)
+        # Непрочитанный снимок заменяется новым, а не копится
+        tick = json.loads(a._tick)
+        assert tick['t'] == 2000 and tick['players'][0][:2] == ['aian', 9] and tick['players'][1][1] == len(room.text)
+
+        with pytest.raises(races.RaceError):
+            await manager.handle(room, a, {'type': 'result', 'result': RESULT})
+        manager.advance(room, room.ends_at)
+        assert room.state == races.FINISHED
+        await manager.handle(room, a, {'type': 'result', 'result': RESULT})
+        await manager.handle(room, b, {'type': 'result', 'result': {**RESULT, 'wpm': 70.0}})
+        sent(a)
+        manager.advance(room, room.ends_at + 0.1)
+        results = sent(a)[0]
+        assert results['type'] == 'results'
+        assert [(row['place'], row['name'], row['wpm']) for row in results['standings']] == [(1, 'sardaana', 70.0), (2, 'aian', 50.0)]
+        assert 'r1' not in manager.rooms
+
+    asyncio.run(race())
+
+def test_result_must_match_race_text():
+    async def check():
+        manager = races.RaceManager(tick_ms=100, countdown=0, room_size=10, min_players=1, result_grace=5)
+        room = races.Room('r2', 30, ['саха', 'сирэ'])
+        keystrokes = {'text': 'сирэ', 'data': ''}
+        with pytest.raises(races.RaceError):
+            await manager.save_result(room, races.Player(None, 'aian'), {**RESULT, 'keystrokes': keystrokes})
+        saved = await manager.save_result(room, races.Player(None, 'aian'), {**RESULT, 'time_mode': 60})
+        assert saved == {'id': None, 'wpm': 50.0, 'accuracy': 96.0}
+
+    asyncio.run(check())
+
+def test_invalid_room_is_rejected_before_accept():
+    client = TestClient(app)
+    with pytest.raises(WebSocketDisconnect) as error:
+        with client.websocket_connect('/api/races/bad room?time_mode=30'):
+            pass
+    assert error.value.code == races.POLICY_VIOLATION
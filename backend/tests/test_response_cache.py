@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.response_cache import ResponseCache, MemoryBackend
+
+# Локальная замена Redis: те же команды и те же bytes в ответах
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        value = self.data.get(key)
+        if value is None or (value[1] is not None and value[1] <= time.monotonic()):
+            return None
+        return value[0]
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = (bytes(value), time.monotonic() + ex if ex else None)
+        return True
+
+    async def mget(self, keys):
+        return [await self.get(key) for key in keys]
+
+    async def incr(self, key):
+        value = int(await self.get(key) or 0) + 1
+        self.data[key] = (str(value).encode(), None)
+        return value
+
+def make_client(backend):
+    cache = ResponseCache(backend, ttl=60, max_age=5)
+    app = FastAPI()
+    app.middleware('http')(cache.middleware)
+    calls = {'profile': 0}
+
+    @app.get('/api/profile/{username}')
+    async def profile(username: str, full: bool = False):
+        calls['profile'] += 1
+        return {'username': username, 'full': full, 'version': calls['profile']}
+
+    return TestClient(app), cache, calls
+
+def test_cached_responses_revalidate_and_invalidate():
+    for backend in (FakeRedis(), MemoryBackend(16)):
+        client, cache, calls = make_client(backend)
+
+        first = client.get('/api/profile/aiaal?full=1&x=2')
+        assert first.headers['X-Cache'] == 'MISS'
+        etag = first.headers['ETag']
+        assert first.headers['Cache-Control'] == 'public, max-age=5'
+
+        # Порядок параметров не влияет на ключ
+        second = client.get('/api/profile/aiaal?x=2&full=1')
+        assert second.headers['X-Cache'] == 'HIT'
+        assert second.content == first.content
+        assert calls['profile'] == 1
+
+        not_modified = client.get('/api/profile/aiaal?full=1&x=2', headers={'If-None-Match': etag})
+        assert not_modified.status_code == 304
+        assert not_modified.content == b''
+
+        asyncio.run(cache.invalidate_user('aiaal'))
+        fresh = client.get('/api/profile/aiaal?full=1&x=2', headers={'If-None-Match': etag})
+        assert fresh.status_code == 200
+        assert fresh.headers['X-Cache'] == 'MISS'
+        assert fresh.headers['ETag'] != etag
+        assert calls['profile'] == 2
+
+def test_memory_backend_evicts_least_recently_used():
+    async def scenario():
+        backend = MemoryBackend(2)
+        await backend.set('a', b'1')
+        await backend.set('b', b'2')
+        assert await backend.get('a') == b'1'
+        await backend.set('c', b'3')
+        return await backend.get('a'), await backend.get('b'), await backend.get('c')
+
+    assert asyncio.run(scenario()) == (b'1', None, b'3')
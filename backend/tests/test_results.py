@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import crud, models, schemas
+from app.auth import get_current_username
+from app.database import get_db
+from app.main import app
+
+RESULT = {
+    'wpm': 50.0, 'raw_wpm': 55.0, 'accuracy': 96.0, 'burst_wpm': 70.0,
+    'total_errors': 2, 'time_mode': 30, 'test_duration': 30,
+}
+
+def add_user(engine):
+    with engine.begin() as connection:
+        connection.execute(insert(models.User).values(
+            username='aian', password='-', created_at=datetime.utcnow(),
+            total_tests=0, total_time_seconds=0, best_wpm=0.0, best_accuracy=0.0, total_experience=0, level=1
+        ))
+
+@pytest.fixture
+def client(engine, tmp_path):
+    add_user(engine)
+    async_engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path / "test.db"}')
+    sessions = async_sessionmaker(async_engine, expire_on_commit=False)
+
+    async def get_test_db():
+        async with sessions() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = get_test_db
+    app.dependency_overrides[get_current_username] = lambda: 'aian'
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+    asyncio.run(async_engine.dispose())
+
+def test_only_batch_results_keep_the_client_time(engine, client):
+    yesterday = datetime.utcnow() - timedelta(days=1)
+    assert client.post('/api/results', json={**RESULT, 'created_at': yesterday.isoformat()}).status_code == 200
+    batch = client.post('/api/results/batch', json={'results': [{**RESULT, 'created_at': yesterday.isoformat()}]})
+    assert batch.json()['created'] == 1
+    with engine.connect() as connection:
+        live, queued = connection.scalars(select(models.TestResult.created_at).order_by(models.TestResult.id)).all()
+    # Живой результат не переносится в прошлое, результат из очереди — переносится
+    assert live > yesterday + timedelta(hours=23)
+    assert queued == yesterday
+
+def test_current_user_is_served_without_password(client):
+    me = client.get('/api/users/me').json()
+    assert me['username'] == 'aian' and me['level'] == 1
+    assert 'password' not in me
+
+def test_concurrent_submits_of_one_user_are_all_counted(engine, tmp_path):
+    add_user(engine)
+    wpm = [40.0 + i for i in range(30)]
+
+    async def main():
+        async_engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path / "test.db"}')
+        sessions = async_sessionmaker(async_engine, expire_on_commit=False)
+
+        async def submit(value):
+            async with sessions() as db:
+                # Как в запросе: строка пользователя уже загружена при авторизации
+                await crud.get_user_by_username(db, 'aian')
+                await crud.create_test_result(db, 'aian', schemas.TestResultCreate(
+                    wpm=value, raw_wpm=value, accuracy=90.0, burst_wpm=value,
+                    total_errors=0, time_mode=30, test_duration=30
+                ))
+
+        await asyncio.gather(*(submit(value) for value in wpm))
+        await async_engine.dispose()
+
+    asyncio.run(main())
+    with engine.connect() as connection:
+        user = connection.execute(select(models.User)).one()
+        tests = connection.scalar(select(models.UserStats.tests).where(models.UserStats.time_mode == 0))
+    assert (user.total_tests, user.total_time_seconds, user.best_wpm, tests) == (30, 900, 69.0, 30)
+    experience = sum(int(value + 90.0) for value in wpm)
+    assert (user.total_experience, user.level) == (experience, 1 + experience // 1000)
@@ -0,0 +1,54 @@
+from datetime import datetime
+from typing import List
+import json
+
+from pydantic import TypeAdapter
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from app import crud, models, schemas
+from app.leaderboard import LeaderboardEngine, LEADERBOARD_COLUMNS
+from app.serialization import entries_response, rows_body, rows_response
+
+def add_results(engine):
+    with engine.begin() as connection:
+        connection.execute(insert(models.TestResult), [
+            {
+                'username': 'aian', 'wpm': 60.5 + i, 'raw_wpm': 65.0, 'accuracy': 95.25, 'burst_wpm': 80.0,
+                'total_errors': i, 'time_mode': 30, 'test_duration': 30, 'consistency': 70.0,
+                'created_at': datetime(2026, 1, 1 + i, 12, 30, 15, 250000 * i), 'text_id': 7 if i else None,
+            }
+            for i in range(3)
+        ])
+
+def test_result_rows_match_the_pydantic_response(engine):
+    add_results(engine)
+    with engine.connect() as connection:
+        rows = connection.execute(crud.user_results_query('aian', 50)).all()
+    with Session(engine) as session:
+        objects = session.scalars(
+            select(models.TestResult).order_by(models.TestResult.created_at.desc())
+        ).all()
+        adapter = TypeAdapter(List[schemas.TestResultResponse])
+        expected = adapter.dump_json(adapter.validate_python(objects, from_attributes=True))
+
+    assert rows_response(crud.RESULT_COLUMNS, rows).body == expected
+    columns = rows_body(crud.RESULT_COLUMNS, rows, 'columnar')
+    assert list(columns) == list(crud.RESULT_COLUMNS)
+    assert columns['wpm'] == [62.5, 61.5, 60.5] and columns['text_id'] == [7, 7, None]
+    assert rows_body(crud.RESULT_COLUMNS, [], 'columnar') == {column: [] for column in crud.RESULT_COLUMNS}
+
+def test_leaderboard_entries_match_the_pydantic_response():
+    engine = LeaderboardEngine()
+    for name, wpm in (('aian', 60.0), ('sardaana', 70.5)):
+        user = models.User(username=name, total_tests=1, best_wpm=wpm, best_accuracy=95.0, level=1)
+        engine.record_result(user, models.TestResult(time_mode=30, wpm=wpm, accuracy=95.0, text_id=None))
+    entries = engine.top('wpm')
+    adapter = TypeAdapter(List[schemas.LeaderboardEntry])
+    expected = adapter.dump_json(adapter.validate_python(entries))
+
+    assert entries_response(LEADERBOARD_COLUMNS, entries).body == expected
+    assert json.loads(entries_response(LEADERBOARD_COLUMNS, entries, 'columnar').body) == {
+        'username': ['sardaana', 'aian'], 'wpm': [70.5, 60.0], 'accuracy': [None, None],
+        'total_tests': [1, 1], 'best_wpm': [70.5, 60.0], 'best_accuracy': [95.0, 95.0], 'level': [1, 1],
+    }
@@ -0,0 +1,74 @@
+import asyncio
+import random
+import statistics
+from datetime import date, datetime
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import models, stats
+
+def make_result(wpm, accuracy, time_mode=30):
+    return SimpleNamespace(wpm=wpm, accuracy=accuracy, consistency=50.0, time_mode=time_mode, created_at=datetime(2024, 1, 1))
+
+def test_incremental_aggregates_match_full_recompute():
+    rng = random.Random(7)
+    results = [make_result(rng.uniform(20, 140), rng.uniform(80, 100)) for _ in range(250)]
+    row = stats.new_stats('user', 0)
+    for result in results:
+        stats.apply_result(row, result)
+
+    summary = stats.summarize(row)
+    wpm = [result.wpm for result in results]
+    accuracy = [result.accuracy for result in results]
+    assert summary['tests'] == 250
+    assert summary['avg_wpm'] == pytest.approx(statistics.fmean(wpm))
+    assert summary['wpm_stddev'] == pytest.approx(statistics.pstdev(wpm))
+    assert summary['avg_accuracy'] == pytest.approx(statistics.fmean(accuracy))
+    # Кольцевые буферы хранят float32
+    assert summary['last_10_wpm'] == pytest.approx(statistics.fmean(wpm[-10:]), rel=1e-5)
+    assert summary['last_100_wpm'] == pytest.approx(statistics.fmean(wpm[-100:]), rel=1e-5)
+    assert summary['last_100_accuracy'] == pytest.approx(statistics.fmean(accuracy[-100:]), rel=1e-5)
+    assert len(row.recent_wpm) == stats.RECENT_SIZE * 4
+
+def test_history_is_downsampled_to_requested_points():
+    days = [
+        SimpleNamespace(day=date(2024, 1, 1 + i), tests=2, sum_wpm=100.0 + i, sum_accuracy=190.0, best_wpm=60.0 + i)
+        for i in range(30)
+    ]
+    history = stats.downsample(days, 10)
+    assert len(history) == 10
+    assert history[0] == {
+        'day': date(2024, 1, 1),
+        'tests': 6,
+        'avg_wpm': (100.0 + 101.0 + 102.0) / 6,
+        'best_wpm': 62.0,
+        'avg_accuracy': 95.0,
+    }
+    assert len(stats.downsample(days, 60)) == 30
+
+def test_concurrent_results_do_not_lose_updates(engine, tmp_path):
+    wpm = [40.0 + i for i in range(12)]
+
+    async def main():
+        async_engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path / "test.db"}')
+        sessions = async_sessionmaker(async_engine, expire_on_commit=False)
+
+        async def submit(value):
+            async with sessions() as db:
+                await stats.record_results(db, {'aian': [make_result(value, 95.0)]})
+                await db.commit()
+
+        # Первые результаты пользователя: строк статистики еще нет
+        await asyncio.gather(*(submit(value) for value in wpm))
+        async with sessions() as db:
+            rows = (await db.scalars(select(models.UserStats).order_by(models.UserStats.time_mode))).all()
+        await async_engine.dispose()
+        return rows
+
+    rows = asyncio.run(main())
+    assert [(row.time_mode, row.tests) for row in rows] == [(0, 12), (30, 12)]
+    assert rows[0].wpm_mean == pytest.approx(statistics.fmean(wpm))
+    assert sorted(stats.recent_values(rows[0].recent_wpm, rows[0].tests)) == wpm
@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+from sqlalchemy import select
+
+from app import models, texts
+from app.leaderboard import LeaderboardEngine
+
+def test_normalize_text_and_buckets():
+    assert texts.normalize_text('  Саха\tсирэ\n\nулахан  ') == 'Саха сирэ улахан'
+    assert texts.normalize_text('   ') is None
+    assert texts.normalize_text('😀 смайлик') is None
+    assert texts.bucket_for(99) == 'short'
+    assert texts.bucket_for(100) == 'medium'
+    assert texts.bucket_for(1000) == 'long'
+
+def test_import_texts_skips_duplicates(engine):
+    lines = ['Саха сирэ\n', 'улахан.\n', '\n', '\n', 'Саха   сирэ улахан.\n', '\n', 'ы' * 150 + '\n']
+    with engine.begin() as connection:
+        report = texts.import_texts(connection, texts.read_passages(lines), source='test')
+        rows = connection.execute(
+            select(models.Text.content, models.Text.bucket, models.Text.word_count).order_by(models.Text.id)
+        ).all()
+    assert report == {'read': 3, 'skipped': 0}
+    assert [tuple(row) for row in rows] == [('Саха сирэ улахан.', 'short', 3), ('ы' * 150, 'medium', 1)]
+
+def test_text_pool_picks_from_bucket():
+    pool = texts.TextPool()
+    pool.load_rows([(1, 'sah', 'short'), (2, 'sah', 'long'), (3, 'ru', 'short'), (5, 'sah', 'short')])
+    assert len(pool) == 4
+    assert 5 in pool and 4 not in pool
+    assert {pool.pick('short', seed=seed) for seed in range(50)} == {1, 3, 5}
+    assert {pool.pick('short', 'sah', seed=seed) for seed in range(50)} == {1, 5}
+    assert pool.pick('medium') is None
+
+def test_text_leaderboard_keeps_best_result():
+    engine = LeaderboardEngine()
+    user = SimpleNamespace(username='aian', total_tests=1, best_wpm=60.0, best_accuracy=95.0, level=1)
+    other = SimpleNamespace(username='sardaana', total_tests=1, best_wpm=70.0, best_accuracy=90.0, level=1)
+    engine.record_result(user, SimpleNamespace(time_mode=0, wpm=60.0, accuracy=95.0, text_id=7))
+    engine.record_result(other, SimpleNamespace(time_mode=0, wpm=70.0, accuracy=90.0, text_id=7))
+    engine.record_result(user, SimpleNamespace(time_mode=0, wpm=50.0, accuracy=97.0, text_id=7))
+    assert [(entry['username'], entry['wpm']) for entry in engine.top_text('wpm', 7)] == [('sardaana', 70.0), ('aian', 60.0)]
+    assert [(entry['username'], entry['accuracy']) for entry in engine.top_text('accuracy', 7)] == [('aian', 97.0), ('sardaana', 90.0)]
+    assert engine.top_text('wpm', 8) == []
@@ -0,0 +1,32 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from app import heatmap
+from app.word_pool import WordPool
+
+def test_adaptive_sampling_follows_word_weights():
+    words = ['ҥаа', 'ҥаҥ', 'саха', 'үлэ']
+    pool = WordPool()
+    pool.load_words(words)
+    weakness = np.zeros(heatmap.SIZE)
+    weakness[heatmap.ALPHABET.index('ҥ')] = 1.0
+    boost = 2.0
+
+    samples = Counter()
+    for seed in range(500):
+        samples.update(pool.sample_adaptive(weakness, 4, seed=seed, boost=boost))
+
+    # Вес слова: 1 + boost * (число букв ҥ)
+    weights = np.array([1 + boost * word.count('ҥ') for word in words])
+    expected = weights / weights.sum()
+    total = sum(samples.values())
+    observed = np.array([samples[word] / total for word in words])
+    assert observed == pytest.approx(expected, abs=0.02)
+
+def test_adaptive_sampling_without_weak_letters_is_uniform_over_pool():
+    pool = WordPool()
+    pool.load_words(['саха', 'дойду'])
+    assert set(pool.sample_adaptive(np.zeros(heatmap.SIZE), 2, seed=3)) <= {'саха', 'дойду'}
+    assert WordPool().sample_adaptive(np.zeros(heatmap.SIZE), 10) == []
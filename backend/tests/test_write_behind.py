@@ -0,0 +1,168 @@
+from datetime import datetime, timedelta
+import asyncio
+import os
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import crud, models, schemas
+from app.write_behind import WriteBehind, read_segment
+
+def result(wpm: float, created_at: datetime = None):
+    return schemas.QueuedTestResult(
+        wpm=wpm, raw_wpm=wpm + 5, accuracy=95.0, burst_wpm=wpm + 10,
+        total_errors=3, time_mode=30, test_duration=30, created_at=created_at
+    )
+
+def run(tmp_path, scenario):
+    async def main():
+        async_engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path / "test.db"}')
+        try:
+            return await scenario(async_sessionmaker(async_engine, expire_on_commit=False))
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(main())
+
+def add_user(engine, username: str):
+    with engine.begin() as connection:
+        connection.execute(insert(models.User).values(username=username, password='-', created_at=datetime.utcnow()))
+
+def counts(engine):
+    with engine.connect() as connection:
+        results = connection.scalar(select(func.count(models.TestResult.id)))
+        user = connection.execute(select(models.User.total_tests, models.User.best_wpm)).one()
+        applied = connection.scalar(select(models.WriteBehindState.applied_seq))
+    return results, tuple(user), applied
+
+def test_acknowledged_results_survive_a_crash(engine, tmp_path):
+    add_user(engine, 'aian')
+    path = str(tmp_path / 'results.wbl')
+
+    async def crash(sessions):
+        log = WriteBehind(path, flush_ms=60000, batch_size=1000, session_factory=sessions)
+        await log.start()
+        await log.submit('aian', [result(60.0), result(70.0)])
+        await log.submit('aian', [result(50.0)])
+        # Падение: ни сброса, ни stop — asyncio.run просто отменит задачи
+        return log.segment_path(log._segment)
+
+    segment = run(tmp_path, crash)
+    assert counts(engine) == (0, (0, 0.0), None)
+    # Запись, оборванная посреди строки, не подтверждалась и пропускается
+    with open(segment, 'a', encoding='utf-8') as file:
+        file.write('[4,"aian","2026-')
+
+    async def restart(sessions):
+        log = WriteBehind(path, flush_ms=60000, batch_size=2, session_factory=sessions)
+        await log.start()
+        snapshot = log.snapshot()
+        await log.stop()
+        return snapshot
+
+    snapshot = run(tmp_path, restart)
+    assert snapshot['replayed'] == 3 and snapshot['seq'] == 3
+    assert counts(engine) == (3, (3, 70.0), 3)
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('results.wbl')]
+
+def test_replay_after_commit_does_not_duplicate(engine, tmp_path):
+    add_user(engine, 'aian')
+    path = str(tmp_path / 'results.wbl')
+
+    async def flush_then_lose_cleanup(sessions):
+        log = WriteBehind(path, flush_ms=60000, batch_size=1000, session_factory=sessions)
+        await log.start()
+        await log.submit('aian', [result(60.0), result(65.0)])
+        segment = log.segment_path(log._segment)
+        with open(segment, 'rb') as file:
+            data = file.read()
+        await log.stop()
+        # Сегмент «пережил» commit, как при падении до удаления
+        with open(segment, 'wb') as file:
+            file.write(data)
+
+    async def restart(sessions):
+        log = WriteBehind(path, flush_ms=10, batch_size=1000, session_factory=sessions)
+        await log.start()
+        entries = await log.submit('aian', [result(80.0)])
+        snapshot = log.snapshot()
+        await log.stop()
+        return entries[0][0], snapshot
+
+    run(tmp_path, flush_then_lose_cleanup)
+    assert counts(engine) == (2, (2, 65.0), 2)
+    seq, snapshot = run(tmp_path, restart)
+    assert snapshot['replayed'] == 0 and seq == 3
+    assert counts(engine) == (3, (3, 80.0), 3)
+
+def test_queued_results_keep_their_client_time(engine, tmp_path):
+    add_user(engine, 'aian')
+    path = str(tmp_path / 'results.wbl')
+    started = datetime.utcnow()
+
+    async def submit(sessions):
+        log = WriteBehind(path, flush_ms=10, batch_size=1000, session_factory=sessions)
+        await log.start()
+        # Два дня офлайн, часы клиента спешат, очередь старше окна
+        await log.submit('aian', [
+            result(60.0, started - timedelta(days=2)),
+            result(61.0, started + timedelta(days=1)),
+            result(62.0, started - timedelta(days=30)),
+        ])
+        await log.stop()
+
+    run(tmp_path, submit)
+    finished = datetime.utcnow()
+    with engine.connect() as connection:
+        offline, future, stale = connection.scalars(
+            select(models.TestResult.created_at).order_by(models.TestResult.id)
+        ).all()
+    assert offline == started - timedelta(days=2)
+    assert started <= future <= finished
+    assert started - timedelta(days=7) <= stale <= finished - timedelta(days=7)
+
+def test_failing_entry_goes_to_dead_letters(engine, tmp_path, monkeypatch):
+    add_user(engine, 'aian')
+    path = str(tmp_path / 'results.wbl')
+    add_test_results = crud.add_test_results
+
+    async def reject_ghost(db, results_by_user):
+        if 'ghost' in results_by_user:
+            raise ValueError('unknown user')
+        return await add_test_results(db, results_by_user)
+
+    monkeypatch.setattr(crud, 'add_test_results', reject_ghost)
+
+    async def flush(sessions):
+        log = WriteBehind(path, flush_ms=60000, batch_size=1000, session_factory=sessions)
+        await log.start()
+        await log.submit('aian', [result(60.0)])
+        await log.submit('ghost', [result(90.0)])
+        await log.submit('aian', [result(70.0)])
+        await log.stop()
+        return log.snapshot()
+
+    snapshot = run(tmp_path, flush)
+    assert snapshot['pending'] == 0 and snapshot['dead_letters'] == 1
+    assert snapshot['flushed'] == 3 and snapshot['failed_flushes'] == 0
+    assert counts(engine) == (2, (2, 70.0), 3)
+    assert [entry[:2] for entry in read_segment(path + '.dead')] == [(2, 'ghost')]
+
+    # То же при воспроизведении журнала: start не прерывается на плохой записи
+    async def crash(sessions):
+        log = WriteBehind(path, flush_ms=60000, batch_size=1000, session_factory=sessions)
+        await log.start()
+        await log.submit('ghost', [result(90.0)])
+        await log.submit('aian', [result(80.0)])
+
+    async def restart(sessions):
+        log = WriteBehind(path, flush_ms=60000, batch_size=1000, session_factory=sessions)
+        await log.start()
+        snapshot = log.snapshot()
+        await log.stop()
+        return snapshot
+
+    run(tmp_path, crash)
+    snapshot = run(tmp_path, restart)
+    assert snapshot['replayed'] == 2 and snapshot['dead_letters'] == 1
+    assert counts(engine) == (3, (3, 80.0), 5)
+    assert [entry[:2] for entry in read_segment(path + '.dead')] == [(2, 'ghost'), (4, 'ghost')]
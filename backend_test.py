@@ -67,6 +67,23 @@ class SakhatypeAPITester:
             self.log_result("Get Words", False, f"Request error: {str(e)}")
         return False
         
+    def test_get_words_seed(self):
+        """Test GET /api/words?seed= - same seed returns the same word list"""
+        try:
+            first = requests.get(f"{self.base_url}/api/words", params={"limit": 20, "seed": 42})
+            second = requests.get(f"{self.base_url}/api/words", params={"limit": 20, "seed": 42})
+            if first.status_code == 200 and second.status_code == 200:
+                if first.json() == second.json() and len(first.json()) == 20:
+                    self.log_result("Get Words Seed", True, "Seeded word lists are reproducible")
+                    return True
+                else:
+                    self.log_result("Get Words Seed", False, "Seeded word lists differ", [first.json(), second.json()])
+            else:
+                self.log_result("Get Words Seed", False, f"HTTP {first.status_code}/{second.status_code}", first.text)
+        except Exception as e:
+            self.log_result("Get Words Seed", False, f"Request error: {str(e)}")
+        return False
+        
     def test_register(self):
         """Test POST /api/auth/register"""
         try:
@@ -195,6 +212,108 @@ class SakhatypeAPITester:
             self.log_result("Get User Results", False, f"Request error: {str(e)}")
         return False
         
+    def test_get_user_results_history(self):
+        """Test GET /api/results/user/testuser/history - keyset pagination"""
+        try:
+            response = requests.get(f"{self.base_url}/api/results/user/{self.test_username}/history", params={"limit": 1})
+            
+            if response.status_code == 200:
+                data = response.json()
+                if isinstance(data.get("items"), list) and "next_cursor" in data:
+                    if data["next_cursor"]:
+                        next_page = requests.get(
+                            f"{self.base_url}/api/results/user/{self.test_username}/history",
+                            params={"limit": 1, "cursor": data["next_cursor"]}
+                        )
+                        if next_page.status_code != 200:
+                            self.log_result("Get User Results History", False, f"Next page HTTP {next_page.status_code}", next_page.text)
+                            return False
+                    self.log_result("Get User Results History", True, f"Retrieved page with {len(data['items'])} results")
+                    return True
+                else:
+                    self.log_result("Get User Results History", False, "Page response missing items/next_cursor", data)
+            else:
+                self.log_result("Get User Results History", False, f"HTTP {response.status_code}", response.text)
+        except Exception as e:
+            self.log_result("Get User Results History", False, f"Request error: {str(e)}")
+        return False
+        
+    def test_get_user_heatmap(self):
+        """Test GET /api/profile/testuser/heatmap"""
+        try:
+            response = requests.get(f"{self.base_url}/api/profile/{self.test_username}/heatmap")
+            
+            if response.status_code == 200:
+                data = response.json()
+                keys = {cell["key"] for cell in data.get("characters", [])}
+                if set(data.get("sakha_letters", "")) <= keys and isinstance(data.get("bigrams"), list):
+                    self.log_result("Get User Heatmap", True, f"Heatmap over {data['tests']} logged tests")
+                    return True
+                else:
+                    self.log_result("Get User Heatmap", False, "Heatmap missing Sakha letters or bigrams", data)
+            else:
+                self.log_result("Get User Heatmap", False, f"HTTP {response.status_code}", response.text)
+        except Exception as e:
+            self.log_result("Get User Heatmap", False, f"Request error: {str(e)}")
+        return False
+        
+    def test_random_text(self):
+        """Test GET /api/texts/random"""
+        try:
+            response = requests.get(f"{self.base_url}/api/texts/random", params={"length": "short"})
+            
+            if response.status_code == 200:
+                data = response.json()
+                if data.get("bucket") == "short" and data.get("content"):
+                    self.log_result("Random Text", True, f"Text {data['id']}: {data['word_count']} words")
+                    return True
+                else:
+                    self.log_result("Random Text", False, "Text response missing required fields", data)
+            elif response.status_code == 404:
+                # Тексты загружаются отдельно: python -m app.texts FILE
+                self.log_result("Random Text", True, "No texts imported yet")
+                return True
+            else:
+                self.log_result("Random Text", False, f"HTTP {response.status_code}", response.text)
+        except Exception as e:
+            self.log_result("Random Text", False, f"Request error: {str(e)}")
+        return False
+        
+    def test_metrics(self):
+        """Test GET /metrics"""
+        try:
+            response = requests.get(f"{self.base_url}/metrics")
+            
+            if response.status_code == 200:
+                if "sakhatype_http_request_duration_seconds_bucket" in response.text:
+                    self.log_result("Metrics", True, f"{len(response.text.splitlines())} metric lines")
+                    return True
+                else:
+                    self.log_result("Metrics", False, "Request latency histogram missing", response.text[:200])
+            else:
+                self.log_result("Metrics", False, f"HTTP {response.status_code}", response.text)
+        except Exception as e:
+            self.log_result("Metrics", False, f"Request error: {str(e)}")
+        return False
+        
+    def test_list_races(self):
+        """Test GET /api/races"""
+        try:
+            response = requests.get(f"{self.base_url}/api/races")
+            
+            if response.status_code == 200:
+                rooms = response.json()
+                if isinstance(rooms, list):
+                    self.log_result("List Races", True, f"{len(rooms)} rooms open")
+                    return True
+                else:
+                    self.log_result("List Races", False, "Response is not a list", rooms)
+            else:
+                self.log_result("List Races", False, f"HTTP {response.status_code}", response.text)
+        except Exception as e:
+            self.log_result("List Races", False, f"Request error: {str(e)}")
+        return False
+        
     def test_get_user_profile(self):
         """Test GET /api/profile/testuser"""
         try:
@@ -249,6 +368,24 @@ class SakhatypeAPITester:
             self.log_result("Leaderboard Accuracy", False, f"Request error: {str(e)}")
         return False
         
+    def test_leaderboard_rank(self):
+        """Test GET /api/leaderboard/wpm/rank/testuser"""
+        try:
+            response = requests.get(f"{self.base_url}/api/leaderboard/wpm/rank/{self.test_username}")
+            
+            if response.status_code == 200:
+                data = response.json()
+                if data.get("username") == self.test_username and data.get("rank", 0) >= 1:
+                    self.log_result("Leaderboard Rank", True, f"User '{self.test_username}' is #{data['rank']} of {data['total']}")
+                    return True
+                else:
+                    self.log_result("Leaderboard Rank", False, "Rank response invalid", data)
+            else:
+                self.log_result("Leaderboard Rank", False, f"HTTP {response.status_code}", response.text)
+        except Exception as e:
+            self.log_result("Leaderboard Rank", False, f"Request error: {str(e)}")
+        return False
+        
     def run_all_tests(self):
         """Run all tests in sequence"""
         print(f"🚀 Starting Sakhatype API Tests")
@@ -259,14 +396,21 @@ class SakhatypeAPITester:
         tests = [
             ("1. Health Check", self.test_health_check),
             ("2. Get Words", self.test_get_words),
+            ("2a. Get Words Seed", self.test_get_words_seed),
             ("3. User Registration", self.test_register),
             ("4. User Login", self.test_login),
             ("5. Get Current User", self.test_get_current_user),
             ("6. Save Test Result", self.test_save_result),
             ("7. Get User Results", self.test_get_user_results),
+            ("7a. Get User Results History", self.test_get_user_results_history),
             ("8. Get User Profile", self.test_get_user_profile),
+            ("8a. Get User Heatmap", self.test_get_user_heatmap),
             ("9. Leaderboard WPM", self.test_leaderboard_wpm),
-            ("10. Leaderboard Accuracy", self.test_leaderboard_accuracy)
+            ("10. Leaderboard Accuracy", self.test_leaderboard_accuracy),
+            ("11. Leaderboard Rank", self.test_leaderboard_rank),
+            ("12. Random Text", self.test_random_text),
+            ("13. Metrics", self.test_metrics),
+            ("14. List Races", self.test_list_races)
         ]
         
         passed = 0
@@ -81,8 +81,27 @@ class ApiService {
   }
 
   // Words
-  async getWords(limit: number = 100) {
-    return this.request(`/api/words?limit=${limit}`)
+  async getWords(
+    limit: number = 100,
+    mode: 'uniform' | 'adaptive' = 'uniform',
+    language?: string,
+    top?: 200 | 1000 | 10000
+  ) {
+    const params = new URLSearchParams({ limit: String(limit), mode })
+    if (language) params.set('language', language)
+    if (top) params.set('top', String(top))
+    return this.request(`/api/words?${params}`)
+  }
+
+  // Texts (quote mode)
+  async getRandomText(length: 'short' | 'medium' | 'long' = 'medium', language?: string) {
+    const params = new URLSearchParams({ length })
+    if (language) params.set('language', language)
+    return this.request(`/api/texts/random?${params}`)
+  }
+
+  async getText(id: number) {
+    return this.request(`/api/texts/${id}`)
   }
 
   // Test Results
@@ -93,15 +112,52 @@ class ApiService {
     })
   }
 
+  async saveTestResultsBatch(results: any[]) {
+    return this.request('/api/results/batch', {
+      method: 'POST',
+      body: JSON.stringify({ results }),
+    })
+  }
+
   async getUserResults(username: string, limit: number = 50) {
     return this.request(`/api/results/user/${username}?limit=${limit}`)
   }
 
+  async getUserResultsPage(username: string, cursor: string | null = null, limit: number = 50) {
+    const params = new URLSearchParams({ limit: String(limit) })
+    if (cursor) params.append('cursor', cursor)
+    return this.request(`/api/results/user/${username}/history?${params}`)
+  }
+
   async getUserProfile(username: string) {
     return this.request(`/api/profile/${username}`)
   }
 
+  async getUserStats(username: string, points: number = 60) {
+    return this.request(`/api/profile/${username}/stats?points=${points}`)
+  }
+
+  async getUserHeatmap(username: string, bigrams: number = 20) {
+    return this.request(`/api/profile/${username}/heatmap?bigrams=${bigrams}`)
+  }
+
+  // Races
+  async getRaces() {
+    return this.request('/api/races')
+  }
+
+  raceUrl(roomId: string, timeMode: number = 30, language: string | null = null) {
+    const params = new URLSearchParams({ time_mode: String(timeMode) })
+    if (language) params.append('language', language)
+    if (this.token) params.append('token', this.token)
+    return `${API_URL.replace(/^http/, 'ws')}/api/races/${encodeURIComponent(roomId)}?${params}`
+  }
+
   // Leaderboard
+  async getTextLeaderboard(textId: number, metric: 'wpm' | 'accuracy' = 'wpm', limit: number = 100) {
+    return this.request(`/api/leaderboard/text/${textId}?metric=${metric}&limit=${limit}`)
+  }
+
   async getLeaderboardWpm(limit: number = 100) {
     return this.request(`/api/leaderboard/wpm?limit=${limit}`)
   }
@@ -2,6 +2,29 @@ import { defineStore } from 'pinia'
 import { apiService } from '@/services/api'
 import { useAuthStore } from './auth'
 
+// Очередь результатов, не отправленных из-за потери связи (не больше лимита пакета на сервере)
+const PENDING_RESULTS_KEY = 'pendingResults'
+const PENDING_RESULTS_LIMIT = 100
+let flushingPendingResults = false
+
+// Журнал нажатий для проверки результата на сервере (формат в backend/app/keystrokes.py)
+const KEYSTROKE_LOG_VERSION = 1
+const KEY_BACKSPACE = 8
+const KEY_SPACE = 32
+
+function encodeKeystrokes(deltas: number[], codes: number[]) {
+  const view = new DataView(new ArrayBuffer(1 + deltas.length * 4))
+  view.setUint8(0, KEYSTROKE_LOG_VERSION)
+  deltas.forEach((delta, i) => view.setUint16(1 + i * 2, Math.min(delta, 65535), true))
+  codes.forEach((code, i) => view.setUint16(1 + deltas.length * 2 + i * 2, code, true))
+  const bytes = new Uint8Array(view.buffer)
+  let binary = ''
+  for (let i = 0; i < bytes.length; i += 0x8000) {
+    binary += String.fromCharCode(...bytes.subarray(i, i + 0x8000))
+  }
+  return btoa(binary)
+}
+
 export const useTypingStore = defineStore('typing', {
   state: () => ({
     serverWords: [] as string[], // Слова с сервера
@@ -29,6 +52,10 @@ export const useTypingStore = defineStore('typing', {
     errorsPerSecond: {} as Record<number, number>,
     burstWpm: 0,
     errorTimestamps: [] as number[],
+    keystrokeText: '',
+    keystrokeDeltas: [] as number[],
+    keystrokeCodes: [] as number[],
+    lastKeystrokeTime: null as number | null,
     timerInterval: null as any,
   }),
 
@@ -90,7 +117,9 @@ export const useTypingStore = defineStore('typing', {
   actions: {
     async loadWords() {
       try {
-        const words = await apiService.getWords(200)
+        // Вошедшему пользователю сервер подбирает слова с его слабыми буквами
+        const mode = useAuthStore().isAuthenticated ? 'adaptive' : 'uniform'
+        const words = await apiService.getWords(200, mode)
         this.serverWords = words
       } catch (error) {
         console.error('Failed to load words from server:', error)
@@ -151,6 +180,10 @@ export const useTypingStore = defineStore('typing', {
 
       this.currentText = this.generateText()
       this.words = this.currentText.split(' ')
+      this.keystrokeText = this.currentText
+      this.keystrokeDeltas = []
+      this.keystrokeCodes = []
+      this.lastKeystrokeTime = null
       this.currentWordIndex = 0
       this.currentCharIndex = 0
       this.correctChars = 0
@@ -233,28 +266,77 @@ export const useTypingStore = defineStore('typing', {
       // Сохраняем результаты на сервер если пользователь авторизован
       const authStore = useAuthStore()
       if (authStore.isAuthenticated && this.startTime) {
+        const stats = this.finalStats
+        const result = {
+          wpm: stats.wpm,
+          raw_wpm: stats.rawWpm,
+          accuracy: stats.accuracy,
+          burst_wpm: stats.burstWpm,
+          total_errors: stats.totalErrors,
+          time_mode: this.selectedTime,
+          test_duration: this.selectedTime,
+          consistency: stats.consistency,
+          keystrokes: {
+            text: this.keystrokeText,
+            data: encodeKeystrokes(this.keystrokeDeltas, this.keystrokeCodes),
+          },
+        }
         try {
-          const stats = this.finalStats
-          await apiService.saveTestResult({
-            wpm: stats.wpm,
-            raw_wpm: stats.rawWpm,
-            accuracy: stats.accuracy,
-            burst_wpm: stats.burstWpm,
-            total_errors: stats.totalErrors,
-            time_mode: this.selectedTime,
-            test_duration: this.selectedTime,
-            consistency: stats.consistency,
-          })
+          await apiService.saveTestResult(result)
+          await this.flushPendingResults()
         } catch (error) {
           console.error('Failed to save test result:', error)
+          // Сохраняем результат локально и отправим его пакетом после переподключения
+          // Время прохождения теста: сервер учтет его в дневных и недельных досках
+          const pending = JSON.parse(localStorage.getItem(PENDING_RESULTS_KEY) || '[]')
+          pending.push({ ...result, created_at: new Date().toISOString() })
+          localStorage.setItem(PENDING_RESULTS_KEY, JSON.stringify(pending.slice(-PENDING_RESULTS_LIMIT)))
+        }
+      }
+    },
+
+    // Вызывается после успешного сохранения, при старте приложения и по событию online
+    async flushPendingResults() {
+      if (flushingPendingResults || !useAuthStore().isAuthenticated) return
+      const pending = JSON.parse(localStorage.getItem(PENDING_RESULTS_KEY) || '[]')
+      if (pending.length === 0) return
+      flushingPendingResults = true
+      try {
+        await apiService.saveTestResultsBatch(pending)
+        // Результаты, попавшие в очередь во время отправки, остаются в ней
+        const rest = JSON.parse(localStorage.getItem(PENDING_RESULTS_KEY) || '[]').slice(pending.length)
+        if (rest.length) {
+          localStorage.setItem(PENDING_RESULTS_KEY, JSON.stringify(rest))
+        } else {
+          localStorage.removeItem(PENDING_RESULTS_KEY)
         }
+      } catch (error) {
+        console.error('Failed to flush pending results:', error)
+      } finally {
+        flushingPendingResults = false
       }
     },
 
+    recordKeystroke(code: number) {
+      const now = Date.now()
+      const previous = this.lastKeystrokeTime ?? this.startTime ?? now
+      this.keystrokeDeltas.push(now - previous)
+      this.keystrokeCodes.push(code)
+      this.lastKeystrokeTime = now
+    },
+
     processInput(newValue: string) {
       const oldLength = this.inputValue.length
       const sec = this.startTime ? Math.floor((Date.now() - this.startTime) / 1000) : 0
 
+      if (newValue.endsWith(' ')) {
+        this.recordKeystroke(KEY_SPACE)
+      } else if (newValue.length > oldLength) {
+        this.recordKeystroke(newValue.charCodeAt(newValue.length - 1))
+      } else {
+        for (let i = newValue.length; i < oldLength; i++) this.recordKeystroke(KEY_BACKSPACE)
+      }
+
       if (newValue.endsWith(' ')) {
         const typedWord = this.inputValue.trim()
         const currentWord = this.words[this.currentWordIndex]
@@ -297,6 +379,7 @@ export const useTypingStore = defineStore('typing', {
         if (this.currentWordIndex >= this.words.length) {
           this.currentText = this.generateText()
           this.words = this.currentText.split(' ')
+          this.keystrokeText += ' ' + this.currentText
           this.currentWordIndex = 0
           this.wordHistory = []
         }